@@ -7,38 +7,62 @@ from pathlib import Path
 import boto3
 from aws_cdk import core
 
+from aws_gatk_stack.compute_profiles import HEAD_QUEUE_NAME
 from aws_gatk_stack.compute_substack import NfCompute
 from aws_gatk_stack.docker_substack import DockerStack
 from aws_gatk_stack.iam_substack import IamStack
+from aws_gatk_stack.monitoring_substack import MonitoringStack
 from aws_gatk_stack.storage_substack import StorageStack
 from aws_gatk_stack.vpc_substack import VpcStack
-
-client = boto3.client("sts")
-caller_identity = client.get_caller_identity()
+from aws_gatk_stack.warm_capacity_substack import WarmCapacityStack
 
 log = logging.getLogger("stack")
 log.setLevel(logging.DEBUG)
 
 app = core.App()
 
+# account and region come from the account/region context, then the environment.
+# With -c offline=true nothing is looked up, so synth needs no credentials and
+# context lookups must be served from cdk.context.json
+offline = app.node.try_get_context("offline") in (True, "true")
+account = app.node.try_get_context("account") or os.environ.get("CDK_DEFAULT_ACCOUNT")
+region = (
+    app.node.try_get_context("region")
+    or os.environ.get("AWS_DEFAULT_REGION")
+    or os.environ.get("CDK_DEFAULT_REGION")
+)
+if region is None:
+    raise ValueError("set AWS_DEFAULT_REGION, or pass -c region=<region>")
+if account is None:
+    if offline:
+        raise ValueError("offline synth needs -c account=<account id>")
+    account = boto3.client("sts").get_caller_identity()["Account"]
+
 with open(Path(__file__).parent / "props.json") as f:
     props = json.load(f)
 
 nf_gatk = core.Stack(
     app,
     "nf-gatk",
-    env=core.Environment(
-        account=caller_identity["Account"],
-        region=os.environ["AWS_DEFAULT_REGION"],
-    ),
+    env=core.Environment(account=account, region=region),
 )
 
+# the VPC spreads over the availability zones of the region. Offline, without a
+# committed lookup, the usual <region>a to c zone names stand in for them
+availability_zones = f"availability-zones:account={account}:region={region}"
+if offline and nf_gatk.node.try_get_context(availability_zones) is None:
+    nf_gatk.node.set_context(availability_zones, [f"{region}{x}" for x in "abc"])
+
 vpc_substack = VpcStack(nf_gatk, "vpc-stack", props=props)
 
 docker_substack = DockerStack(nf_gatk, "docker-stack", props=props)
 
 storage_substack = StorageStack(
-    nf_gatk, "storage-stack", vpc=vpc_substack.vpc, props=props
+    nf_gatk,
+    "storage-stack",
+    vpc=vpc_substack.vpc,
+    compute_subnets=vpc_substack.compute_subnets,
+    props=props,
 )
 
 iam_substack = IamStack(
@@ -46,19 +70,61 @@ iam_substack = IamStack(
     "iam-stack",
     work_bucket=storage_substack.work_bucket,
     data_bucket=storage_substack.data_bucket,
+    express_bucket=storage_substack.express_bucket,
 )
 
 compute_substack = NfCompute(
     nf_gatk,
     "compute-stack",
     vpc=vpc_substack.vpc,
+    compute_subnets=vpc_substack.compute_subnets,
+    props=props,
+    security_group=storage_substack.nf_batch_security_group,
     nf_batch_role=iam_substack.nf_batch_role,
     nf_spotfleet_role=iam_substack.nf_spotfleet_role,
     nf_batch_instance_role=iam_substack.nf_batch_instance_role,
+    nf_execution_role=iam_substack.nf_execution_role,
     nf_instance_profile=iam_substack.nf_instance_profile,
-    container_image=docker_substack.container_image,
+    container_images=docker_substack.container_images,
+    image_uris=docker_substack.image_uris,
     work_bucket=storage_substack.work_bucket,
+    ref_bucket=storage_substack.ref_bucket,
+    work_dir=storage_substack.work_dir,
+    work_dir_availability_zone=storage_substack.work_dir_availability_zone,
+    fsx_file_system=storage_substack.fsx_file_system,
+    efs_file_system=storage_substack.efs_file_system,
 )
 
+if props["monitoring"]["enabled"] is True:
+    monitoring_substack = MonitoringStack(
+        nf_gatk,
+        "monitoring-stack",
+        props=props,
+        job_queues={
+            **compute_substack.job_queues,
+            HEAD_QUEUE_NAME: compute_substack.head_queue,
+        },
+        queue_profiles=compute_substack.queue_profiles,
+        host_log_group=compute_substack.host_log_group,
+    )
+
+if props["warm_capacity"]["enabled"] is True:
+    warm_capacity_substack = WarmCapacityStack(
+        nf_gatk,
+        "warm-capacity-stack",
+        props=props,
+        compute_envs=compute_substack.compute_envs,
+        compute_env_queues=compute_substack.compute_env_queues,
+        job_queues=compute_substack.job_queues,
+        compute_profiles=compute_substack.compute_profiles,
+    )
 
-app.synth()
+assembly = app.synth()
+# the manifest is read from the assembly directory, as jsii cannot serialize
+# assembly.manifest
+manifest = json.loads((Path(assembly.directory) / "manifest.json").read_text())
+if offline and manifest.get("missing"):
+    raise ValueError(
+        "offline synth is missing context lookups, synth once with credentials and "
+        "commit cdk.context.json: " + ", ".join(m["key"] for m in manifest["missing"])
+    )
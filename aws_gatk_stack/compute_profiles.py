@@ -0,0 +1,780 @@
+import re
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).parent.parent
+
+# scratch layouts for /var/lib/docker, each with a phases/scratch_<scratch>.sh file
+SCRATCH_TYPES = ("ebs", "nvme")
+# families with NVMe instance store: a d after the generation (m5d, m5dn, c6gd), or
+# the storage optimized i families (i3, i3en, im4gn)
+INSTANCE_STORE_FAMILY_PATTERN = re.compile(
+    r"^([a-z]+[0-9]+[a-z]*d[a-z]*|i[a-z]*[0-9]+[a-z]*)$"
+)
+
+# CPU architectures of the compute profiles and docker stack images, with the
+# docker platform each image is built or mirrored for. Graviton families have a g
+# after the generation (m6g, c6gd, r7gn)
+ARCHITECTURES = ("x86_64", "arm64")
+DOCKER_PLATFORMS = dict(x86_64="linux/amd64", arm64="linux/arm64")
+GRAVITON_FAMILY_PATTERN = re.compile(r"^[a-z]+[0-9]+g[a-z]*$")
+# the AWS CLI bundles of tools/fetch_bootstrap_assets.py are named by uname -m
+AWSCLI_MACHINES = dict(x86_64="x86_64", arm64="aarch64")
+
+# batch compute resource types, by the name used in props.json
+PURCHASE_TYPES = ("spot", "on_demand")
+
+# batch allocation strategies allowed for each purchase type
+ALLOCATION_STRATEGIES = dict(
+    spot=("BEST_FIT", "BEST_FIT_PROGRESSIVE", "SPOT_CAPACITY_OPTIMIZED"),
+    on_demand=("BEST_FIT", "BEST_FIT_PROGRESSIVE"),
+)
+# capacity optimized spot requests draw from the pools least likely to be reclaimed
+DEFAULT_ALLOCATION_STRATEGIES = dict(
+    spot="SPOT_CAPACITY_OPTIMIZED", on_demand="BEST_FIT_PROGRESSIVE"
+)
+
+# EBS volumes attached by the launch templates, overridden per profile in props.json.
+# ebs scratch attaches all three, nvme scratch only needs the root volume
+DEFAULT_VOLUMES = dict(
+    root=dict(size=50, type="gp3", iops=3000, throughput=125),
+    docker=dict(size=75, type="gp3", iops=3000, throughput=125),
+    scratch=dict(size=100, type="gp3", iops=3000, throughput=125),
+)
+VOLUME_TYPES = ("gp2", "gp3", "io1", "io2", "st1")
+
+DEFAULT_SIZES = ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge"]
+
+# images pulled by the launch templates while the hosts boot, by docker stack name.
+# profiles default to the ones of these that the docker stack provides
+DEFAULT_PREWARM_IMAGES = ["gatk", "gotc", "gatk-joint"]
+HEAD_PREWARM_IMAGES = ["nextflow"]
+
+PROFILE_DEFAULTS = dict(
+    architecture="x86_64",
+    scratch="ebs",
+    volumes={},
+    sizes=DEFAULT_SIZES,
+    purchase=list(PURCHASE_TYPES),
+    maxv_cpus=1024,
+    minv_cpus=0,
+    allocation_strategy={},
+    bid_percentage=100,
+)
+HEAD_PROFILE_KEYS = ("scratch", "volumes", "prewarm_images")
+# the head compute environment lets batch choose from the optimal (x86) families
+HEAD_ARCHITECTURE = "x86_64"
+
+# the memory (MiB) Fargate allows for each vCPU value of a head job
+FARGATE_MEMORY = {
+    0.25: [512, 1024, 2048],
+    0.5: list(range(1024, 4097, 1024)),
+    1: list(range(2048, 8193, 1024)),
+    2: list(range(4096, 16385, 1024)),
+    4: list(range(8192, 30721, 1024)),
+}
+
+ECS_AGENT_OPTION_PATTERN = re.compile(r"^ECS_[A-Z0-9_]+$")
+
+# s3 transfer settings of the AWS CLI config written on every host
+TRANSFER_CLIENTS = ("crt", "default")
+S3_TRANSFER_KEYS = (
+    "preferred_transfer_client",
+    "requests_per_vcpu",
+    "requests_per_gbps",
+    "max_concurrent_requests",
+    "multipart_chunksize",
+    "multipart_threshold",
+)
+SIZE_PATTERN = re.compile(r"^[0-9]+(KB|MB|GB)$")
+
+# zone IDs, which S3 Express One Zone directory bucket names are made of
+AVAILABILITY_ZONE_ID_PATTERN = re.compile(r"^[a-z0-9]+-az[0-9]+$")
+# tasks stage their files with the pinned AWS CLI of the hosts, which only knows
+# directory buckets from the late 2023 releases on
+EXPRESS_MIN_AWSCLI_VERSION = (2, 15, 0)
+
+# shared EFS work directory
+EFS_THROUGHPUT_MODES = ("elastic", "bursting", "provisioned")
+EFS_PERFORMANCE_MODES = ("generalPurpose", "maxIO")
+
+# host reference cache, populated from a manifest under one of the reference sources
+REF_CACHE_SOURCES = ("ref_s3_path", "ref_bucket")
+REF_CACHE_KEYS = (
+    "enabled",
+    "source",
+    "manifest",
+    "path",
+    "min_free_gib",
+    "max_size_gib",
+)
+
+# batch attaches at most three compute environments to a queue
+MAX_QUEUE_COMPUTE_ENVIRONMENTS = 3
+DEFAULT_QUEUE_PRIORITIES = dict(spot=1, on_demand=100)
+HEAD_QUEUE_NAME = "on_demand-head"
+
+# compute environments held at a higher minv_cpus by the warm capacity scheduler
+WARM_CAPACITY_KEYS = ("minv_cpus", "windows", "runnable_jobs", "hold_minutes")
+WARM_WINDOW_KEYS = ("days", "start_hour", "end_hour")
+WEEKDAYS = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+
+JOB_PROFILE_KEYS = ("image", "vcpus", "memory_mib", "ulimits", "shared_memory_mib")
+ULIMIT_NAMES = (
+    "core",
+    "cpu",
+    "data",
+    "fsize",
+    "locks",
+    "memlock",
+    "msgqueue",
+    "nice",
+    "nofile",
+    "nproc",
+    "rss",
+    "rtprio",
+    "rttime",
+    "sigpending",
+    "stack",
+)
+
+NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+# docker stack images are built from a directory of this repository, or mirrored
+# into ECR from a pinned upstream reference by tools/mirror_images.py
+DOCKER_IMAGE_MODES = ("build", "mirror")
+MIRROR_REPOSITORY_PREFIX = "nf-mirror"
+IMAGE_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9._-]*$")
+IMAGE_DIGEST_PATTERN = re.compile(r"^sha256:[0-9a-f]{64}$")
+
+
+def validate_volumes(name: str, volumes: Dict) -> Dict[str, Dict]:
+    """
+    Merge the volume settings of a compute profile over the defaults
+    :param name: the name of the compute profile
+    :param volumes: the volumes section of the compute profile
+    :return: the volume settings keyed by volume name (root, docker, scratch)
+    """
+    unknown = set(volumes) - set(DEFAULT_VOLUMES)
+    if unknown:
+        raise ValueError(f"{name}: unknown volumes {sorted(unknown)}")
+
+    merged = {}
+    for volume_name, default in DEFAULT_VOLUMES.items():
+        volume = {**default, **volumes.get(volume_name, {})}
+        unknown = set(volume) - set(default)
+        if unknown:
+            raise ValueError(
+                f"{name}: unknown settings {sorted(unknown)} for volume {volume_name}"
+            )
+        if volume["type"] not in VOLUME_TYPES:
+            raise ValueError(
+                f"{name}: volume {volume_name} has type {volume['type']}, "
+                f"expected one of {VOLUME_TYPES}"
+            )
+        for setting in ("size", "iops", "throughput"):
+            if not isinstance(volume[setting], int) or volume[setting] <= 0:
+                raise ValueError(
+                    f"{name}: {setting} of volume {volume_name} must be a positive int"
+                )
+        merged[volume_name] = volume
+    return merged
+
+
+def validate_scratch(name: str, scratch: str, families: List[str]) -> str:
+    """
+    Check the scratch layout of a compute profile. NVMe scratch needs the instance
+    store of every family, the hosts have nothing to put /var/lib/docker on
+    otherwise
+    :param name: the name of the compute profile
+    :param scratch: the scratch layout
+    :param families: the instance families of the profile
+    :return: the scratch layout
+    """
+    if scratch not in SCRATCH_TYPES:
+        raise ValueError(
+            f"{name}: unknown scratch type {scratch}, expected one of {SCRATCH_TYPES}"
+        )
+    if scratch == "nvme":
+        missing = [x for x in families if not INSTANCE_STORE_FAMILY_PATTERN.match(x)]
+        if missing:
+            raise ValueError(
+                f"{name}: nvme scratch needs instance store families such as m5d, "
+                f"c5d or r5d, {missing} have none"
+            )
+    return scratch
+
+
+def family_architecture(family: str) -> str:
+    """
+    Tell the CPU architecture of an instance family from its name
+    :param family: the instance family (e.g., m5, m6g)
+    :return: arm64 for Graviton families, x86_64 otherwise
+    """
+    return "arm64" if GRAVITON_FAMILY_PATTERN.match(family) else "x86_64"
+
+
+def validate_prewarm_images(
+    name: str, prewarm_images: List[str], images: List[str]
+) -> List[str]:
+    """
+    Check the images pre-pulled by the launch template of a compute profile
+    :param name: the name of the compute profile
+    :param prewarm_images: the names of the images to pre-pull
+    :param images: the names of the images built by the docker stack
+    :return: the names of the images to pre-pull
+    """
+    if not isinstance(prewarm_images, list) or set(prewarm_images) - set(images):
+        raise ValueError(f"{name}: prewarm_images must be a list of {sorted(images)}")
+    return prewarm_images
+
+
+def validate_compute_profile(
+    name: str, profile: Dict, images: Dict[str, List[str]]
+) -> Dict:
+    """
+    Validate a compute profile and fill in the defaults. Families default to the
+    name of the profile, and an empty list of sizes lets batch choose any size of
+    the families. All families must be of the architecture of the profile, as
+    batch picks one AMI for the compute environment.
+    :param name: the name of the compute profile
+    :param profile: the compute profile from props.json
+    :param images: the names of the docker stack images by architecture
+    :return: the compute profile, including its list of instance types
+    """
+    if not NAME_PATTERN.match(name):
+        raise ValueError(
+            f"{name}: profile names must be lower case alphanumeric, '-' or '_'"
+        )
+    unknown = set(profile) - set(PROFILE_DEFAULTS) - {"families", "prewarm_images"}
+    if unknown:
+        raise ValueError(f"{name}: unknown settings {sorted(unknown)}")
+
+    architecture = profile.get("architecture", PROFILE_DEFAULTS["architecture"])
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"{name}: architecture must be one of {ARCHITECTURES}")
+    images = images.get(architecture, [])
+
+    profile = {
+        **PROFILE_DEFAULTS,
+        "families": [name],
+        "prewarm_images": [x for x in DEFAULT_PREWARM_IMAGES if x in images],
+        **profile,
+    }
+    profile["volumes"] = validate_volumes(name, profile["volumes"])
+    validate_prewarm_images(name, profile["prewarm_images"], images)
+
+    for key in ("families", "sizes"):
+        if not isinstance(profile[key], list):
+            raise ValueError(f"{name}: {key} must be a list")
+    if not profile["families"]:
+        raise ValueError(f"{name}: at least one instance family is required")
+    for value in profile["families"] + profile["sizes"]:
+        if not NAME_PATTERN.match(value):
+            raise ValueError(f"{name}: invalid instance family or size {value}")
+    validate_scratch(name, profile["scratch"], profile["families"])
+    mismatched = [
+        x for x in profile["families"] if family_architecture(x) != architecture
+    ]
+    if mismatched:
+        raise ValueError(
+            f"{name}: families {mismatched} are not {architecture}, set the "
+            "architecture of the profile or move them to a profile of their own"
+        )
+
+    if not profile["purchase"] or set(profile["purchase"]) - set(PURCHASE_TYPES):
+        raise ValueError(
+            f"{name}: purchase must be a non empty list of {PURCHASE_TYPES}"
+        )
+
+    for key in ("maxv_cpus", "minv_cpus"):
+        if not isinstance(profile[key], int) or profile[key] < 0:
+            raise ValueError(f"{name}: {key} must be a non negative int")
+    if profile["minv_cpus"] > profile["maxv_cpus"]:
+        raise ValueError(f"{name}: minv_cpus is larger than maxv_cpus")
+
+    profile["allocation_strategy"] = {
+        **DEFAULT_ALLOCATION_STRATEGIES,
+        **profile["allocation_strategy"],
+    }
+    for purchase, strategy in profile["allocation_strategy"].items():
+        if strategy not in ALLOCATION_STRATEGIES.get(purchase, ()):
+            raise ValueError(
+                f"{name}: invalid {purchase} allocation strategy {strategy}, "
+                f"expected one of {ALLOCATION_STRATEGIES.get(purchase, ())}"
+            )
+
+    bid_percentage = profile["bid_percentage"]
+    if not isinstance(bid_percentage, int) or not 0 < bid_percentage <= 100:
+        raise ValueError(f"{name}: bid_percentage must be an int from 1 to 100")
+
+    if profile["sizes"]:
+        profile["instance_types"] = [
+            f"{family}.{size}"
+            for family in profile["families"]
+            for size in profile["sizes"]
+        ]
+    else:
+        profile["instance_types"] = list(profile["families"])
+    return profile
+
+
+def load_compute_profiles(props: Dict, images: Dict[str, List[str]]) -> Dict[str, Dict]:
+    """
+    Validate all compute profiles in the props dictionary
+    :param props: the props dictionary
+    :param images: the names of the docker stack images by architecture
+    :return: the validated compute profiles keyed by name
+    """
+    profiles = props["compute_profiles"]
+    if not profiles:
+        raise ValueError("at least one compute profile is required")
+    return {k: validate_compute_profile(k, v, images) for k, v in profiles.items()}
+
+
+def load_head_profile(props: Dict, images: Dict[str, List[str]]) -> Dict:
+    """
+    Validate the profile of the nextflow head compute environment, which only
+    configures the launch template
+    :param props: the props dictionary
+    :param images: the names of the docker stack images by architecture
+    :return: the validated head profile
+    """
+    profile = props["head_profile"]
+    unknown = set(profile) - set(HEAD_PROFILE_KEYS)
+    if unknown:
+        raise ValueError(f"head: unknown settings {sorted(unknown)}")
+    # batch chooses the head instances from the optimal families
+    scratch = validate_scratch("head", profile.get("scratch", "ebs"), ["optimal"])
+    volumes = validate_volumes("head", profile.get("volumes", {}))
+    prewarm_images = validate_prewarm_images(
+        "head",
+        profile.get("prewarm_images", HEAD_PREWARM_IMAGES),
+        images[HEAD_ARCHITECTURE],
+    )
+    return dict(
+        architecture=HEAD_ARCHITECTURE,
+        scratch=scratch,
+        volumes=volumes,
+        prewarm_images=prewarm_images,
+    )
+
+
+def load_head_fargate_config(
+    props: Dict, images: Dict[str, List[str]], queues: Dict[str, Dict]
+) -> Dict:
+    """
+    Validate the Fargate settings of the nextflow head queue. Nextflow registers
+    EC2 job definitions for its tasks, so the tasks without a queue label go to
+    default_queue instead of the head queue
+    :param props: the props dictionary
+    :param images: the names of the docker stack images by architecture
+    :param queues: the validated job queues
+    :return: the Fargate settings
+    """
+    config = {"architecture": "x86_64", **props["head_fargate"]}
+    if config["enabled"] is not True:
+        return config
+    if "nextflow" not in images.get(config["architecture"], []):
+        raise ValueError(
+            f"head_fargate: architecture must be one of {ARCHITECTURES} that the "
+            "nextflow image is built for"
+        )
+    vcpus, memory_mib = config["vcpus"], config["memory_mib"]
+    if memory_mib not in FARGATE_MEMORY.get(vcpus, []):
+        raise ValueError(
+            f"head_fargate: {vcpus} vcpus with {memory_mib} MiB is not a Fargate "
+            f"size, see {FARGATE_MEMORY}"
+        )
+    if not isinstance(config["maxv_cpus"], int) or config["maxv_cpus"] < vcpus:
+        raise ValueError("head_fargate: maxv_cpus must fit at least one head job")
+    if config.get("default_queue") not in queues:
+        raise ValueError(
+            f"head_fargate: default_queue must be one of the job queues {sorted(queues)}"
+        )
+    return config
+
+
+def load_ecs_agent_config(props: Dict) -> Dict[str, str]:
+    """
+    Validate the ECS agent options written to /etc/ecs/ecs.config of every host
+    :param props: the props dictionary
+    :return: the agent options keyed by variable name
+    """
+    config = props["ecs_agent"]
+    for option, value in config.items():
+        if not ECS_AGENT_OPTION_PATTERN.match(option) or not isinstance(value, str):
+            raise ValueError(
+                f"ecs_agent: {option} must be an ECS_* variable with a string value"
+            )
+    return config
+
+
+def load_s3_transfer_config(props: Dict) -> Dict:
+    """
+    Validate the s3 transfer settings of the AWS CLI used by the job containers
+    :param props: the props dictionary
+    :return: the s3 transfer settings
+    """
+    config = props["s3_transfer"]
+    unknown = set(config) - set(S3_TRANSFER_KEYS)
+    missing = set(S3_TRANSFER_KEYS) - set(config)
+    if unknown or missing:
+        raise ValueError(
+            f"s3_transfer: unknown keys {sorted(unknown)}, missing keys "
+            f"{sorted(missing)}"
+        )
+    if config["preferred_transfer_client"] not in TRANSFER_CLIENTS:
+        raise ValueError(
+            f"s3_transfer: preferred_transfer_client must be one of {TRANSFER_CLIENTS}"
+        )
+    for key in ("requests_per_vcpu", "requests_per_gbps", "max_concurrent_requests"):
+        if not isinstance(config[key], int) or config[key] < 1:
+            raise ValueError(f"s3_transfer: {key} must be a positive integer")
+    for key in ("multipart_chunksize", "multipart_threshold"):
+        if not SIZE_PATTERN.match(str(config[key])):
+            raise ValueError(f"s3_transfer: {key} must be a size such as 64MB")
+    return config
+
+
+def load_ref_cache_config(props: Dict) -> Dict:
+    """
+    Validate the host reference cache settings
+    :param props: the props dictionary
+    :return: the reference cache settings
+    """
+    config = props["ref_cache"]
+    unknown = set(config) - set(REF_CACHE_KEYS)
+    missing = set(REF_CACHE_KEYS) - set(config)
+    if unknown or missing:
+        raise ValueError(
+            f"ref_cache: unknown keys {sorted(unknown)}, missing keys "
+            f"{sorted(missing)}"
+        )
+    if config["source"] not in REF_CACHE_SOURCES:
+        raise ValueError(f"ref_cache: source must be one of {REF_CACHE_SOURCES}")
+    if config["source"] == "ref_s3_path" and not props["ref_s3_path"].startswith(
+        "s3://"
+    ):
+        raise ValueError("ref_cache: ref_s3_path must be an s3:// URI")
+    if not config["manifest"] or config["manifest"].startswith("/"):
+        raise ValueError("ref_cache: manifest must be a key relative to the source")
+    if not config["path"].startswith("/"):
+        raise ValueError("ref_cache: path must be an absolute host path")
+    for key in ("min_free_gib", "max_size_gib"):
+        if not isinstance(config[key], int) or config[key] < 1:
+            raise ValueError(f"ref_cache: {key} must be a positive integer")
+    return config
+
+
+def load_work_dir_config(props: Dict) -> Dict:
+    """
+    Validate the nextflow work directory settings. An S3 Express One Zone directory
+    bucket needs the availability zone the compute environments are pinned to, by
+    name, and its zone ID, which the bucket name is made of, and an AWS CLI pin
+    that can write to it
+    :param props: the props dictionary
+    :return: the work directory settings
+    """
+    config = props["work_dir"]
+    for key in ("expiration_days", "abort_multipart_days"):
+        if not isinstance(config[key], int) or config[key] < 1:
+            raise ValueError(f"work_dir: {key} must be a positive integer")
+    if config["express_one_zone"] is True:
+        if not config["availability_zone"]:
+            raise ValueError("work_dir: express_one_zone needs an availability_zone")
+        if not AVAILABILITY_ZONE_ID_PATTERN.match(config["availability_zone_id"]):
+            raise ValueError(
+                "work_dir: express_one_zone needs an availability_zone_id such as "
+                "use1-az4"
+            )
+        awscli_version = props["bootstrap"]["awscli_version"]
+        version = tuple(int(x) for x in awscli_version.split("."))
+        if version < EXPRESS_MIN_AWSCLI_VERSION:
+            raise ValueError(
+                f"work_dir: express_one_zone needs bootstrap.awscli_version "
+                f"{'.'.join(map(str, EXPRESS_MIN_AWSCLI_VERSION))} or later, the "
+                f"tasks cannot stage files to the directory bucket with {awscli_version}"
+            )
+    return config
+
+
+def load_efs_config(props: Dict) -> Dict:
+    """
+    Validate the settings of the EFS filesystem used as nextflow work directory
+    :param props: the props dictionary
+    :return: the EFS settings
+    """
+    config = props["efs"]
+    if config["enabled"] is not True:
+        return config
+    if props["work_dir"]["express_one_zone"] is True:
+        raise ValueError("efs: cannot be enabled with work_dir.express_one_zone")
+    if config["throughput_mode"] not in EFS_THROUGHPUT_MODES:
+        raise ValueError(f"efs: throughput_mode must be one of {EFS_THROUGHPUT_MODES}")
+    if config["performance_mode"] not in EFS_PERFORMANCE_MODES:
+        raise ValueError(
+            f"efs: performance_mode must be one of {EFS_PERFORMANCE_MODES}"
+        )
+    if config["throughput_mode"] == "provisioned" and (
+        not isinstance(config["provisioned_throughput_mibps"], int)
+        or config["provisioned_throughput_mibps"] < 1
+    ):
+        raise ValueError(
+            "efs: provisioned throughput needs a positive provisioned_throughput_mibps"
+        )
+    if config["performance_mode"] == "maxIO" and config["throughput_mode"] == "elastic":
+        raise ValueError("efs: elastic throughput needs generalPurpose performance")
+    if not config["mount_path"].startswith("/"):
+        raise ValueError("efs: mount_path must be an absolute host path")
+    return config
+
+
+def parse_image_reference(source: str) -> Dict[str, str]:
+    """
+    Split an upstream image reference such as broadinstitute/gatk:4.1.8.0@sha256:...
+    :param source: the image reference
+    :return: the repository, tag and digest (empty when not pinned) of the image
+    """
+    reference, _, digest = source.partition("@")
+    repository, tag = reference, ""
+    if ":" in reference.rsplit("/", 1)[-1]:
+        repository, _, tag = reference.rpartition(":")
+    return dict(repository=repository, tag=tag, digest=digest)
+
+
+def load_docker_images(props: Dict) -> Dict[str, Dict]:
+    """
+    Validate the images provided by the docker stack. Images that are not listed
+    are neither built nor mirrored. The nextflow image carries the head job
+    entrypoint, so it is always built.
+    :param props: the props dictionary
+    :return: the validated images keyed by name
+    """
+    images = props["docker_images"]
+    if images.get("nextflow", {}).get("mode") != "build":
+        raise ValueError("docker_images: the nextflow image must be built")
+
+    for name, image in images.items():
+        if not IMAGE_NAME_PATTERN.match(name):
+            raise ValueError(
+                f"image {name}: names must be lower case alphanumeric, '.', '-' or '_'"
+            )
+        mode = image.get("mode")
+        if mode not in DOCKER_IMAGE_MODES:
+            raise ValueError(f"image {name}: mode must be one of {DOCKER_IMAGE_MODES}")
+        if mode == "build":
+            unknown = set(image) - {"mode", "directory", "architectures"}
+            directory = image.get("directory", "")
+            if not (ROOT / directory / "Dockerfile").is_file():
+                raise ValueError(f"image {name}: {directory}/Dockerfile not found")
+        else:
+            unknown = set(image) - {"mode", "source", "architectures"}
+            reference = parse_image_reference(image.get("source", ""))
+            if not reference["tag"] or not IMAGE_DIGEST_PATTERN.match(
+                reference["digest"]
+            ):
+                raise ValueError(
+                    f"image {name}: source must be an image reference with a tag, "
+                    "pinned with @sha256:<digest>"
+                )
+        if unknown:
+            raise ValueError(f"image {name}: unknown settings {sorted(unknown)}")
+        architectures = image.setdefault("architectures", ["x86_64"])
+        if not architectures or set(architectures) - set(ARCHITECTURES):
+            raise ValueError(
+                f"image {name}: architectures must be a non empty list of "
+                f"{ARCHITECTURES}"
+            )
+    if HEAD_ARCHITECTURE not in images["nextflow"]["architectures"]:
+        raise ValueError(
+            f"docker_images: the nextflow image must be built for {HEAD_ARCHITECTURE}"
+        )
+    return images
+
+
+def digest_tag(digest: str) -> str:
+    """
+    The ECR tag of a mirrored image pinned by digest, as ':' is not allowed in tags
+    :param digest: the digest, sha256:<hex>
+    :return: the tag, sha256-<hex>
+    """
+    return digest.replace(":", "-")
+
+
+def mirror_tag(tag: str, architecture: str) -> str:
+    """
+    The tag of a mirrored image in its ECR repository. x86_64 images keep the
+    upstream tag, the other architectures get it suffixed, e.g. 4.5.0.0-arm64
+    :param tag: the upstream tag, or the digest tag of a pinned reference
+    :param architecture: the architecture of the mirrored image
+    :return: the ECR tag
+    """
+    return tag if architecture == "x86_64" else f"{tag}-{architecture}"
+
+
+def load_job_queues(props: Dict, profiles: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Validate the job queues in the props dictionary. A queue attaches compute
+    environments, named <profile>-<purchase>, in the order they are listed, so jobs
+    spill over to the next environment when the first one is out of capacity.
+    Without job_queues, every compute environment gets a queue of its own.
+    :param props: the props dictionary
+    :param profiles: the validated compute profiles
+    :return: the validated job queues keyed by name
+    """
+    queues = props["job_queues"]
+    if not queues:
+        return {
+            f"{purchase}-{name}": dict(
+                priority=DEFAULT_QUEUE_PRIORITIES[purchase],
+                compute_environments=[f"{name}-{purchase}"],
+            )
+            for name, profile in profiles.items()
+            for purchase in profile["purchase"]
+        }
+
+    environments = {
+        f"{name}-{purchase}"
+        for name, profile in profiles.items()
+        for purchase in profile["purchase"]
+    }
+    for name, queue in queues.items():
+        if not NAME_PATTERN.match(name) or name == HEAD_QUEUE_NAME:
+            raise ValueError(
+                f"queue {name}: queue names must be lower case alphanumeric, '-' or "
+                f"'_', and {HEAD_QUEUE_NAME} is reserved"
+            )
+        unknown = set(queue) - {"priority", "compute_environments"}
+        if unknown:
+            raise ValueError(f"queue {name}: unknown settings {sorted(unknown)}")
+        priority = queue.get("priority")
+        if not isinstance(priority, int) or not 0 <= priority <= 1000:
+            raise ValueError(f"queue {name}: priority must be an int from 0 to 1000")
+        ces = queue.get("compute_environments", [])
+        count = len(set(ces))
+        if count != len(ces) or not 0 < count <= MAX_QUEUE_COMPUTE_ENVIRONMENTS:
+            raise ValueError(
+                f"queue {name}: a queue needs 1 to {MAX_QUEUE_COMPUTE_ENVIRONMENTS} "
+                "distinct compute environments"
+            )
+        missing = set(ces) - environments
+        if missing:
+            raise ValueError(
+                f"queue {name}: unknown compute environments {sorted(missing)}"
+            )
+        # jobs land on any environment of the queue, so their image must run there
+        architectures = {profiles[x.rsplit("-", 1)[0]]["architecture"] for x in ces}
+        if len(architectures) > 1:
+            raise ValueError(
+                f"queue {name}: compute environments of different architectures "
+                f"{sorted(architectures)}"
+            )
+    return queues
+
+
+def load_warm_capacity_config(props: Dict, profiles: Dict[str, Dict]) -> Dict:
+    """
+    Validate the warm capacity of the compute environments, named
+    <profile>-<purchase>. minv_cpus is held during the windows, in UTC, and for
+    hold_minutes after their queues had at least runnable_jobs RUNNABLE jobs (0
+    turns queue depth off)
+    :param props: the props dictionary
+    :param profiles: the validated compute profiles
+    :return: the warm capacity settings
+    """
+    config = props["warm_capacity"]
+    if config["enabled"] is not True:
+        return config
+    missing = {"interval_minutes", "compute_environments"} - set(config)
+    if missing:
+        raise ValueError(f"warm_capacity: missing keys {sorted(missing)}")
+    interval = config["interval_minutes"]
+    if not isinstance(interval, int) or interval < 1:
+        raise ValueError("warm_capacity: interval_minutes must be a positive integer")
+    for name, warm in config["compute_environments"].items():
+        profile_name, _, purchase = name.rpartition("-")
+        profile = profiles.get(profile_name)
+        if profile is None or purchase not in profile["purchase"]:
+            raise ValueError(f"warm_capacity: unknown compute environment {name}")
+        unknown = set(warm) - set(WARM_CAPACITY_KEYS)
+        if unknown:
+            raise ValueError(
+                f"warm_capacity {name}: unknown settings {sorted(unknown)}"
+            )
+        if "minv_cpus" not in warm:
+            raise ValueError(f"warm_capacity {name}: missing keys ['minv_cpus']")
+        if not isinstance(warm["minv_cpus"], int):
+            raise ValueError(f"warm_capacity {name}: minv_cpus must be an integer")
+        if not profile["minv_cpus"] < warm["minv_cpus"] <= profile["maxv_cpus"]:
+            raise ValueError(
+                f"warm_capacity {name}: minv_cpus must be above the profile's "
+                "minv_cpus and at most its maxv_cpus"
+            )
+        if not isinstance(warm.get("windows", []), list):
+            raise ValueError(f"warm_capacity {name}: windows must be a list")
+        for index, window in enumerate(warm.get("windows", [])):
+            unknown = set(window) - set(WARM_WINDOW_KEYS)
+            missing = set(WARM_WINDOW_KEYS) - set(window)
+            if unknown or missing:
+                raise ValueError(
+                    f"warm_capacity {name}: window {index} has unknown keys "
+                    f"{sorted(unknown)}, missing keys {sorted(missing)}"
+                )
+            if set(window["days"]) - set(WEEKDAYS) or not (
+                0 <= window["start_hour"] < window["end_hour"] <= 24
+            ):
+                raise ValueError(
+                    f"warm_capacity {name}: windows need days of {WEEKDAYS} and "
+                    "0 <= start_hour < end_hour <= 24"
+                )
+        if warm.get("runnable_jobs", 0) < 0 or warm.get("hold_minutes", 0) < 0:
+            raise ValueError(
+                f"warm_capacity {name}: runnable_jobs and hold_minutes must not be "
+                "negative"
+            )
+    return config
+
+
+def load_job_profiles(props: Dict, images: Dict[str, List[str]]) -> Dict[str, Dict]:
+    """
+    Validate the job definition profiles of the individual workflow tools, which
+    size the container of each tool. A tool gets a job definition for every
+    architecture its image is provided for
+    :param props: the props dictionary
+    :param images: the names of the docker stack images by architecture
+    :return: the validated job profiles keyed by name, with their architectures
+    """
+    names = sorted({x for names in images.values() for x in names})
+    profiles = {}
+    for name, profile in props["job_profiles"].items():
+        if not NAME_PATTERN.match(name):
+            raise ValueError(
+                f"job profile {name}: names must be lower case alphanumeric, '-' or '_'"
+            )
+        unknown = set(profile) - set(JOB_PROFILE_KEYS)
+        if unknown:
+            raise ValueError(f"job profile {name}: unknown settings {sorted(unknown)}")
+        profile = {"ulimits": {}, "shared_memory_mib": 0, **profile}
+        if profile.get("image") not in names:
+            raise ValueError(f"job profile {name}: image must be one of {names}")
+        profile["architectures"] = [
+            x for x in ARCHITECTURES if profile["image"] in images.get(x, [])
+        ]
+        for key in ("vcpus", "memory_mib"):
+            if not isinstance(profile.get(key), int) or profile[key] <= 0:
+                raise ValueError(f"job profile {name}: {key} must be a positive int")
+        shared_memory_mib = profile["shared_memory_mib"]
+        if not isinstance(shared_memory_mib, int) or shared_memory_mib < 0:
+            raise ValueError(
+                f"job profile {name}: shared_memory_mib must be a non negative int"
+            )
+        if shared_memory_mib >= profile["memory_mib"]:
+            raise ValueError(
+                f"job profile {name}: shared_memory_mib must be less than memory_mib"
+            )
+        unknown = set(profile["ulimits"]) - set(ULIMIT_NAMES)
+        if unknown:
+            raise ValueError(f"job profile {name}: unknown ulimits {sorted(unknown)}")
+        profiles[name] = profile
+    return profiles
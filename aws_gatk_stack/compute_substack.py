@@ -1,15 +1,48 @@
-import base64
+import json
+import tempfile
 from pathlib import Path
-from typing import Dict, List
+from string import Template
+from typing import Dict, List, Optional, Union
 
 from aws_cdk import aws_batch as batch
 from aws_cdk import aws_cloudformation as cfn
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_efs as efs
+from aws_cdk import aws_fsx as fsx
 from aws_cdk import aws_iam as iam
+from aws_cdk import aws_logs as logs
 from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_s3_assets as s3_assets
 from aws_cdk import core
 
+from aws_gatk_stack.compute_profiles import (
+    AWSCLI_MACHINES,
+    HEAD_ARCHITECTURE,
+    HEAD_QUEUE_NAME,
+    load_compute_profiles,
+    load_ecs_agent_config,
+    load_head_fargate_config,
+    load_head_profile,
+    load_job_profiles,
+    load_job_queues,
+    load_ref_cache_config,
+    load_s3_transfer_config,
+)
+
+USER_DATA_DIR = Path(__file__).parent.parent / "launch_template"
+MIME_BOUNDARY = "--==BOUNDARY=="
+
+# block devices of the volumes in compute_profiles.DEFAULT_VOLUMES
+VOLUME_DEVICES = dict(root="/dev/xvda", docker="/dev/xvdcz", scratch="/dev/sdc")
+
+# metrics and logs published by the CloudWatch agent of the batch hosts
+HOST_METRICS_NAMESPACE = "NfGatk/Hosts"
+HOST_LOG_GROUP_NAME = "/nf-gatk/batch-hosts"
+
+# the instance sized AWS CLI config written by the configure_awscli phase
+AWS_CLI_CONFIG_PATH = "/opt/aws-cli/config"
+
 
 class NfCompute(cfn.NestedStack):
     def __init__(
@@ -18,105 +51,549 @@ class NfCompute(cfn.NestedStack):
         id: str,
         *,
         vpc: ec2.Vpc,
+        compute_subnets: ec2.SubnetSelection,
+        props: Dict,
+        security_group: ec2.SecurityGroup,
         nf_batch_role: iam.Role,
         nf_spotfleet_role: iam.Role,
         nf_batch_instance_role: iam.Role,
+        nf_execution_role: iam.Role,
         nf_instance_profile: iam.CfnInstanceProfile,
-        container_image: ecs.ContainerImage,
+        container_images: Dict[str, Dict[str, ecs.ContainerImage]],
+        image_uris: Dict[str, Dict[str, str]],
         work_bucket: s3.Bucket,
+        ref_bucket: s3.Bucket,
+        work_dir: str,
+        work_dir_availability_zone: Optional[str] = None,
+        fsx_file_system: Optional[fsx.LustreFileSystem] = None,
+        efs_file_system: Optional[efs.FileSystem] = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
-        user_data = self.create_user_data()
+        container_image = container_images[HEAD_ARCHITECTURE]["nextflow"]
+        self.image_uris = image_uris
+        self.security_group = security_group
+        self.compute_subnets = compute_subnets
+        if work_dir_availability_zone is not None:
+            # next to the S3 Express One Zone directory bucket of the work directory
+            self.compute_subnets = ec2.SubnetSelection(
+                subnet_type=compute_subnets.subnet_type,
+                availability_zones=[work_dir_availability_zone],
+            )
+        self.work_dir = work_dir
+        self.retry_strategy = props["retry_strategy"]
+
+        # host directories that are mounted into every job container
+        self.host_mounts = [
+            dict(
+                name="aws-cli",
+                source_path="/opt/aws-cli",
+                container_path="/opt/aws-cli",
+                read_only=True,
+            ),
+            dict(
+                name="aws-cli-config",
+                source_path=AWS_CLI_CONFIG_PATH,
+                container_path="/root/.aws/config",
+                read_only=True,
+            ),
+        ]
 
-        nf_ebs_launch_template = self.create_launch_template(user_data)
+        # host paths nextflow mounts into the containers of the tasks it submits,
+        # next to the directory of aws.batch.cliPath
+        self.task_volumes = [f"{AWS_CLI_CONFIG_PATH}:/root/.aws/config:ro"]
 
-        self.create_head_compute_env(
-            vpc=vpc,
-            instance_profile=nf_instance_profile,
-            spotfleet_role=nf_spotfleet_role,
-            launch_template=nf_ebs_launch_template,
-            compute_resource_type=batch.ComputeResourceType.ON_DEMAND,
-            instance_types=[ec2.InstanceType("optimal")],
-            ce_id="nf_head_env",
-            service_role=nf_batch_role,
-            batch_instance_role=nf_batch_instance_role,
-            work_bucket=work_bucket,
-            container_image=container_image,
+        # optional bootstrap phases run after the scratch setup, and the values for
+        # the $NAME placeholders in the user data files
+        self.host_phases = []
+        s3_transfer = load_s3_transfer_config(props)
+        self.user_data_substitutions = dict(
+            AWS_REGION=self.region,
+            ECS_AGENT_CONFIG="\n".join(
+                f"{k}={v}" for k, v in load_ecs_agent_config(props).items()
+            ),
+            S3_TRANSFER_CLIENT=s3_transfer["preferred_transfer_client"],
+            S3_REQUESTS_PER_VCPU=str(s3_transfer["requests_per_vcpu"]),
+            S3_REQUESTS_PER_GBPS=str(s3_transfer["requests_per_gbps"]),
+            S3_MAX_CONCURRENT_REQUESTS=str(s3_transfer["max_concurrent_requests"]),
+            S3_MULTIPART_CHUNKSIZE=s3_transfer["multipart_chunksize"],
+            S3_MULTIPART_THRESHOLD=s3_transfer["multipart_threshold"],
+        )
+
+        # hosts install the AWS CLI bundle of their architecture
+        image_names = {k: list(v) for k, v in container_images.items()}
+        self.compute_profiles = load_compute_profiles(props, image_names)
+        job_queues = load_job_queues(props, self.compute_profiles)
+        head_fargate = load_head_fargate_config(props, image_names, job_queues)
+        host_architectures = {x["architecture"] for x in self.compute_profiles.values()}
+        if head_fargate["enabled"] is not True:
+            host_architectures.add(HEAD_ARCHITECTURE)
+        self.create_bootstrap_assets(props["bootstrap"], sorted(host_architectures))
+
+        if fsx_file_system is not None:
+            fsx_mount_path = props["fsx"]["mount_path"]
+            self.host_phases.append("mount_fsx")
+            self.user_data_substitutions.update(
+                FSX_DNS_NAME=fsx_file_system.dns_name,
+                FSX_MOUNT_NAME=fsx_file_system.mount_name,
+                FSX_MOUNT_PATH=fsx_mount_path,
+            )
+            self.host_mounts.append(
+                dict(
+                    name="fsx",
+                    source_path=fsx_mount_path,
+                    container_path=fsx_mount_path,
+                    read_only=True,
+                )
+            )
+            self.task_volumes.append(f"{fsx_mount_path}:{fsx_mount_path}:ro")
+
+        # the shared work directory is read and written in place by every task
+        self.efs_mount = None
+        if efs_file_system is not None:
+            efs_mount_path = props["efs"]["mount_path"]
+            self.host_phases.append("mount_efs")
+            self.user_data_substitutions.update(
+                EFS_FILE_SYSTEM_ID=efs_file_system.file_system_id,
+                EFS_MOUNT_PATH=efs_mount_path,
+            )
+            self.host_mounts.append(
+                dict(
+                    name="efs",
+                    source_path=efs_mount_path,
+                    container_path=efs_mount_path,
+                    read_only=False,
+                )
+            )
+            self.task_volumes.append(efs_mount_path)
+            self.efs_mount = dict(
+                file_system_id=efs_file_system.file_system_id, path=efs_mount_path
+            )
+
+        # reference files listed in the manifest are downloaded once per host, and
+        # shared read-only by every job container
+        ref_cache = load_ref_cache_config(props)
+        if ref_cache["enabled"] is True:
+            ref_source = props["ref_s3_path"]
+            if ref_cache["source"] == "ref_bucket":
+                ref_source = ref_bucket.s3_url_for_object()
+            self.host_phases.append("ref_cache")
+            self.user_data_substitutions.update(
+                REF_CACHE_PATH=ref_cache["path"],
+                REF_CACHE_SOURCE=f"{ref_source.rstrip('/')}/",
+                REF_CACHE_MANIFEST=ref_cache["manifest"],
+                REF_CACHE_MIN_FREE_GIB=str(ref_cache["min_free_gib"]),
+                REF_CACHE_MAX_SIZE_GIB=str(ref_cache["max_size_gib"]),
+            )
+            self.host_mounts.append(
+                dict(
+                    name="ref-cache",
+                    source_path=ref_cache["path"],
+                    container_path=ref_cache["path"],
+                    read_only=True,
+                )
+            )
+            self.task_volumes.append(f"{ref_cache['path']}:{ref_cache['path']}:ro")
+
+        # the CloudWatch agent publishes memory and disk usage per compute profile,
+        # and ships the bootstrap and amazon-ebs-autoscale logs
+        self.host_log_group = None
+        if props["monitoring"]["enabled"] is True:
+            self.host_phases.append("install_cwagent")
+            self.host_log_group = logs.LogGroup(
+                self,
+                "nf-host-logs",
+                log_group_name=HOST_LOG_GROUP_NAME,
+                retention=logs.RetentionDays.ONE_MONTH,
+            )
+
+        # host directories that are only mounted into the nextflow head jobs
+        project_cache_path = props["nextflow"]["project_cache_path"]
+        self.head_mounts = [
+            dict(
+                name="project-cache",
+                source_path=project_cache_path,
+                container_path=project_cache_path,
+                read_only=False,
+            ),
+        ]
+
+        # tuning of the nextflow head jobs, turned into nextflow.config options by
+        # docker/nextflow.aws.sh
+        nextflow_props = props["nextflow"]
+        self.nextflow_environment = dict(
+            NF_QUEUE_SIZE=str(nextflow_props["queue_size"]),
+            NF_SUBMIT_RATE_LIMIT=nextflow_props["submit_rate_limit"],
+            NF_POLL_INTERVAL=nextflow_props["poll_interval"],
+            NF_MAX_PARALLEL_TRANSFERS=str(nextflow_props["max_parallel_transfers"]),
+            NF_MAX_CONNECTIONS=str(nextflow_props["max_connections"]),
+            NF_UPLOAD_CHUNK_SIZE=nextflow_props["upload_chunk_size"],
+            NF_UPLOAD_MAX_THREADS=str(nextflow_props["upload_max_threads"]),
+            NF_MAX_SPOT_ATTEMPTS=str(self.retry_strategy["attempts"]),
+            NF_CACHE_RETAIN=str(nextflow_props["cache_retain"]),
+            NF_PROJECT_CACHE=project_cache_path,
+            NF_BATCH_VOLUMES=",".join(self.task_volumes),
         )
 
-        for instance_class in ["m5", "c5", "r5"]:
-            self.create_compute_envs(
+        self.compute_envs = compute_envs = {}
+        for instance_class, profile in self.compute_profiles.items():
+            envs = self.create_compute_envs(
                 instance_class=instance_class,
+                profile=profile,
                 vpc=vpc,
                 instance_profile=nf_instance_profile,
                 spotfleet_role=nf_spotfleet_role,
-                launch_template=nf_ebs_launch_template,
+                service_role=nf_batch_role,
+            )
+            compute_envs.update({f"{instance_class}-{k}": v for k, v in envs.items()})
+
+        # all queues exist before the job definitions, as every head job maps
+        # process labels to them
+        self.job_queues = {}
+        self.queue_profiles = {HEAD_QUEUE_NAME: ["head"]}
+        self.compute_env_queues = {name: [] for name in compute_envs}
+        for name, queue in job_queues.items():
+            self.queue_profiles[name] = sorted(
+                {x.rsplit("-", 1)[0] for x in queue["compute_environments"]}
+            )
+            for ce_name in queue["compute_environments"]:
+                self.compute_env_queues[ce_name].append(name)
+            self.job_queues[name] = self.create_queue(
+                name=name,
+                priority=queue["priority"],
+                compute_environments=[
+                    compute_envs[x] for x in queue["compute_environments"]
+                ],
+            )
+
+        # head jobs on Fargate start without waiting for an instance to boot
+        if head_fargate["enabled"] is True:
+            self.queue_profiles[HEAD_QUEUE_NAME] = []
+            self.create_head_fargate_env(
+                ce_id="nf_head_fargate_env",
+                vpc=vpc,
+                fargate=head_fargate,
                 service_role=nf_batch_role,
                 batch_instance_role=nf_batch_instance_role,
+                execution_role=nf_execution_role,
+                work_bucket=work_bucket,
+                default_queue=self.job_queues[head_fargate["default_queue"]],
+            )
+        else:
+            self.create_head_compute_env(
+                vpc=vpc,
+                instance_profile=nf_instance_profile,
+                spotfleet_role=nf_spotfleet_role,
+                launch_template=self.create_launch_template(
+                    name="head", profile=load_head_profile(props, image_names)
+                ),
+                compute_resource_type=batch.ComputeResourceType.ON_DEMAND,
+                instance_types=[ec2.InstanceType("optimal")],
+                ce_id="nf_head_env",
+                service_role=nf_batch_role,
+                batch_instance_role=nf_batch_instance_role,
+                work_bucket=work_bucket,
+                container_image=container_image,
+            )
+
+        for name, jq in self.job_queues.items():
+            self.create_job_definition(
+                name=name,
+                job_queue=jq,
                 container_image=container_image,
                 work_bucket=work_bucket,
+                batch_instance_role=nf_batch_instance_role,
+            )
+
+        # tools get a job definition for each architecture of the compute profiles
+        # that their image is provided for, suffixed with it unless it is x86_64
+        # (e.g., NfHaplotypeCallerReleaseArm64Job)
+        profile_architectures = {
+            x["architecture"] for x in self.compute_profiles.values()
+        }
+        for name, profile in load_job_profiles(props, image_names).items():
+            for architecture in profile["architectures"]:
+                if architecture not in profile_architectures:
+                    continue
+                self.create_tool_job_definition(
+                    name=name if architecture == "x86_64" else f"{name}-{architecture}",
+                    profile=profile,
+                    container_image=container_images[architecture][profile["image"]],
+                    batch_instance_role=nf_batch_instance_role,
+                )
+
+    def create_bootstrap_assets(
+        self, bootstrap_props: Dict, architectures: List[str]
+    ) -> None:
+        """
+        Ship the pinned AWS CLI bundles and amazon-ebs-autoscale release as S3
+        assets, so hosts fetch them through the S3 gateway endpoint instead of the
+        internet. The files are downloaded by tools/fetch_bootstrap_assets.py. An
+        offline synth stands in placeholders for missing downloads, so its
+        templates can be inspected but not deployed
+        :param bootstrap_props: the bootstrap section of the props dictionary
+        :param architectures: the architectures of the batch hosts
+        :return:
+        """
+        asset_dir = USER_DATA_DIR / "assets"
+        awscli_version = bootstrap_props["awscli_version"]
+        ebs_autoscale_version = bootstrap_props["ebs_autoscale_version"]
+        awscli_paths = {
+            x: asset_dir / f"awscli-exe-linux-{AWSCLI_MACHINES[x]}-{awscli_version}.zip"
+            for x in architectures
+        }
+        ebs_autoscale_path = asset_dir / f"amazon-ebs-autoscale-{ebs_autoscale_version}"
+        missing = [
+            x for x in [*awscli_paths.values(), ebs_autoscale_path] if not x.exists()
+        ]
+        if missing and self.node.try_get_context("offline") not in (True, "true"):
+            raise FileNotFoundError(
+                f"{missing[0]} not found, run tools/fetch_bootstrap_assets.py"
+            )
+        if missing:
+            placeholders = self.stage_placeholder_assets(missing)
+            awscli_paths = {x: placeholders.get(p, p) for x, p in awscli_paths.items()}
+            ebs_autoscale_path = placeholders.get(
+                ebs_autoscale_path, ebs_autoscale_path
             )
 
+        # the x86_64 asset keeps its original construct id
+        self.awscli_asset_urls = {
+            x: s3_assets.Asset(
+                self,
+                "awscli-asset" if x == "x86_64" else f"awscli-{x}-asset",
+                path=str(path),
+            ).s3_object_url
+            for x, path in awscli_paths.items()
+        }
+        ebs_autoscale_asset = s3_assets.Asset(
+            self, "ebs-autoscale-asset", path=str(ebs_autoscale_path)
+        )
+
+        repo_upgrade = bootstrap_props["repo_upgrade"]
+        self.user_data_substitutions.update(
+            EBS_AUTOSCALE_ASSET_URL=ebs_autoscale_asset.s3_object_url,
+            REPO_UPDATE=str(repo_upgrade != "none").lower(),
+            REPO_UPGRADE=repo_upgrade,
+        )
+
     @staticmethod
-    def create_user_data() -> str:
+    def stage_placeholder_assets(paths: List[Path]) -> Dict[Path, Path]:
+        """
+        Create placeholders of the same names for bootstrap assets that were not
+        downloaded, in a temporary directory
+        :param paths: the missing asset files (zip) and directories
+        :return: the placeholder path of each missing asset
+        """
+        placeholder_dir = Path(tempfile.mkdtemp(prefix="nf-bootstrap-assets-"))
+        placeholders = {}
+        for path in paths:
+            placeholder = placeholder_dir / path.name
+            if path.suffix == ".zip":
+                placeholder.write_text("offline synth placeholder\n")
+            else:
+                placeholder.mkdir()
+                (placeholder / "install.sh").write_text("exit 1\n")
+            placeholders[path] = placeholder
+        return placeholders
+
+    def render_user_data_file(
+        self, name: str, substitutions: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Read a file from the launch_template directory and substitute its $NAME
+        placeholders
+        :param name: the path of the file relative to the launch_template directory
+        :param substitutions: placeholder values in addition to the stack wide ones
+        :return: the file contents
         """
-        Create the user_data portion of the launch template
+        template = Template(open(USER_DATA_DIR / name).read())
+        return template.safe_substitute(
+            self.user_data_substitutions, **(substitutions or {})
+        ).rstrip()
+
+    def create_user_data(
+        self, scratch: str = "ebs", substitutions: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Create the user_data portion of the launch template. It is a multipart
+        document with a cloud-config part, which controls package upgrades, and a
+        bootstrap script that runs the timed phases in launch_template/phases.
+        The ECS agent is configured before it starts, and the images are pulled in
+        the background once it is started
+
+        :param scratch: the scratch layout for /var/lib/docker (ebs or nvme)
+        :param substitutions: placeholder values specific to this launch template
+        :return: base64 encoded user data
+        """
+        phases = [
+            "install_packages",
+            "install_awscli",
+            "configure_awscli",
+            f"scratch_{scratch}",
+            *self.host_phases,
+            "configure_ecs",
+            "start_ecs",
+            "prewarm_images",
+        ]
+        bootstrap = "\n\n".join(
+            [self.render_user_data_file("bootstrap.sh")]
+            + [
+                self.render_user_data_file(f"phases/{p}.sh", substitutions)
+                for p in phases
+            ]
+            + ["\n".join(f"run_phase {p}" for p in phases)]
+        )
+        parts = [
+            ("text/cloud-config", self.render_user_data_file("cloud-config.yaml")),
+            ("text/x-shellscript", bootstrap),
+        ]
+
+        user_data = (
+            "MIME-Version: 1.0\n"
+            'Content-Type: multipart/mixed; boundary="==BOUNDARY=="\n\n'
+        )
+        for content_type, body in parts:
+            user_data += (
+                f"{MIME_BOUNDARY}\n"
+                f'Content-Type: {content_type}; charset="us-ascii"\n\n'
+                f"{body}\n\n"
+            )
+        user_data += f"{MIME_BOUNDARY}--"
+        return core.Fn.base64(user_data)
+
+    @staticmethod
+    def create_cwagent_config(name: str) -> str:
+        """
+        Create the CloudWatch agent configuration of the hosts of a compute profile.
+        Memory and disk usage are also aggregated by the profile alone, which is
+        what the monitoring dashboards show
+        :param name: the name of the compute profile (e.g., m5, head)
+        :return: the agent configuration as JSON
+        """
+        dimensions = dict(ComputeProfile=name)
+        config = dict(
+            metrics=dict(
+                namespace=HOST_METRICS_NAMESPACE,
+                append_dimensions={"InstanceId": "${aws:InstanceId}"},
+                aggregation_dimensions=[["ComputeProfile"]],
+                metrics_collected=dict(
+                    mem=dict(
+                        measurement=["mem_used_percent"],
+                        append_dimensions=dimensions,
+                    ),
+                    disk=dict(
+                        measurement=["used_percent"],
+                        resources=["/", "/var/lib/docker"],
+                        drop_device=True,
+                        append_dimensions=dimensions,
+                    ),
+                ),
+            ),
+            logs=dict(
+                logs_collected=dict(
+                    files=dict(
+                        collect_list=[
+                            dict(
+                                file_path=path,
+                                log_group_name=HOST_LOG_GROUP_NAME,
+                                log_stream_name=f"{{instance_id}}/{stream}",
+                            )
+                            for path, stream in [
+                                ("/var/log/nf-bootstrap.log", "bootstrap"),
+                                ("/var/log/ebs-autoscale.log", "ebs-autoscale"),
+                            ]
+                        ]
+                    )
+                )
+            ),
+        )
+        return json.dumps(config, indent=2)
 
-        :return: user data file contents as a string
+    @staticmethod
+    def create_block_device_mapping(
+        volume_name: str, volume: Dict, encrypted: bool = True
+    ) -> Dict:
+        """
+        Create a launch template block device mapping for an EBS volume. IOPS are
+        only set for volume types that take them, and throughput only for gp3
+        :param volume_name: the name of the volume (root, docker, scratch)
+        :param volume: the volume settings (size, type, iops, throughput)
+        :param encrypted: whether the volume is encrypted
+        :return: the block device mapping
         """
-        user_data_file = (
-            Path(__file__).parent.parent / "launch_template" / "userdata_ebs.sh"
+        ebs = dict(
+            deleteOnTermination=True,
+            volumeSize=volume["size"],
+            volumeType=volume["type"],
         )
-        user_data = base64.b64encode(open(user_data_file).read().encode()).decode()
-        return user_data
+        if encrypted:
+            ebs["encrypted"] = True
+        if volume["type"] in ("gp3", "io1", "io2"):
+            ebs["iops"] = volume["iops"]
+        if volume["type"] == "gp3":
+            ebs["throughput"] = volume["throughput"]
+        return dict(deviceName=VOLUME_DEVICES[volume_name], ebs=ebs)
 
-    def create_launch_template(self, user_data: str) -> ec2.CfnLaunchTemplate:
+    def create_launch_template(
+        self, *, name: str, profile: Dict
+    ) -> ec2.CfnLaunchTemplate:
         """
-        Creates the launch template for the batch jobs
-        :param user_data: the userdata string
+        Creates the launch template for the batch jobs of a compute profile. EBS
+        scratch attaches the volumes that amazon-ebs-autoscale grows, NVMe scratch
+        relies on the instance store of *d instance families and only needs the
+        root volume. The AWS CLI bundle and the pre-pulled images are the ones of
+        the architecture of the profile.
+        :param name: the name of the compute profile (e.g., m5, head)
+        :param profile: the validated compute profile
         :return: the CfnLaunchTemplate
         """
+        scratch = profile["scratch"]
+        volumes = profile["volumes"]
+
+        block_device_mappings = [
+            self.create_block_device_mapping("root", volumes["root"], encrypted=False)
+        ]
+        if scratch == "ebs":
+            block_device_mappings += [
+                self.create_block_device_mapping("docker", volumes["docker"]),
+                self.create_block_device_mapping("scratch", volumes["scratch"]),
+            ]
+
+        # volumes added by amazon-ebs-autoscale follow the scratch volume settings
+        scratch_volume = volumes["scratch"]
+        ebs_autoscale_options = f"-t {scratch_volume['type']}"
+        if scratch_volume["type"] == "gp3":
+            ebs_autoscale_options += (
+                f" --volume-iops {scratch_volume['iops']}"
+                f" --volume-throughput {scratch_volume['throughput']}"
+            )
+        architecture = profile["architecture"]
+        user_data = self.create_user_data(
+            scratch=scratch,
+            substitutions=dict(
+                AWSCLI_ASSET_URL=self.awscli_asset_urls[architecture],
+                EBS_AUTOSCALE_OPTIONS=ebs_autoscale_options,
+                PREWARM_IMAGES=" ".join(
+                    self.image_uris[architecture][x] for x in profile["prewarm_images"]
+                ),
+                CWAGENT_CONFIG=self.create_cwagent_config(name),
+            ),
+        )
+
         return ec2.CfnLaunchTemplate(
             self,
-            "nf-ebs-launch-template",
-            launch_template_name="NfEbsLaunchTemplate",
+            f"nf-{name}-launch-template",
+            launch_template_name=f"Nf{name.capitalize()}LaunchTemplate",
             launch_template_data=dict(
-                blockDeviceMappings=[
-                    dict(
-                        deviceName="/dev/xvdcz",
-                        ebs=dict(
-                            encrypted=True,
-                            deleteOnTermination=True,
-                            volumeSize=75,
-                            volumeType="gp2",
-                        ),
-                    ),
-                    dict(
-                        deviceName="/dev/xvda",
-                        ebs=dict(
-                            deleteOnTermination=True,
-                            volumeSize=50,
-                            volumeType="gp2",
-                        ),
-                    ),
-                    dict(
-                        deviceName="/dev/sdc",
-                        ebs=dict(
-                            encrypted=True,
-                            deleteOnTermination=True,
-                            volumeSize=100,
-                            volumeType="gp2",
-                        ),
-                    ),
-                ],
+                blockDeviceMappings=block_device_mappings,
                 userData=user_data,
             ),
         )
 
-    @staticmethod
     def create_compute_resources(
+        self,
         maxv_cpus: int = 1024,
         minv_cpus: int = 0,
         desiredv_cpus: int = 0,
@@ -127,6 +604,8 @@ class NfCompute(cfn.NestedStack):
         launch_template: ec2.CfnLaunchTemplate,
         compute_resource_type: batch.ComputeResourceType,
         instance_types: List[ec2.InstanceType],
+        allocation_strategy: Optional[batch.AllocationStrategy] = None,
+        bid_percentage: Optional[int] = None,
     ) -> batch.ComputeResources:
         """
         Create the compute rescources for a compute environment
@@ -140,18 +619,23 @@ class NfCompute(cfn.NestedStack):
         :param launch_template: the launch template
         :param compute_resource_type: the compute resourcce type
         :param instance_types: the list of isntance types
+        :param allocation_strategy: the allocation strategy, batch's default if None
+        :param bid_percentage: the maximum spot price as a percentage of on-demand
         :return: the batch ComputeResources
         """
         return batch.ComputeResources(
             instance_role=instance_profile.instance_profile_name,
             type=compute_resource_type,
+            allocation_strategy=allocation_strategy,
+            bid_percentage=bid_percentage,
             maxv_cpus=maxv_cpus,
             minv_cpus=minv_cpus,
             desiredv_cpus=desiredv_cpus,
             instance_types=instance_types,
             spot_fleet_role=spotfleet_role,
             vpc=vpc,
-            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+            security_groups=[self.security_group],
+            vpc_subnets=self.compute_subnets,
             launch_template=batch.LaunchTemplateSpecification(
                 launch_template_name=launch_template.launch_template_name
             ),
@@ -226,87 +710,331 @@ class NfCompute(cfn.NestedStack):
             compute_resources=cr,
         )
 
-        jq = self.create_queue(
-            instance_class="head", cr_type=compute_resource_type, ce=ce
+        self.head_queue = self.create_queue(
+            name=HEAD_QUEUE_NAME, priority=100, compute_environments=[ce]
         )
         self.create_job_definition(
-            instance_class="head",
-            cr_type=compute_resource_type,
-            job_queue=jq,
+            name=HEAD_QUEUE_NAME,
+            job_queue=self.head_queue,
             container_image=container_image,
             work_bucket=work_bucket,
             batch_instance_role=batch_instance_role,
         )
         return ce
 
+    def create_head_fargate_env(
+        self,
+        *,
+        ce_id: str,
+        vpc: ec2.Vpc,
+        fargate: Dict,
+        service_role: iam.Role,
+        batch_instance_role: iam.Role,
+        execution_role: iam.Role,
+        work_bucket: s3.Bucket,
+        default_queue: batch.IJobQueue,
+    ) -> batch.CfnComputeEnvironment:
+        """
+        Creates a Fargate environment, queue and job definition for the head of the
+        nextflow deployment. The construct library of this CDK version only knows
+        EC2 job definitions, so they are CloudFormation resources. The head jobs
+        run the nextflow image with the AWS CLI it ships, have the same job role as
+        on EC2, and mount the EFS work directory, but not the host directories
+        :param ce_id: the id of the compute environment
+        :param vpc: the VPC
+        :param fargate: the head_fargate section of the props dictionary
+        :param service_role: the service role
+        :param batch_instance_role: the job role of the head jobs
+        :param execution_role: the role that pulls the image and writes the logs
+        :param work_bucket: the bucket where work products will be stored
+        :param default_queue: the EC2 queue of the tasks without a queue label, as
+        nextflow registers their job definitions for EC2
+        :return: the CfnComputeEnvironment
+        """
+        subnets = vpc.select_subnets(
+            subnet_type=self.compute_subnets.subnet_type,
+            availability_zones=self.compute_subnets.availability_zones,
+        )
+        ce = batch.CfnComputeEnvironment(
+            self,
+            ce_id,
+            type="MANAGED",
+            service_role=service_role.role_arn,
+            compute_resources=batch.CfnComputeEnvironment.ComputeResourcesProperty(
+                type="FARGATE",
+                maxv_cpus=fargate["maxv_cpus"],
+                subnets=subnets.subnet_ids,
+                security_group_ids=[self.security_group.security_group_id],
+            ),
+        )
+        queue = batch.CfnJobQueue(
+            self,
+            f"nf-{HEAD_QUEUE_NAME}-queue",
+            job_queue_name=f"Nf{HEAD_QUEUE_NAME.replace('-', '')}Queue",
+            priority=100,
+            compute_environment_order=[
+                batch.CfnJobQueue.ComputeEnvironmentOrderProperty(
+                    compute_environment=ce.ref, order=0
+                )
+            ],
+        )
+        self.head_queue = batch.JobQueue.from_job_queue_arn(
+            self, f"nf-{HEAD_QUEUE_NAME}-queue-arn", queue.ref
+        )
+
+        jobdef = batch.CfnJobDefinition(
+            self,
+            f"nf-{HEAD_QUEUE_NAME}-job",
+            type="container",
+            job_definition_name=f"Nf{HEAD_QUEUE_NAME.replace('-', '')}Job",
+            platform_capabilities=["FARGATE"],
+            retry_strategy=batch.CfnJobDefinition.RetryStrategyProperty(
+                attempts=self.retry_strategy["attempts"]
+            ),
+            container_properties=batch.CfnJobDefinition.ContainerPropertiesProperty(
+                image=self.image_uris[fargate["architecture"]]["nextflow"],
+                job_role_arn=batch_instance_role.role_arn,
+                execution_role_arn=execution_role.role_arn,
+                resource_requirements=[
+                    batch.CfnJobDefinition.ResourceRequirementProperty(
+                        type="VCPU", value=str(fargate["vcpus"])
+                    ),
+                    batch.CfnJobDefinition.ResourceRequirementProperty(
+                        type="MEMORY", value=str(fargate["memory_mib"])
+                    ),
+                ],
+                environment=[
+                    batch.CfnJobDefinition.EnvironmentProperty(name=k, value=v)
+                    for k, v in self.create_head_environment(
+                        default_queue, work_bucket
+                    ).items()
+                ],
+                fargate_platform_configuration=(
+                    batch.CfnJobDefinition.FargatePlatformConfigurationProperty(
+                        platform_version=fargate["platform_version"]
+                    )
+                ),
+                network_configuration=(
+                    batch.CfnJobDefinition.NetworkConfigurationProperty(
+                        assign_public_ip=(
+                            "ENABLED"
+                            if self.compute_subnets.subnet_type == ec2.SubnetType.PUBLIC
+                            else "DISABLED"
+                        )
+                    )
+                ),
+            ),
+        )
+        self.add_evaluate_on_exit(jobdef)
+        # the CloudFormation resource of this CDK version predates Graviton Fargate
+        jobdef.add_property_override(
+            "ContainerProperties.RuntimePlatform",
+            dict(
+                CpuArchitecture=fargate["architecture"].upper(),
+                OperatingSystemFamily="LINUX",
+            ),
+        )
+        if self.efs_mount is not None:
+            jobdef.add_property_override(
+                "ContainerProperties.Volumes",
+                [
+                    dict(
+                        Name="efs",
+                        EfsVolumeConfiguration=dict(
+                            FileSystemId=self.efs_mount["file_system_id"],
+                            TransitEncryption="ENABLED",
+                        ),
+                    )
+                ],
+            )
+            jobdef.add_property_override(
+                "ContainerProperties.MountPoints",
+                [
+                    dict(
+                        SourceVolume="efs",
+                        ContainerPath=self.efs_mount["path"],
+                        ReadOnly=False,
+                    )
+                ],
+            )
+        return ce
+
     def create_queue(
         self,
         *,
-        instance_class: str,
-        cr_type: batch.ComputeResourceType,
-        ce: batch.ComputeEnvironment,
+        name: str,
+        priority: int,
+        compute_environments: List[batch.ComputeEnvironment],
     ) -> batch.JobQueue:
         """
-        Creates a batch job queue
-        :param instance_class: the name of the instance class (e.g., m5)
-        :param cr_type: the type of batch compute resrouce (e.g., SPOT, ON_DEMAND)
-        :param ce: the compute environment
-        (e.g., spot, ondemand)
+        Creates a batch job queue. Compute environments are attached in the order
+        given, so jobs are placed in the first environment with capacity
+        :param name: the name of the queue (e.g., spot-m5)
+        :param priority: the priority of the queue, higher is scheduled first
+        :param compute_environments: the compute environments
         :return: JobQueue
         """
-        cr_type_name = cr_type.name.lower()
-        priority = 1
-        if cr_type == batch.ComputeResourceType.ON_DEMAND:
-            priority = 100
         return batch.JobQueue(
             self,
-            f"nf-{cr_type_name}-{instance_class}-queue",
-            job_queue_name=f"Nf{cr_type_name}{instance_class}Queue",
+            f"nf-{name}-queue",
+            job_queue_name=f"Nf{name.replace('-', '')}Queue",
             compute_environments=[
-                batch.JobQueueComputeEnvironment(compute_environment=ce, order=0)
+                batch.JobQueueComputeEnvironment(compute_environment=ce, order=i)
+                for i, ce in enumerate(compute_environments)
             ],
             priority=priority,
         )
 
+    def add_evaluate_on_exit(
+        self, jobdef: Union[batch.JobDefinition, batch.CfnJobDefinition]
+    ) -> None:
+        """
+        Add the evaluate-on-exit rules to the retry strategy of a job definition.
+        Jobs are retried when their host went away, e.g. a reclaimed spot instance,
+        and fail fast on anything else. The last rule matches any reason, so jobs
+        without an exit code, e.g. a failed image pull, fail fast as well. The
+        construct library only sets the number of attempts, so the rules are
+        overridden on the CfnJobDefinition
+        :param jobdef: the job definition, or the CfnJobDefinition itself
+        :return:
+        """
+        if isinstance(jobdef, batch.JobDefinition):
+            jobdef = jobdef.node.default_child
+        jobdef.add_property_override(
+            "RetryStrategy.EvaluateOnExit",
+            [
+                dict(OnStatusReason=reason, Action="RETRY")
+                for reason in self.retry_strategy["retry_on_status_reasons"]
+            ]
+            + [dict(OnReason="*", Action="EXIT")],
+        )
+
+    def create_mount_points(
+        self, mounts: Optional[List[Dict]] = None
+    ) -> List[ecs.MountPoint]:
+        """
+        Create the container mount points of the host directories
+        :param mounts: the host directories, defaults to the ones of every job
+        :return: the mount points
+        """
+        return [
+            ecs.MountPoint(
+                container_path=m["container_path"],
+                read_only=m["read_only"],
+                source_volume=m["name"],
+            )
+            for m in (self.host_mounts if mounts is None else mounts)
+        ]
+
+    def create_volumes(self, mounts: Optional[List[Dict]] = None) -> List[ecs.Volume]:
+        """
+        Create the job definition volumes of the host directories
+        :param mounts: the host directories, defaults to the ones of every job
+        :return: the volumes
+        """
+        return [
+            ecs.Volume(name=m["name"], host=ecs.Host(source_path=m["source_path"]))
+            for m in (self.host_mounts if mounts is None else mounts)
+        ]
+
+    def create_head_environment(
+        self, job_queue: batch.IJobQueue, work_bucket: s3.Bucket
+    ) -> Dict[str, str]:
+        """
+        Create the environment of a nextflow head job definition, which
+        docker/nextflow.aws.sh turns into the nextflow config
+        :param job_queue: the default queue of the tasks
+        :param work_bucket: the bucket of the logs and session caches
+        :return: the environment variables
+        """
+        return dict(
+            NF_JOB_QUEUE=job_queue.job_queue_arn,
+            NF_LOGSDIR=work_bucket.s3_url_for_object(key="logs"),
+            NF_WORKDIR=self.work_dir,
+            NF_PROCESS_QUEUES=",".join(
+                f"{k}={v.job_queue_arn}" for k, v in self.job_queues.items()
+            ),
+            **self.nextflow_environment,
+        )
+
     def create_job_definition(
         self,
         *,
-        instance_class: str,
-        cr_type: batch.ComputeResourceType,
+        name: str,
         job_queue: batch.JobQueue,
         container_image: ecs.ContainerImage,
         work_bucket: s3.Bucket,
         batch_instance_role: iam.Role,
     ) -> batch.JobDefinition:
-        cr_type_name = cr_type.name.lower()
         jobdef = batch.JobDefinition(
             self,
-            f"nf-{cr_type_name}-{instance_class}-job",
-            job_definition_name=f"Nf{cr_type_name}{instance_class}Job",
+            f"nf-{name}-job",
+            job_definition_name=f"Nf{name.replace('-', '')}Job",
+            retry_attempts=self.retry_strategy["attempts"],
             container=batch.JobDefinitionContainer(
                 image=container_image,
                 vcpus=2,
                 job_role=batch_instance_role,
                 memory_limit_mib=1024,
-                environment=dict(
-                    NF_JOB_QUEUE=job_queue.job_queue_arn,
-                    NF_LOGSDIR=work_bucket.s3_url_for_object(key="logs"),
-                    NF_WORKDIR=work_bucket.s3_url_for_object(key="work"),
+                environment=self.create_head_environment(job_queue, work_bucket),
+                mount_points=self.create_mount_points(
+                    self.host_mounts + self.head_mounts
                 ),
-                mount_points=[
-                    ecs.MountPoint(
-                        container_path="/opt/aws-cli",
-                        read_only=True,
-                        source_volume="aws-cli",
-                    ),
-                ],
-                volumes=[
-                    ecs.Volume(
-                        name="aws-cli", host=ecs.Host(source_path="/opt/aws-cli")
-                    ),
+                volumes=self.create_volumes(self.host_mounts + self.head_mounts),
+            ),
+        )
+        self.add_evaluate_on_exit(jobdef)
+
+        return jobdef
+
+    def create_tool_job_definition(
+        self,
+        *,
+        name: str,
+        profile: Dict,
+        container_image: ecs.ContainerImage,
+        batch_instance_role: iam.Role,
+    ) -> batch.JobDefinition:
+        """
+        Create the job definition of a workflow tool (e.g., bwa-mem), sized by its
+        job profile. Nextflow processes use it with a container directive of
+        job-definition://<job definition name>
+        :param name: the name of the job profile
+        :param profile: the validated job profile
+        :param container_image: the image of the tool
+        :param batch_instance_role: the batch instance role
+        :return: the batch JobDefinition
+        """
+        camel_name = "".join(x.capitalize() for x in name.replace("_", "-").split("-"))
+        jobdef = batch.JobDefinition(
+            self,
+            f"nf-tool-{name}-job",
+            job_definition_name=f"Nf{camel_name}Job",
+            retry_attempts=self.retry_strategy["attempts"],
+            container=batch.JobDefinitionContainer(
+                image=container_image,
+                vcpus=profile["vcpus"],
+                job_role=batch_instance_role,
+                memory_limit_mib=profile["memory_mib"],
+                ulimits=[
+                    ecs.Ulimit(
+                        name=ecs.UlimitName[k.upper()],
+                        soft_limit=v,
+                        hard_limit=v,
+                    )
+                    for k, v in profile["ulimits"].items()
                 ],
+                mount_points=self.create_mount_points(),
+                volumes=self.create_volumes(),
             ),
         )
+        self.add_evaluate_on_exit(jobdef)
+        if profile["shared_memory_mib"]:
+            # batch.JobDefinitionContainer only renders the devices of linux_params
+            jobdef.node.default_child.add_property_override(
+                "ContainerProperties.LinuxParameters.SharedMemorySize",
+                profile["shared_memory_mib"],
+            )
 
         return jobdef
 
@@ -315,14 +1043,12 @@ class NfCompute(cfn.NestedStack):
         *,
         vpc: ec2.Vpc,
         instance_class: str,
+        profile: Dict,
         instance_profile: iam.CfnInstanceProfile,
         spotfleet_role: iam.Role,
         service_role: iam.Role,
         launch_template: ec2.CfnLaunchTemplate,
         compute_resource_type: batch.ComputeResourceType,
-        batch_instance_role: iam.Role,
-        work_bucket: s3.Bucket,
-        container_image: ecs.ContainerImage,
     ) -> batch.ComputeEnvironment:
         """
         Create the computing environment necessary for an instance class and compute
@@ -330,92 +1056,76 @@ class NfCompute(cfn.NestedStack):
 
         :param vpc: the VPC
         :param instance_class: the name of the instance class (e.g., m5)
+        :param profile: the validated compute profile
         :param instance_profile: the instance profile
         :param spotfleet_role: the spotfleet role
         :param service_role: the service role
         :param launch_template: the launch template
         :param compute_resource_type: the compute resource type
-        :param batch_instance_role: the batch instance role
-        :param work_bucket: the bucke where work artifacts are stored
-        :param container_image: tehe container image
         :return: the batch ComputeEnvironment
         """
         cr_type_name = compute_resource_type.name.lower()
-        instance_suffixes = ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge"]
-        if instance_class == "c5":
-            instance_suffixes = ["large", "xlarge", "2xlarge", "4xlarge", "9xlarge"]
         cr = self.create_compute_resources(
+            maxv_cpus=profile["maxv_cpus"],
+            minv_cpus=profile["minv_cpus"],
             vpc=vpc,
             instance_profile=instance_profile,
             spotfleet_role=spotfleet_role,
             launch_template=launch_template,
             compute_resource_type=compute_resource_type,
-            instance_types=[
-                ec2.InstanceType(f"{instance_class}.{x}") for x in instance_suffixes
+            instance_types=[ec2.InstanceType(x) for x in profile["instance_types"]],
+            allocation_strategy=batch.AllocationStrategy[
+                profile["allocation_strategy"][cr_type_name]
             ],
+            bid_percentage=(
+                profile["bid_percentage"]
+                if compute_resource_type == batch.ComputeResourceType.SPOT
+                else None
+            ),
         )
-        ce = self.create_compute_environment(
+        return self.create_compute_environment(
             id=f"{instance_class}-nf-{cr_type_name}-env",
             service_role=service_role,
             compute_resources=cr,
         )
-        jq = self.create_queue(
-            instance_class=instance_class, cr_type=compute_resource_type, ce=ce
-        )
-        self.create_job_definition(
-            instance_class=instance_class,
-            cr_type=compute_resource_type,
-            batch_instance_role=batch_instance_role,
-            container_image=container_image,
-            work_bucket=work_bucket,
-            job_queue=jq,
-        )
-        return ce
 
     def create_compute_envs(
         self,
         *,
         vpc: ec2.Vpc,
         instance_class: str,
+        profile: Dict,
         instance_profile: iam.CfnInstanceProfile,
         spotfleet_role: iam.Role,
         service_role: iam.Role,
-        launch_template: ec2.CfnLaunchTemplate,
-        container_image: ecs.ContainerImage,
-        work_bucket: s3.Bucket,
-        batch_instance_role: iam.Role,
     ) -> Dict[str, batch.ComputeEnvironment]:
         """
-        Create the compute environments for an instance class. This method creates
-        both spot and on-demand environments, and associated infrastructure
+        Create the compute environments for a compute profile. This method creates
+        the launch template of the profile and a spot and/or on-demand environment.
+        Queues are created separately, as they may span several profiles
 
         :param vpc: the VPC
-        :param instance_class: the name of the instance class  (e.g., m5)
+        :param instance_class: the name of the compute profile  (e.g., m5)
+        :param profile: the validated compute profile
         :param instance_profile: the instance profile
         :param spotfleet_role: the spotfleet role
         :param service_role: the service role
-        :param launch_template: the launch template
-        :param container_image: the container image
-        :param work_bucket: the bucket for work artificats
-        :param batch_instance_role: the batch instance role
         :return: a dictionary of batch.ComputeEnvironment keyed by name of compute
-        resource type (e.g., spot, demand)
+        resource type (e.g., spot, on_demand)
         """
+        launch_template = self.create_launch_template(
+            name=instance_class, profile=profile
+        )
         envs = {}
-        for k, v in dict(
-            spot=batch.ComputeResourceType.SPOT,
-            demand=batch.ComputeResourceType.ON_DEMAND,
-        ).items():
+        for k in profile["purchase"]:
             envs[k] = self.create_nf_compute_env(
                 vpc=vpc,
                 instance_class=instance_class,
+                profile=profile,
                 instance_profile=instance_profile,
                 spotfleet_role=spotfleet_role,
                 service_role=service_role,
                 launch_template=launch_template,
-                compute_resource_type=v,
-                container_image=container_image,
-                work_bucket=work_bucket,
-                batch_instance_role=batch_instance_role,
+                compute_resource_type=batch.ComputeResourceType[k.upper()],
             )
         return envs
@@ -1,12 +1,22 @@
-from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 
 from aws_cdk import aws_cloudformation as cfn
-from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecr as ecr
 from aws_cdk import aws_ecr_assets as assets
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import core
 
+from aws_gatk_stack.compute_profiles import (
+    ARCHITECTURES,
+    DOCKER_PLATFORMS,
+    MIRROR_REPOSITORY_PREFIX,
+    ROOT,
+    digest_tag,
+    load_docker_images,
+    mirror_tag,
+    parse_image_reference,
+)
+
 
 class DockerStack(cfn.NestedStack):
     def __init__(
@@ -19,52 +29,77 @@ class DockerStack(cfn.NestedStack):
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
-        self.docker_image = assets.DockerImageAsset(
-            self,
-            "nextflow-asset",
-            directory=(str(Path(__file__).parent.parent / "docker")),
-            repository_name="nextflow",
-        )
-        self.container_image = ecs.ContainerImage.from_docker_image_asset(
-            self.docker_image
-        )
-
-        self.gatk_docker = assets.DockerImageAsset(
-            self,
-            "gatk-asset",
-            directory=(str(Path(__file__).parent.parent / "docker_gatk")),
-            repository_name="gatk",
-        )
-        self.gatk_container_image = ecs.ContainerImage.from_docker_image_asset(
-            self.gatk_docker
-        )
-
-        self.gatk_4110_docker = assets.DockerImageAsset(
-            self,
-            "gatk-4110-asset",
-            directory=(str(Path(__file__).parent.parent / "docker_gatk4110")),
-            repository_name="gatk-4.1.1.0",
-        )
-        self.gatk_4110_container_image = ecs.ContainerImage.from_docker_image_asset(
-            self.gatk_4110_docker
-        )
+        # images and image URIs by architecture and name, for the job definitions
+        # of each tool and the images pre-pulled by the batch hosts
+        self.container_images = {x: {} for x in ARCHITECTURES}
+        self.image_uris = {x: {} for x in ARCHITECTURES}
+        for name, image in load_docker_images(props).items():
+            if image["mode"] == "build":
+                for architecture in image["architectures"]:
+                    self.create_image_asset(
+                        name=name,
+                        directory=image["directory"],
+                        architecture=architecture,
+                    )
+            else:
+                self.create_mirror_repository(
+                    name=name,
+                    source=image["source"],
+                    architectures=image["architectures"],
+                )
 
-        self.gotc_docker = assets.DockerImageAsset(
+    def create_image_asset(
+        self, *, name: str, directory: str, architecture: str
+    ) -> None:
+        """
+        Build an image from a directory of this repository for one architecture.
+        The Dockerfile picks its base image with the TARGET_PLATFORM build arg, and
+        building arm64 images on an x86 host needs QEMU binfmt handlers. The asset
+        is tagged by a hash of the directory and build args, so unchanged images
+        are not built or pushed again
+        :param name: the name of the image
+        :param directory: the directory of the Dockerfile, relative to the repository
+        :param architecture: the architecture to build for
+        :return:
+        """
+        # x86_64 assets keep their original construct ids
+        asset_id = f"{name}-asset"
+        if architecture != "x86_64":
+            asset_id = f"{name}-{architecture}-asset"
+        docker_image = assets.DockerImageAsset(
             self,
-            "gotc-asset",
-            directory=(str(Path(__file__).parent.parent / "docker_gotc")),
-            repository_name="gotc",
-        )
-        self.gotc_container_image = ecs.ContainerImage.from_docker_image_asset(
-            self.gotc_docker
+            asset_id,
+            directory=str(ROOT / directory),
+            repository_name=name,
+            build_args=dict(TARGET_PLATFORM=DOCKER_PLATFORMS[architecture]),
         )
+        container_image = ecs.ContainerImage.from_docker_image_asset(docker_image)
+        self.container_images[architecture][name] = container_image
+        self.image_uris[architecture][name] = docker_image.image_uri
 
-        self.gatk_joint_docker = assets.DockerImageAsset(
+    def create_mirror_repository(
+        self, *, name: str, source: str, architectures: List[str]
+    ) -> None:
+        """
+        Create the ECR repository of an upstream image, which tools/mirror_images.py
+        copies there instead of building it, once for each architecture. The
+        repository is created empty, and the job definitions refer to the image by
+        the tag of its pinned digest
+        :param name: the name of the image
+        :param source: the pinned upstream image reference
+        :param architectures: the architectures to mirror the image for
+        :return:
+        """
+        repository = ecr.Repository(
             self,
-            "gatk-joint-asset",
-            directory=(str(Path(__file__).parent.parent / "docker_gatk_joint")),
-            repository_name="gatk-joint",
-        )
-        self.gatk_joint_container_image = ecs.ContainerImage.from_docker_image_asset(
-            self.gatk_joint_docker
+            f"{name}-mirror",
+            repository_name=f"{MIRROR_REPOSITORY_PREFIX}/{name}",
         )
+        pinned_tag = digest_tag(parse_image_reference(source)["digest"])
+        for architecture in architectures:
+            tag = mirror_tag(pinned_tag, architecture)
+            container_image = ecs.ContainerImage.from_ecr_repository(
+                repository, tag=tag
+            )
+            self.container_images[architecture][name] = container_image
+            self.image_uris[architecture][name] = repository.repository_uri_for_tag(tag)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aws_cdk import aws_cloudformation as cfn
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_s3 as s3
@@ -12,6 +14,7 @@ class IamStack(cfn.NestedStack):
         *,
         work_bucket: s3.Bucket,
         data_bucket: s3.Bucket,
+        express_bucket: Optional[core.CfnResource] = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
@@ -143,6 +146,9 @@ class IamStack(cfn.NestedStack):
                 iam.ManagedPolicy.from_aws_managed_policy_name(
                     "AmazonS3ReadOnlyAccess"
                 ),
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "CloudWatchAgentServerPolicy"
+                ),
             ],
         )
 
@@ -205,3 +211,27 @@ class IamStack(cfn.NestedStack):
                 ),
             ],
         )
+
+        # pulls the image and writes the logs of Fargate head jobs
+        # noinspection PyTypeChecker
+        self.nf_execution_role = iam.Role(
+            self,
+            "nf-execution-role",
+            assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AmazonECSTaskExecutionRolePolicy"
+                )
+            ],
+        )
+
+        # directory buckets authorize requests with sessions instead of s3 actions
+        if express_bucket is not None:
+            for role in (self.nf_batch_instance_role, self.nf_job_role):
+                role.add_to_policy(
+                    iam.PolicyStatement(
+                        actions=["s3express:CreateSession"],
+                        effect=iam.Effect.ALLOW,
+                        resources=[express_bucket.get_att("Arn").to_string()],
+                    )
+                )
@@ -0,0 +1,233 @@
+from pathlib import Path
+from typing import Dict, List
+
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_cloudformation as cfn
+from aws_cdk import aws_cloudwatch as cloudwatch
+from aws_cdk import aws_cloudwatch_actions as cloudwatch_actions
+from aws_cdk import aws_events as events
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_logs as logs
+from aws_cdk import aws_sns as sns
+from aws_cdk import aws_sns_subscriptions as subscriptions
+from aws_cdk import core
+
+from aws_gatk_stack.compute_substack import HOST_METRICS_NAMESPACE
+
+BATCH_METRICS_NAMESPACE = "NfGatk/Batch"
+LAMBDA_DIR = Path(__file__).parent.parent / "lambda"
+# this CDK version has no constant for a python runtime that Lambda still accepts
+LAMBDA_RUNTIME = lambda_.Runtime("python3.12", lambda_.RuntimeFamily.PYTHON)
+
+
+class MonitoringStack(cfn.NestedStack):
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        *,
+        props: Dict,
+        job_queues: Dict[str, batch.JobQueue],
+        queue_profiles: Dict[str, List[str]],
+        host_log_group: logs.LogGroup,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        monitoring_props = props["monitoring"]
+
+        self.alarm_topic = sns.Topic(self, "nf-alarm-topic")
+        if monitoring_props["alarm_email"]:
+            self.alarm_topic.add_subscription(
+                subscriptions.EmailSubscription(monitoring_props["alarm_email"])
+            )
+
+        self.create_batch_metrics_function(job_queues)
+
+        # amazon-ebs-autoscale logs a line for every volume it adds to scratch
+        ebs_growth_filter = logs.MetricFilter(
+            self,
+            "nf-ebs-autoscale-growth",
+            log_group=host_log_group,
+            filter_pattern=logs.FilterPattern.all_terms("Adding", "volume"),
+            metric_namespace=HOST_METRICS_NAMESPACE,
+            metric_name="EbsAutoscaleVolumesAdded",
+            metric_value="1",
+        )
+        self.ebs_growth_metric = ebs_growth_filter.metric(statistic="Sum")
+
+        for name in job_queues:
+            self.create_queue_dashboard(
+                name=name,
+                profiles=queue_profiles[name],
+                starved_minutes=monitoring_props["starved_minutes"],
+            )
+
+    def create_batch_metrics_function(
+        self, job_queues: Dict[str, batch.JobQueue]
+    ) -> lambda_.Function:
+        """
+        Create the function that publishes the RUNNABLE and RUNNING jobs of every
+        queue each minute, and counts spot interruptions from Batch job state change
+        events
+        :param job_queues: the job queues keyed by name
+        :return: the function
+        """
+        function = lambda_.Function(
+            self,
+            "nf-batch-metrics",
+            runtime=LAMBDA_RUNTIME,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(str(LAMBDA_DIR / "batch_metrics")),
+            timeout=core.Duration.seconds(50),
+            environment=dict(
+                METRICS_NAMESPACE=BATCH_METRICS_NAMESPACE,
+                JOB_QUEUES=",".join(
+                    f"{k}={v.job_queue_arn}" for k, v in job_queues.items()
+                ),
+            ),
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["batch:ListJobs", "cloudwatch:PutMetricData"],
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+            )
+        )
+
+        rules = dict(
+            schedule=events.CfnRule(
+                self,
+                "nf-batch-metrics-schedule",
+                schedule_expression="rate(1 minute)",
+                targets=[
+                    events.CfnRule.TargetProperty(
+                        arn=function.function_arn, id="batch-metrics"
+                    )
+                ],
+            ),
+            job_state=events.CfnRule(
+                self,
+                "nf-batch-job-state",
+                event_pattern={
+                    "source": ["aws.batch"],
+                    "detail-type": ["Batch Job State Change"],
+                    "detail": {
+                        "jobQueue": [q.job_queue_arn for q in job_queues.values()],
+                        "status": ["RUNNABLE", "FAILED"],
+                    },
+                },
+                targets=[
+                    events.CfnRule.TargetProperty(
+                        arn=function.function_arn, id="batch-metrics"
+                    )
+                ],
+            ),
+        )
+        for name, rule in rules.items():
+            function.add_permission(
+                f"nf-batch-metrics-{name}",
+                principal=iam.ServicePrincipal("events.amazonaws.com"),
+                source_arn=rule.attr_arn,
+            )
+        return function
+
+    @staticmethod
+    def queue_metric(
+        metric_name: str, queue: str, statistic: str = "Maximum"
+    ) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace=BATCH_METRICS_NAMESPACE,
+            metric_name=metric_name,
+            dimensions=dict(JobQueue=queue),
+            statistic=statistic,
+            period=core.Duration.minutes(1),
+        )
+
+    @staticmethod
+    def host_metric(metric_name: str, profile: str) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace=HOST_METRICS_NAMESPACE,
+            metric_name=metric_name,
+            dimensions=dict(ComputeProfile=profile),
+            label=f"{profile} {metric_name}",
+            statistic="Maximum",
+            period=core.Duration.minutes(5),
+        )
+
+    def create_queue_dashboard(
+        self, *, name: str, profiles: List[str], starved_minutes: int
+    ) -> cloudwatch.Dashboard:
+        """
+        Create the dashboard of a job queue, and the alarm for a queue that has
+        RUNNABLE jobs but nothing RUNNING for starved_minutes
+        :param name: the name of the queue (e.g., spot-m5)
+        :param profiles: the compute profiles of the queue's compute environments
+        :param starved_minutes: the minutes without running jobs before the alarm
+        :return: the dashboard
+        """
+        runnable = self.queue_metric("RunnableJobs", name)
+        running = self.queue_metric("RunningJobs", name)
+
+        starved = cloudwatch.MathExpression(
+            expression="IF(runnable > 0 AND running == 0, 1, 0)",
+            using_metrics=dict(runnable=runnable, running=running),
+            label="starved",
+            period=core.Duration.minutes(1),
+        )
+        alarm = cloudwatch.Alarm(
+            self,
+            f"nf-{name}-starved",
+            alarm_description=(
+                f"{name} has RUNNABLE jobs and none RUNNING for {starved_minutes} "
+                "minutes"
+            ),
+            metric=starved,
+            threshold=1,
+            comparison_operator=(
+                cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD
+            ),
+            evaluation_periods=starved_minutes,
+            datapoints_to_alarm=starved_minutes,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        alarm.add_alarm_action(cloudwatch_actions.SnsAction(self.alarm_topic))
+
+        dashboard = cloudwatch.Dashboard(
+            self, f"nf-{name}-dashboard", dashboard_name=f"nf-gatk-{name}"
+        )
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Jobs", left=[runnable, running], width=8, stacked=True
+            ),
+            cloudwatch.GraphWidget(
+                title="Oldest RUNNABLE job (seconds)",
+                left=[self.queue_metric("OldestRunnableSeconds", name)],
+                width=8,
+            ),
+            cloudwatch.GraphWidget(
+                title="Spot interruptions",
+                left=[self.queue_metric("SpotInterruptions", name, "Sum")],
+                width=8,
+            ),
+        )
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Host memory used (%)",
+                left=[self.host_metric("mem_used_percent", p) for p in profiles],
+                width=8,
+            ),
+            cloudwatch.GraphWidget(
+                title="Host disk used (%)",
+                left=[self.host_metric("disk_used_percent", p) for p in profiles],
+                width=8,
+            ),
+            cloudwatch.GraphWidget(
+                title="EBS autoscale volumes added",
+                left=[self.ebs_growth_metric],
+                width=8,
+            ),
+            cloudwatch.AlarmWidget(title="Starved", alarm=alarm, width=24),
+        )
+        return dashboard
@@ -1,13 +1,20 @@
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 from aws_cdk import aws_cloudformation as cfn
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecr_assets as assets
 from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_efs as efs
+from aws_cdk import aws_fsx as fsx
 from aws_cdk import aws_s3 as s3
 from aws_cdk import core
 
+from aws_gatk_stack.compute_profiles import (
+    load_efs_config,
+    load_work_dir_config,
+)
+
 
 class StorageStack(cfn.NestedStack):
     def __init__(
@@ -16,11 +23,14 @@ class StorageStack(cfn.NestedStack):
         id: str,
         *,
         vpc: ec2.Vpc,
+        compute_subnets: ec2.SubnetSelection,
         props: Dict,
         **kwargs,
     ) -> None:
         super().__init__(scope, id, **kwargs)
 
+        work_dir_props = load_work_dir_config(props)
+
         if props["work_bucket"]["exists"] is True:
             self.work_bucket = s3.Bucket.from_bucket_name(
                 self, "work", bucket_name=props["work_bucket"]["Name"]
@@ -38,8 +48,50 @@ class StorageStack(cfn.NestedStack):
                     restrict_public_buckets=True,
                 ),
                 encryption=s3.BucketEncryption.S3_MANAGED,
+                lifecycle_rules=[
+                    # session cache archives of the nextflow head jobs, see
+                    # docker/nextflow.aws.sh
+                    s3.LifecycleRule(
+                        id="ExpireNextflowSessionCache",
+                        prefix="logs/cache/",
+                        expiration=core.Duration.days(
+                            props["nextflow"]["cache_expiration_days"]
+                        ),
+                    ),
+                    # task work directories, kept for -resume and then removed so
+                    # listing and cleanup of work/ stay fast
+                    s3.LifecycleRule(
+                        id="ExpireNextflowWorkDir",
+                        prefix="work/",
+                        expiration=core.Duration.days(
+                            work_dir_props["expiration_days"]
+                        ),
+                    ),
+                    s3.LifecycleRule(
+                        id="AbortIncompleteMultipartUploads",
+                        abort_incomplete_multipart_upload_after=core.Duration.days(
+                            work_dir_props["abort_multipart_days"]
+                        ),
+                    ),
+                ],
             )
 
+        # nextflow's work directory, optionally in a directory bucket next to the
+        # compute environments, which are then pinned to its availability zone
+        self.work_dir = self.work_bucket.s3_url_for_object(key="work")
+        self.work_dir_availability_zone: Optional[str] = None
+        self.express_bucket = None
+        if work_dir_props["express_one_zone"] is True:
+            self.express_bucket = self.create_express_bucket(
+                bucket_name=(
+                    f"{props['work_bucket']['Name']}"
+                    f"--{work_dir_props['availability_zone_id']}--x-s3"
+                ),
+                work_dir_props=work_dir_props,
+            )
+            self.work_dir = f"s3://{self.express_bucket.ref}/work"
+            self.work_dir_availability_zone = work_dir_props["availability_zone"]
+
         if props["data_bucket"]["exists"] is True:
             self.data_bucket = s3.Bucket.from_bucket_name(
                 self, "data", bucket_name=props["data_bucket"]["Name"]
@@ -84,3 +136,148 @@ class StorageStack(cfn.NestedStack):
             security_group_name="NfBatchSecurityGroup",
             vpc=vpc,
         )
+
+        # a shared work directory, so tasks read the outputs of upstream tasks in
+        # place instead of staging them through S3
+        self.efs_file_system = None
+        efs_props = load_efs_config(props)
+        if efs_props["enabled"] is True:
+            self.efs_file_system = self.create_efs_file_system(
+                vpc=vpc, subnets=compute_subnets, efs_props=efs_props
+            )
+            self.work_dir = f"{efs_props['mount_path'].rstrip('/')}/work"
+
+        self.fsx_file_system = None
+        if props["fsx"]["enabled"] is True:
+            self.fsx_file_system = self.create_lustre_file_system(
+                vpc=vpc,
+                subnets=ec2.SubnetSelection(
+                    subnet_type=compute_subnets.subnet_type,
+                    availability_zones=(
+                        [self.work_dir_availability_zone]
+                        if self.work_dir_availability_zone
+                        else None
+                    ),
+                ),
+                fsx_props=props["fsx"],
+            )
+
+    def create_express_bucket(
+        self, *, bucket_name: str, work_dir_props: Dict
+    ) -> core.CfnResource:
+        """
+        Create an S3 Express One Zone directory bucket for the nextflow work
+        directory. The construct library has no directory bucket, so it is a
+        CloudFormation resource
+        :param bucket_name: the bucket name, ending in --<zone id>--x-s3
+        :param work_dir_props: the work_dir section of the props dictionary
+        :return: the directory bucket, whose ref is its name
+        """
+        return core.CfnResource(
+            self,
+            "nf-work-express",
+            type="AWS::S3Express::DirectoryBucket",
+            properties=dict(
+                BucketName=bucket_name,
+                DataRedundancy="SingleAvailabilityZone",
+                LocationName=work_dir_props["availability_zone_id"],
+                LifecycleConfiguration=dict(
+                    Rules=[
+                        dict(
+                            Id="ExpireNextflowWorkDir",
+                            Status="Enabled",
+                            Prefix="work/",
+                            ExpirationInDays=work_dir_props["expiration_days"],
+                        ),
+                        dict(
+                            Id="AbortIncompleteMultipartUploads",
+                            Status="Enabled",
+                            AbortIncompleteMultipartUpload=dict(
+                                DaysAfterInitiation=work_dir_props[
+                                    "abort_multipart_days"
+                                ]
+                            ),
+                        ),
+                    ]
+                ),
+            ),
+        )
+
+    def create_efs_file_system(
+        self, *, vpc: ec2.Vpc, subnets: ec2.SubnetSelection, efs_props: Dict
+    ) -> efs.FileSystem:
+        """
+        Create an EFS filesystem with mount targets in the subnets of the batch
+        compute resources, for the nextflow work directory. Elastic throughput is
+        not in the construct library of this CDK version, so it is set on the
+        CloudFormation resource
+        :param vpc: the VPC
+        :param subnets: the subnets of the batch compute resources
+        :param efs_props: the efs section of the props dictionary
+        :return: the FileSystem
+        """
+        throughput_mode = efs_props["throughput_mode"]
+        file_system = efs.FileSystem(
+            self,
+            "nf-work-efs",
+            vpc=vpc,
+            vpc_subnets=subnets,
+            encrypted=True,
+            performance_mode=(
+                efs.PerformanceMode.MAX_IO
+                if efs_props["performance_mode"] == "maxIO"
+                else efs.PerformanceMode.GENERAL_PURPOSE
+            ),
+            throughput_mode=(
+                efs.ThroughputMode.PROVISIONED
+                if throughput_mode == "provisioned"
+                else efs.ThroughputMode.BURSTING
+            ),
+            provisioned_throughput_per_second=(
+                core.Size.mebibytes(efs_props["provisioned_throughput_mibps"])
+                if throughput_mode == "provisioned"
+                else None
+            ),
+        )
+        if throughput_mode == "elastic":
+            file_system.node.default_child.add_property_override(
+                "ThroughputMode", "elastic"
+            )
+        file_system.connections.allow_default_port_from(self.nf_batch_security_group)
+        return file_system
+
+    def create_lustre_file_system(
+        self, *, vpc: ec2.Vpc, subnets: ec2.SubnetSelection, fsx_props: Dict
+    ) -> fsx.LustreFileSystem:
+        """
+        Create an FSx for Lustre filesystem linked to the reference bucket, so that
+        reference files are lazy loaded once and then shared by every batch host
+        :param vpc: the VPC
+        :param subnets: the subnets of the batch compute resources
+        :param fsx_props: the fsx section of the props dictionary
+        :return: the LustreFileSystem
+        """
+        import_path = f"s3://{self.ref_bucket.bucket_name}"
+        if fsx_props["import_prefix"]:
+            import_path = f"{import_path}/{fsx_props['import_prefix'].strip('/')}"
+
+        # the filesystem lives in the same subnets as the batch compute resources
+        subnet = vpc.select_subnets(
+            subnet_type=subnets.subnet_type,
+            availability_zones=subnets.availability_zones,
+        ).subnets[0]
+
+        file_system = fsx.LustreFileSystem(
+            self,
+            "nf-ref-lustre",
+            vpc=vpc,
+            vpc_subnet=subnet,
+            storage_capacity_gib=fsx_props["storage_capacity_gib"],
+            lustre_configuration=fsx.LustreConfiguration(
+                deployment_type=fsx.LustreDeploymentType[fsx_props["deployment_type"]],
+                import_path=import_path,
+            ),
+        )
+        file_system.connections.allow_default_port_internally()
+        file_system.connections.allow_default_port_from(self.nf_batch_security_group)
+        return file_system
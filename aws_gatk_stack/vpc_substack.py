@@ -1,5 +1,5 @@
 import logging
-from typing import Dict
+from typing import Dict, List, Optional
 
 from aws_cdk import aws_cloudformation as cfn
 from aws_cdk import aws_ec2 as ec2
@@ -7,12 +7,32 @@ from aws_cdk import core
 
 log = logging.getLogger("stack")
 
+# subnets of the batch compute resources, by the name used in props.json. private
+# subnets without NAT gateways are isolated, and reach AWS only through endpoints
+SUBNET_TYPES = ("public", "private")
+
 
 class VpcStack(cfn.NestedStack):
     def __init__(self, scope: core.Construct, id: str, props: Dict, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
+        vpc_props = props["vpc"]
+        if vpc_props["subnet_type"] not in SUBNET_TYPES:
+            raise ValueError(f"vpc: subnet_type must be one of {SUBNET_TYPES}")
+
+        self.compute_subnet_type = ec2.SubnetType.PUBLIC
+        if vpc_props["subnet_type"] == "private":
+            self.compute_subnet_type = (
+                ec2.SubnetType.PRIVATE
+                if vpc_props["nat_gateways"] > 0
+                else ec2.SubnetType.ISOLATED
+            )
+        # where the batch instances and the FSx filesystem are placed
+        self.compute_subnets = ec2.SubnetSelection(subnet_type=self.compute_subnet_type)
+
         self.vpc = self.create_or_get_vpc(props)
-        self.create_endpoints()
+        self.create_endpoints(vpc_props["interface_endpoints"])
+        if props["work_dir"]["express_one_zone"] is True:
+            self.add_s3express_gateway_endpoint()
 
     def add_s3_gateway_endpoint(self):
         """
@@ -24,32 +44,71 @@ class VpcStack(cfn.NestedStack):
             "S3EndPoint", service=ec2.GatewayVpcEndpointAwsService("s3")
         )
 
-    def add_ecr_interface_endpoint(self):
+    def add_s3express_gateway_endpoint(self):
         """
-        Adds an interface endpoint to ECR to keep traffic localized to the VPC
+        Add an S3 Express One Zone gateway endpoint to the VPC, for the directory
+        bucket of the nextflow work directory
+        :return:
+        """
+        # noinspection PyTypeChecker
+        self.vpc.add_gateway_endpoint(
+            "S3ExpressEndPoint", service=ec2.GatewayVpcEndpointAwsService("s3express")
+        )
+
+    def add_interface_endpoint(self, service: str):
+        """
+        Adds an interface endpoint with private DNS in the subnets of the batch
+        instances, to keep traffic to an AWS service localized to the VPC
+        :param service: the service name of the endpoint, e.g. ecr.dkr
         :return:
         """
         self.vpc.add_interface_endpoint(
-            "ECREndPoint", service=ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER
+            f"{service.replace('.', '-')}-endpoint",
+            service=ec2.InterfaceVpcEndpointAwsService(service),
+            subnets=self.compute_subnets,
         )
 
-    def create_endpoints(self):
+    def create_endpoints(self, interface_endpoints: List[str]):
         """
-        Add S3 and ECR endpoints to the VPC
+        Add the S3 gateway endpoint and the interface endpoints to the VPC
+        :param interface_endpoints: the service names of the interface endpoints
         :return:
         """
         self.add_s3_gateway_endpoint()
-        self.add_ecr_interface_endpoint()
+        for service in interface_endpoints:
+            self.add_interface_endpoint(service)
 
-    def create_vpc(self, max_azs: int = 2, nat_gateways: int = 0) -> ec2.Vpc:
+    def create_vpc(
+        self, max_azs: Optional[int] = None, nat_gateways: int = 0
+    ) -> ec2.Vpc:
         """
-        Creates a new VPC in the account
-        :param max_azs: The number of availablility zones
-        :param nat_gateways: The number of nat gateways
+        Creates a new VPC in the account. Public subnets are only created for the
+        public layout, or to host the NAT gateways of private subnets
+        :param max_azs: The number of availablility zones, all of the region when None
+        :param nat_gateways: The number of nat gateways of private subnets
         :return: The VPC
         """
         log.warning("Creating new VPC")
-        return ec2.Vpc(self, "nf-batch-vpc", max_azs=max_azs, nat_gateways=nat_gateways)
+        subnet_configuration = [
+            ec2.SubnetConfiguration(name="public", subnet_type=ec2.SubnetType.PUBLIC)
+        ]
+        if self.compute_subnet_type != ec2.SubnetType.PUBLIC:
+            if self.compute_subnet_type == ec2.SubnetType.ISOLATED:
+                subnet_configuration = []
+            subnet_configuration.append(
+                ec2.SubnetConfiguration(
+                    name="private", subnet_type=self.compute_subnet_type
+                )
+            )
+        else:
+            nat_gateways = 0
+        return ec2.Vpc(
+            self,
+            "nf-batch-vpc",
+            max_azs=max_azs or len(self.availability_zones),
+            nat_gateways=nat_gateways,
+            subnet_configuration=subnet_configuration,
+        )
 
     def lookup_vpc_by_tag(self, tag: str) -> ec2.Vpc:
         """
@@ -76,4 +135,7 @@ class VpcStack(cfn.NestedStack):
         if props["vpc_exists"] is True:
             return self.lookup_vpc_by_tag(props["vpc_tags"]["Name"])
         else:
-            return self.create_vpc()
+            return self.create_vpc(
+                max_azs=props["vpc"]["max_azs"],
+                nat_gateways=props["vpc"]["nat_gateways"],
+            )
@@ -0,0 +1,110 @@
+from typing import Dict, List
+
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_cloudformation as cfn
+from aws_cdk import aws_events as events
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import core
+
+from aws_gatk_stack.compute_profiles import load_warm_capacity_config
+from aws_gatk_stack.monitoring_substack import (
+    BATCH_METRICS_NAMESPACE,
+    LAMBDA_DIR,
+    LAMBDA_RUNTIME,
+)
+
+
+class WarmCapacityStack(cfn.NestedStack):
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        *,
+        props: Dict,
+        compute_envs: Dict[str, batch.ComputeEnvironment],
+        compute_env_queues: Dict[str, List[str]],
+        job_queues: Dict[str, batch.JobQueue],
+        compute_profiles: Dict[str, Dict],
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        warm_props = load_warm_capacity_config(props, compute_profiles)
+
+        # the settings of every warm compute environment, as read by the function
+        environments = {
+            name: dict(
+                arn=compute_envs[name].compute_environment_arn,
+                queues=[job_queues[q].job_queue_arn for q in compute_env_queues[name]],
+                baseline=compute_profiles[name.rpartition("-")[0]]["minv_cpus"],
+                **warm,
+            )
+            for name, warm in warm_props["compute_environments"].items()
+        }
+        self.create_scheduler_function(
+            environments=environments,
+            interval_minutes=warm_props["interval_minutes"],
+        )
+
+    def create_scheduler_function(
+        self, *, environments: Dict[str, Dict], interval_minutes: int
+    ) -> lambda_.Function:
+        """
+        Create the function that raises and lowers the minvCpus of the warm compute
+        environments, run every interval_minutes
+        :param environments: the settings of the warm compute environments by name
+        :param interval_minutes: the minutes between runs
+        :return: the function
+        """
+        function = lambda_.Function(
+            self,
+            "nf-warm-capacity",
+            runtime=LAMBDA_RUNTIME,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(str(LAMBDA_DIR / "warm_capacity")),
+            timeout=core.Duration.seconds(60),
+            environment=dict(
+                METRICS_NAMESPACE=BATCH_METRICS_NAMESPACE,
+                COMPUTE_ENVIRONMENTS=core.Stack.of(self).to_json_string(environments),
+            ),
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "batch:DescribeComputeEnvironments",
+                    "batch:ListJobs",
+                    "cloudwatch:PutMetricData",
+                ],
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+            )
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["batch:UpdateComputeEnvironment", "batch:TagResource"],
+                effect=iam.Effect.ALLOW,
+                resources=[env["arn"] for env in environments.values()],
+            )
+        )
+
+        rule = events.CfnRule(
+            self,
+            "nf-warm-capacity-schedule",
+            schedule_expression=(
+                "rate(1 minute)"
+                if interval_minutes == 1
+                else f"rate({interval_minutes} minutes)"
+            ),
+            targets=[
+                events.CfnRule.TargetProperty(
+                    arn=function.function_arn, id="warm-capacity"
+                )
+            ],
+        )
+        function.add_permission(
+            "nf-warm-capacity-schedule",
+            principal=iam.ServicePrincipal("events.amazonaws.com"),
+            source_arn=rule.attr_arn,
+        )
+        return function
@@ -38,6 +38,12 @@ fi
 mkdir -p /opt/work/$GUID
 cd /opt/work/$GUID
 
+# a work directory on a shared filesystem mounted from the host, e.g. EFS, is used
+# in place by the tasks instead of staging their files through S3
+if [[ "$NF_WORKDIR" != s3://* ]]; then
+    mkdir -p "$NF_WORKDIR"
+fi
+
 # Create the default config using environment variables
 # passed into the container
 NF_CONFIG=./nextflow.config
@@ -50,21 +56,154 @@ process.queue = "$NF_JOB_QUEUE"
 aws.batch.cliPath = "$AWS_CLI_PATH"
 EOF
 
+# add a config option when its environment variable is set, quoted unless numeric
+function add_config() {
+    local name=$1
+    local value=$2
+    if [ -z "$value" ]; then
+        return
+    fi
+    if [[ "$value" =~ ^[0-9]+$ ]]; then
+        echo "$name = $value" >> $NF_CONFIG
+    else
+        echo "$name = '$value'" >> $NF_CONFIG
+    fi
+}
+
+# throughput tuning, set on the job definitions by the compute stack
+add_config executor.queueSize "$NF_QUEUE_SIZE"
+add_config executor.submitRateLimit "$NF_SUBMIT_RATE_LIMIT"
+add_config executor.pollInterval "$NF_POLL_INTERVAL"
+add_config aws.batch.maxParallelTransfers "$NF_MAX_PARALLEL_TRANSFERS"
+# host paths mounted into every task container, e.g. the instance sized AWS CLI
+# config written at boot
+add_config aws.batch.volumes "$NF_BATCH_VOLUMES"
+add_config aws.client.maxConnections "$NF_MAX_CONNECTIONS"
+add_config aws.client.uploadChunkSize "$NF_UPLOAD_CHUNK_SIZE"
+add_config aws.client.uploadMaxThreads "$NF_UPLOAD_MAX_THREADS"
+
+# retry tasks whose spot instance was reclaimed, instead of failing them
+add_config aws.batch.maxSpotAttempts "$NF_MAX_SPOT_ATTEMPTS"
+
+# NF_PROCESS_QUEUES is a comma separated list of <label>=<queue arn>, so processes
+# can be sent to another queue with e.g. `label 'spot-r5'`
+if [ -n "$NF_PROCESS_QUEUES" ]; then
+    echo "process {" >> $NF_CONFIG
+    for mapping in ${NF_PROCESS_QUEUES//,/ }; do
+        echo "    withLabel: '${mapping%%=*}' { queue = '${mapping#*=}' }" >> $NF_CONFIG
+    done
+    echo "}" >> $NF_CONFIG
+fi
+
+# trace, timeline and report of every run, uploaded by preserve_session to
+# $NF_LOGSDIR/runs/<guid>/ for tools/trace_efficiency.py. the trace is raw, so
+# durations are in ms and memory in bytes
+NF_REPORTS_DIR=./reports
+TRACE_FIELDS=task_id,hash,native_id,process,tag,name,status,exit,attempt,queue,container
+TRACE_FIELDS=$TRACE_FIELDS,cpus,memory,submit,start,complete,duration,realtime
+TRACE_FIELDS=$TRACE_FIELDS,%cpu,%mem,peak_rss,peak_vmem,rchar,wchar,read_bytes,write_bytes
+cat << EOF >> $NF_CONFIG
+trace {
+    enabled = true
+    raw = true
+    file = "$NF_REPORTS_DIR/trace.txt"
+    fields = "$TRACE_FIELDS"
+}
+timeline {
+    enabled = true
+    file = "$NF_REPORTS_DIR/timeline.html"
+}
+report {
+    enabled = true
+    file = "$NF_REPORTS_DIR/report.html"
+}
+EOF
+
 echo "=== CONFIGURATION ==="
 cat ./nextflow.config
 
-# stage in session cache
+# session cache
 # .nextflow directory holds all session information for the current and past runs.
-# it should be `sync`'d with an s3 uri, so that runs from previous sessions can be 
-# resumed
-echo "== Restoring Session Cache =="
-aws s3 sync --no-progress $NF_LOGSDIR/.nextflow .nextflow
+# it is stored as one compressed archive per run, keyed by project and nextflow
+# session id, under
+#   $NF_LOGSDIR/cache/<project>/<session id>/<timestamp>-<run name>.tar.gz
+# a run started with -resume <session id> restores the newest archive of that
+# session only, so concurrent runs of a project never restore each other's cache.
+# NF_CACHE_RETAIN archives are kept per session, older ones are removed.
+NF_CACHE_RETAIN=${NF_CACHE_RETAIN:-5}
+PROJECT_KEY=`echo "$NEXTFLOW_PROJECT" | sed -e 's#^s3://##' -e 's#/*$##' -e 's#[^A-Za-z0-9._-]#_#g'`
+CACHE_PREFIX=$NF_LOGSDIR/cache/$PROJECT_KEY
+SESSION_ID_PATTERN='^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+
+# the run name is taken from -name when given, the batch job otherwise, and the
+# session to restore from -resume <session id>
+RUN_NAME=${GUID/\//.}
+RESUME=false
+RESUME_SESSION=
+set -- $NEXTFLOW_PARAMS
+while [ $# -gt 0 ]; do
+    if [ "$1" = "-name" ] && [ -n "$2" ]; then
+        RUN_NAME=$2
+    fi
+    if [ "$1" = "-resume" ]; then
+        RESUME=true
+        if [[ "$2" =~ $SESSION_ID_PATTERN ]]; then
+            RESUME_SESSION=$2
+        fi
+    fi
+    shift
+done
+
+function restore_session() {
+    if [ "$RESUME" != true ]; then
+        echo "== Skipping Session Cache Restore (no -resume) =="
+        return
+    fi
+    if [ -z "$RESUME_SESSION" ]; then
+        # the newest cache of the project may belong to another, concurrent run
+        echo "== Skipping Session Cache Restore (-resume needs a session id) =="
+        return
+    fi
+
+    echo "== Restoring Session Cache =="
+    local start=`date +%s`
+    local prefix=$CACHE_PREFIX/$RESUME_SESSION
+    local archive=`aws s3 ls $prefix/ | awk '{print $4}' | grep '\.tar\.gz$' | sort | tail -n 1`
+    if [ -z "$archive" ]; then
+        echo "no session cache found under $prefix"
+        return
+    fi
+
+    aws s3 cp --no-progress $prefix/$archive - | tar -xzf -
+    echo "restored $archive in $((`date +%s` - start))s"
+}
+
+function preserve_session_cache() {
+    # the session id of this run is in the last record of the history
+    local session=`tail -n 1 .nextflow/history 2>/dev/null | cut -f 6`
+    if [[ ! "$session" =~ $SESSION_ID_PATTERN ]]; then
+        echo "no session id in .nextflow/history, the session cache is not preserved"
+        return
+    fi
+
+    echo "== Preserving Session Cache =="
+    local start=`date +%s`
+    local prefix=$CACHE_PREFIX/$session
+    local archive=`date -u +%Y%m%dT%H%M%SZ`-$RUN_NAME.tar.gz
+    tar -czf - .nextflow | aws s3 cp --no-progress - $prefix/$archive
+    echo "preserved $archive in $((`date +%s` - start))s, resume with -resume $session"
+
+    # evict all but the newest NF_CACHE_RETAIN archives of this session
+    aws s3 ls $prefix/ | awk '{print $4}' | grep '\.tar\.gz$' | sort -r \
+        | tail -n +$((NF_CACHE_RETAIN + 1)) | while read expired; do
+            aws s3 rm --quiet $prefix/$expired
+        done
+}
 
 function preserve_session() {
     # stage out session cache
     if [ -d .nextflow ]; then
-        echo "== Preserving Session Cache =="
-        aws s3 sync --no-progress .nextflow $NF_LOGSDIR/.nextflow
+        preserve_session_cache
     fi
 
     # .nextflow.log file has more detailed logging from the workflow run and is
@@ -76,8 +215,15 @@ function preserve_session() {
         echo "== Preserving Session Log =="
         aws s3 cp --no-progress .nextflow.log $NF_LOGSDIR/.nextflow.log.${GUID/\//.}
     fi
+
+    if [ -d $NF_REPORTS_DIR ]; then
+        echo "== Preserving Trace, Timeline and Report =="
+        aws s3 sync --no-progress $NF_REPORTS_DIR $NF_LOGSDIR/runs/${GUID/\//.}
+    fi
 }
 
+restore_session
+
 function show_log() {
     echo "=== Nextflow Log ==="
     cat ./.nextflow.log
@@ -111,10 +257,54 @@ trap "cancel" TERM
 trap "cleanup" EXIT
 
 # stage workflow definition
+# S3 projects are staged once per host into NF_PROJECT_CACHE, keyed by a hash of
+# the key/ETag manifest of the project, and then shared by every head job on the
+# instance. Without a cache directory the project is synced into ./project
+function stage_project() {
+    local uri=${NEXTFLOW_PROJECT%/}
+    local start=`date +%s`
+
+    if [ -z "$NF_PROJECT_CACHE" ] || [ ! -w "$NF_PROJECT_CACHE" ]; then
+        aws s3 sync --no-progress --exclude 'runs/*' --exclude '.*' $uri ./project
+        NEXTFLOW_PROJECT=./project
+        echo "synced $uri in $((`date +%s` - start))s"
+        return
+    fi
+
+    local bucket=`echo $uri | cut -d / -f 3`
+    local prefix=`echo $uri | cut -d / -f 4-`
+    if [ -n "$prefix" ]; then
+        prefix="$prefix/"
+    fi
+
+    # same files as the sync below: everything but runs/ and hidden files
+    local manifest_hash=`aws s3api list-objects-v2 --bucket $bucket --prefix "$prefix" \
+        --query 'Contents[].[Key,ETag]' --output text \
+        | cut -c $((${#prefix} + 1))- | grep -v -e '^runs/' -e '^\.' | sort \
+        | sha256sum | cut -d ' ' -f 1`
+    local cached=$NF_PROJECT_CACHE/$manifest_hash
+
+    if [ -f $cached/.complete ]; then
+        echo "using cached project $cached"
+    else
+        # stage into a private directory first, so that concurrent head jobs never
+        # see a partial project, then publish it read-only. when another job
+        # published the same manifest first its copy is kept
+        local staging=$cached.${GUID/\//.}
+        aws s3 sync --no-progress --exclude 'runs/*' --exclude '.*' $uri $staging
+        touch $staging/.complete
+        chmod -R a-w $staging
+        mv -T $staging $cached 2>/dev/null || rm -rf $staging
+        echo "cached project $cached"
+    fi
+
+    NEXTFLOW_PROJECT=$cached
+    echo "staged $uri in $((`date +%s` - start))s"
+}
+
 if [[ "$NEXTFLOW_PROJECT" =~ ^s3://.* ]]; then
     echo "== Staging S3 Project =="
-    aws s3 sync --no-progress --exclude 'runs/*' --exclude '.*' $NEXTFLOW_PROJECT ./project
-    NEXTFLOW_PROJECT=./project
+    stage_project
 fi
 
 echo "== Running Workflow =="
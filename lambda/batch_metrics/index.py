@@ -0,0 +1,78 @@
+"""
+Publish the state of the nextflow Batch queues as CloudWatch metrics.
+
+Every minute the number of RUNNABLE and RUNNING jobs, and the age of the oldest
+RUNNABLE job, are put for each queue. Batch job state change events of attempts
+that ended because their host went away (e.g. a reclaimed spot instance) are
+counted as spot interruptions of the job's queue.
+
+JOB_QUEUES maps the queue names of props.json to queue ARNs, as
+<name>=<arn>,<name>=<arn>,...
+"""
+import os
+import time
+
+import boto3
+
+NAMESPACE = os.environ["METRICS_NAMESPACE"]
+JOB_QUEUES = dict(x.split("=", 1) for x in os.environ["JOB_QUEUES"].split(","))
+QUEUE_NAMES = {arn: name for name, arn in JOB_QUEUES.items()}
+HOST_STATUS_REASON = "Host EC2"
+
+batch = boto3.client("batch")
+cloudwatch = boto3.client("cloudwatch")
+
+
+def list_jobs(queue: str, status: str) -> list:
+    jobs = []
+    paginator = batch.get_paginator("list_jobs")
+    for page in paginator.paginate(jobQueue=queue, jobStatus=status):
+        jobs += page["jobSummaryList"]
+    return jobs
+
+
+def metric(name: str, queue: str, value: float, unit: str) -> dict:
+    return dict(
+        MetricName=name,
+        Dimensions=[dict(Name="JobQueue", Value=queue)],
+        Value=value,
+        Unit=unit,
+    )
+
+
+def queue_metrics() -> list:
+    now = time.time() * 1000
+    metrics = []
+    for name, arn in JOB_QUEUES.items():
+        runnable = list_jobs(arn, "RUNNABLE")
+        running = list_jobs(arn, "RUNNING")
+        oldest = max([now - job["createdAt"] for job in runnable], default=0)
+        metrics += [
+            metric("RunnableJobs", name, len(runnable), "Count"),
+            metric("RunningJobs", name, len(running), "Count"),
+            metric("OldestRunnableSeconds", name, oldest / 1000, "Seconds"),
+        ]
+    return metrics
+
+
+def interruption_metrics(detail: dict) -> list:
+    attempts = detail.get("attempts", [])
+    name = QUEUE_NAMES.get(detail.get("jobQueue"))
+    if not attempts or name is None:
+        return []
+    reason = attempts[-1].get("statusReason", "")
+    if not reason.startswith(HOST_STATUS_REASON):
+        return []
+    return [metric("SpotInterruptions", name, 1, "Count")]
+
+
+def handler(event, context):
+    if event.get("detail-type") == "Batch Job State Change":
+        metrics = interruption_metrics(event["detail"])
+    else:
+        metrics = queue_metrics()
+
+    # put_metric_data takes at most 20 metrics per call
+    for i in range(0, len(metrics), 20):
+        cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=metrics[i : i + 20])
+    return dict(metrics=len(metrics))
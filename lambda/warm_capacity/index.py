@@ -0,0 +1,159 @@
+"""
+Hold warm capacity in the nextflow Batch compute environments.
+
+Every run the minvCpus of each configured compute environment is raised to its
+warm minv_cpus while one of its windows (UTC) is open, or while its queues have at
+least runnable_jobs RUNNABLE jobs and for hold_minutes after. Otherwise it is
+lowered back to the baseline of its compute profile. The end of the hold is kept
+in the nf-warm-until tag of the compute environment, and the vCPUs held above
+the baseline are put as the WarmVCpus metric.
+
+COMPUTE_ENVIRONMENTS is a JSON object of the compute environments keyed by name:
+{"arn": ..., "queues": [<queue arn>, ...], "baseline": <minvCpus>,
+ "minv_cpus": ..., "windows": [...], "runnable_jobs": ..., "hold_minutes": ...}
+
+Run locally to see the plan for a given time and state, without AWS calls:
+python lambda/warm_capacity/index.py --config config.json --state state.json \
+    --now 2026-10-19T09:00
+where the state has {"<name>": {"minv_cpus": ..., "runnable_jobs": ...,
+"warm_until": <epoch seconds>}}
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import boto3
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "NfGatk/Batch")
+COMPUTE_ENVIRONMENTS = json.loads(os.environ.get("COMPUTE_ENVIRONMENTS", "{}"))
+WARM_UNTIL_TAG = "nf-warm-until"
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+
+
+def in_window(windows: List[Dict], now: datetime) -> bool:
+    day = WEEKDAYS[now.weekday()]
+    hour = now.hour + now.minute / 60
+    return any(
+        day in w["days"] and w["start_hour"] <= hour < w["end_hour"] for w in windows
+    )
+
+
+def plan(environments: Dict[str, Dict], state: Dict[str, Dict], now: datetime) -> Dict:
+    """
+    Decide the minvCpus of every compute environment
+    :param environments: the configured compute environments keyed by name
+    :param state: the current minv_cpus, runnable_jobs and warm_until by name
+    :param now: the current time, in UTC
+    :return: the minv_cpus, warm_until and reason of each compute environment
+    """
+    epoch = now.timestamp()
+    decisions = {}
+    for name, env in environments.items():
+        current = state[name]
+        warm_until = current.get("warm_until", 0)
+        threshold = env.get("runnable_jobs", 0)
+        reason = None
+        if in_window(env.get("windows", []), now):
+            reason = "window"
+        if threshold and current["runnable_jobs"] >= threshold:
+            warm_until = epoch + env.get("hold_minutes", 0) * 60
+            reason = reason or "queue depth"
+        elif reason is None and epoch < warm_until:
+            reason = "hold"
+        decisions[name] = dict(
+            minv_cpus=env["minv_cpus"] if reason else env["baseline"],
+            current=current["minv_cpus"],
+            warm_until=warm_until,
+            reason=reason or "baseline",
+        )
+    return decisions
+
+
+def count_runnable(batch, queues: List[str]) -> int:
+    count = 0
+    for queue in queues:
+        paginator = batch.get_paginator("list_jobs")
+        for page in paginator.paginate(jobQueue=queue, jobStatus="RUNNABLE"):
+            count += len(page["jobSummaryList"])
+    return count
+
+
+def read_state(batch, environments: Dict[str, Dict]) -> Dict[str, Dict]:
+    arns = {env["arn"]: name for name, env in environments.items()}
+    described = batch.describe_compute_environments(computeEnvironments=list(arns))
+    state = {}
+    for ce in described["computeEnvironments"]:
+        name = arns[ce["computeEnvironmentArn"]]
+        state[name] = dict(
+            minv_cpus=ce["computeResources"]["minvCpus"],
+            runnable_jobs=count_runnable(batch, environments[name]["queues"]),
+            warm_until=float(ce.get("tags", {}).get(WARM_UNTIL_TAG, 0)),
+        )
+    return state
+
+
+def apply(
+    batch, cloudwatch, environments: Dict[str, Dict], state: Dict, decisions: Dict
+) -> None:
+    metrics = []
+    for name, decision in decisions.items():
+        arn = environments[name]["arn"]
+        if decision["minv_cpus"] != decision["current"]:
+            try:
+                batch.update_compute_environment(
+                    computeEnvironment=arn,
+                    computeResources=dict(minvCpus=decision["minv_cpus"]),
+                )
+            except batch.exceptions.ClientException as e:
+                # e.g. still UPDATING from the previous run, retried on the next one
+                print(f"{name}: {e}")
+                decision["minv_cpus"] = decision["current"]
+        if decision["warm_until"] != state[name]["warm_until"]:
+            batch.tag_resource(
+                resourceArn=arn,
+                tags={WARM_UNTIL_TAG: str(int(decision["warm_until"]))},
+            )
+        metrics.append(
+            dict(
+                MetricName="WarmVCpus",
+                Dimensions=[dict(Name="ComputeEnvironment", Value=name)],
+                Value=decision["minv_cpus"] - environments[name]["baseline"],
+                Unit="Count",
+            )
+        )
+    # put_metric_data takes at most 20 metrics per call
+    for i in range(0, len(metrics), 20):
+        cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=metrics[i : i + 20])
+
+
+def handler(event, context):
+    batch = boto3.client("batch")
+    cloudwatch = boto3.client("cloudwatch")
+    state = read_state(batch, COMPUTE_ENVIRONMENTS)
+    decisions = plan(COMPUTE_ENVIRONMENTS, state, datetime.now(timezone.utc))
+    apply(batch, cloudwatch, COMPUTE_ENVIRONMENTS, state, decisions)
+    print(json.dumps(decisions))
+    return decisions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", required=True, help="COMPUTE_ENVIRONMENTS json")
+    parser.add_argument("--state", required=True, help="current state json")
+    parser.add_argument("--now", help="UTC time, e.g. 2026-10-19T09:00 (default now)")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        environments = json.load(f)
+    with open(args.state) as f:
+        state = json.load(f)
+    now = datetime.now(timezone.utc)
+    if args.now:
+        now = datetime.fromisoformat(args.now).replace(tzinfo=timezone.utc)
+    print(json.dumps(plan(environments, state, now), indent=2))
+
+
+if __name__ == "__main__":
+    main()
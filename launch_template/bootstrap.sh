@@ -0,0 +1,19 @@
+#!/bin/bash
+# Batch host bootstrap. The phases in launch_template/phases are appended to this
+# script at synth time, and each phase is timed into $BOOTSTRAP_LOG together with
+# the host uptime, so time-to-ready can be measured per host.
+BOOTSTRAP_LOG=/var/log/nf-bootstrap.log
+export AWS_DEFAULT_REGION=$AWS_REGION
+export scratchPath=/var/lib/docker
+
+function run_phase() {
+    local phase=$1
+    local start=$(date +%s.%N)
+    echo "$(date -u +%FT%TZ) phase=$phase status=started" >> $BOOTSTRAP_LOG
+    $phase >> $BOOTSTRAP_LOG 2>&1
+    local status=$?
+    local end=$(date +%s.%N)
+    local seconds=$(awk "BEGIN {print $end - $start}")
+    local uptime=$(cut -d " " -f 1 /proc/uptime)
+    echo "$(date -u +%FT%TZ) phase=$phase status=$status seconds=$seconds uptime=$uptime" >> $BOOTSTRAP_LOG
+}
@@ -0,0 +1,42 @@
+# Write the AWS CLI config of the job containers to /opt/aws-cli/config, sized to
+# the vCPUs and network bandwidth of this instance. Containers see it as
+# /root/.aws/config, so the s3 transfers of tasks use the whole network link
+function configure_awscli() {
+    local vcpus=$(nproc)
+    local token=$(curl -s -X PUT http://169.254.169.254/latest/api/token \
+        -H "X-aws-ec2-metadata-token-ttl-seconds: 60")
+    local instance_type=$(curl -s -H "X-aws-ec2-metadata-token: $token" \
+        http://169.254.169.254/latest/meta-data/instance-type)
+    # e.g. "Up to 25 Gigabit" or "100 Gigabit", older types only say "High"
+    local network=$(aws ec2 describe-instance-types \
+        --instance-types $instance_type \
+        --query 'InstanceTypes[0].NetworkInfo.NetworkPerformance' --output text)
+    local gbps=$(echo "$network" | grep -oE '^(Up to )?[0-9.]+ Gigabit' \
+        | grep -oE '[0-9.]+')
+
+    local requests=$(awk -v v=$vcpus -v g=${gbps:-0} 'BEGIN {
+        r = v * $S3_REQUESTS_PER_VCPU
+        if (g * $S3_REQUESTS_PER_GBPS > r) r = g * $S3_REQUESTS_PER_GBPS
+        if (r > $S3_MAX_CONCURRENT_REQUESTS) r = $S3_MAX_CONCURRENT_REQUESTS
+        if (r < 10) r = 10
+        printf "%d", r
+    }')
+
+    mkdir -p /opt/aws-cli
+    cat > /opt/aws-cli/config << CONFIG
+[default]
+region = $AWS_REGION
+s3 =
+    preferred_transfer_client = $S3_TRANSFER_CLIENT
+    max_concurrent_requests = $requests
+    max_queue_size = $((requests * 10))
+    multipart_chunksize = $S3_MULTIPART_CHUNKSIZE
+    multipart_threshold = $S3_MULTIPART_THRESHOLD
+CONFIG
+    # the CRT client sizes its connections by target_bandwidth instead
+    if [ -n "$gbps" ]; then
+        echo "    target_bandwidth = ${gbps}Gb/s" >> /opt/aws-cli/config
+    fi
+    chmod 644 /opt/aws-cli/config
+    echo "instance_type=$instance_type vcpus=$vcpus network=\"$network\" requests=$requests"
+}
@@ -0,0 +1,8 @@
+# ECS agent options from props.json, e.g. prefer the images already pulled by
+# prewarm_images and keep stopped task containers around for longer
+function configure_ecs() {
+    mkdir -p /etc/ecs
+    cat >> /etc/ecs/ecs.config << 'CONFIG'
+$ECS_AGENT_CONFIG
+CONFIG
+}
@@ -0,0 +1,11 @@
+# Install the pinned AWS CLI v2 bundle shipped as an S3 asset, fetched through the
+# S3 gateway endpoint, and copy it to /opt/aws-cli for mounting into containers
+function install_awscli() {
+    command -v aws || yum install -y awscli
+    aws s3 cp --no-progress $AWSCLI_ASSET_URL /tmp/awscliv2.zip
+    unzip -q -o /tmp/awscliv2.zip -d /tmp
+    /tmp/aws/install -b /usr/local/bin --update
+    mkdir -p /opt/aws-cli/bin
+    cp -a $(dirname $(find /usr/local/aws-cli -name 'aws' -type f))/. /opt/aws-cli/bin/
+    rm -rf /tmp/aws /tmp/awscliv2.zip
+}
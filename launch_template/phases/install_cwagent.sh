@@ -0,0 +1,11 @@
+# Publish memory and disk usage, and ship the bootstrap and amazon-ebs-autoscale
+# logs, with the CloudWatch agent
+function install_cwagent() {
+    local config=/opt/aws/amazon-cloudwatch-agent/etc/amazon-cloudwatch-agent.json
+    yum install -y amazon-cloudwatch-agent
+    cat > $config << 'CONFIG'
+$CWAGENT_CONFIG
+CONFIG
+    /opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl \
+        -a fetch-config -m ec2 -s -c file:$config
+}
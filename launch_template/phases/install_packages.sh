@@ -0,0 +1,4 @@
+function install_packages() {
+    yum install -y jq sed unzip amazon-ssm-agent
+    systemctl enable --now amazon-ssm-agent
+}
@@ -0,0 +1,8 @@
+# Mount the EFS filesystem of the shared nextflow work directory over TLS
+function mount_efs() {
+    yum install -y amazon-efs-utils
+    mkdir -p $EFS_MOUNT_PATH
+    echo "$EFS_FILE_SYSTEM_ID:/ $EFS_MOUNT_PATH efs _netdev,noresvport,tls 0 0" >> /etc/fstab
+    mount $EFS_MOUNT_PATH
+    mkdir -p $EFS_MOUNT_PATH/work
+}
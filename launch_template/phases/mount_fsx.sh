@@ -0,0 +1,7 @@
+# Mount the FSx for Lustre filesystem linked to the reference bucket
+function mount_fsx() {
+    amazon-linux-extras install -y lustre2.10
+    mkdir -p $FSX_MOUNT_PATH
+    echo "$FSX_DNS_NAME@tcp:/$FSX_MOUNT_NAME $FSX_MOUNT_PATH lustre defaults,noatime,flock,_netdev 0 0" >> /etc/fstab
+    mount $FSX_MOUNT_PATH
+}
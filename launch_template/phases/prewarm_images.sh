@@ -0,0 +1,31 @@
+# Pull the images of the first tasks in parallel while the host registers with ECS.
+# The pulls run in the background, cloud-final does not kill its children, and the
+# duration of each pull is logged. Tasks that start before a pull finishes share its
+# layer downloads in the docker daemon
+function prewarm_images() {
+    if [ -z "$PREWARM_IMAGES" ]; then
+        return
+    fi
+    systemctl start docker
+
+    local registries=$(for image in $PREWARM_IMAGES; do echo ${image%%/*}; done | sort -u)
+    for registry in $registries; do
+        aws ecr get-login-password | docker login --username AWS --password-stdin $registry
+    done
+
+    (
+        for image in $PREWARM_IMAGES; do
+            (
+                start=$(date +%s)
+                docker pull --quiet $image > /dev/null
+                status=$?
+                uptime=$(cut -d " " -f 1 /proc/uptime)
+                echo "$(date -u +%FT%TZ) image=$image status=$status seconds=$(($(date +%s) - start)) uptime=$uptime"
+            ) &
+        done
+        wait
+        for registry in $registries; do
+            docker logout $registry
+        done
+    ) < /dev/null >> $BOOTSTRAP_LOG 2>&1 &
+}
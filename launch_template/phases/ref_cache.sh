@@ -0,0 +1,135 @@
+# Populate the host reference cache at $REF_CACHE_PATH, which job containers mount
+# read-only, from the manifest at $REF_CACHE_SOURCE$REF_CACHE_MANIFEST. The cache
+# lives on the scratch volume, files are verified against their S3 ETag, and the
+# least recently used files are evicted when scratch runs low
+function ref_cache() {
+    mkdir -p $scratchPath/nf-ref-cache $REF_CACHE_PATH
+    mount --bind $scratchPath/nf-ref-cache $REF_CACHE_PATH
+    # files are evicted by access time, which the noatime (nvme) or relatime (ebs)
+    # scratch volume barely updates. the bind mount records every read instead, and
+    # the read-only mounts of the job containers are bind mounts of it that keep
+    # its atime option
+    mount -o remount,bind,strictatime $REF_CACHE_PATH
+
+    cat > /usr/local/bin/nf-ref-cache << 'SCRIPT'
+#!/bin/bash
+# usage: nf-ref-cache sync|evict [GIB]
+cache=$REF_CACHE_PATH
+etags=$cache/.etags
+source=$REF_CACHE_SOURCE
+source=${source%/}
+bucket=${source#s3://}
+bucket=${bucket%%/*}
+prefix=${source#s3://$bucket}
+prefix=${prefix#/}
+prefix=${prefix:+$prefix/}
+[ -f /opt/aws-cli/config ] && export AWS_CONFIG_FILE=/opt/aws-cli/config
+
+function avail_gib() {
+    df -BG --output=avail $cache | tail -1 | tr -dc 0-9
+}
+
+function used_gib() {
+    du -s -BG $cache | cut -f 1 | tr -dc 0-9
+}
+
+# evict by access time until scratch has min_free_gib (plus room for a download)
+# free, and the cache is within max_size_gib
+function evict() {
+    local needed=$(($REF_CACHE_MIN_FREE_GIB + ${1:-0}))
+    exec 9> /var/lock/nf-ref-cache
+    flock 9
+    find $cache -path $etags -prune -o -type f ! -name '*.tmp' -printf '%A@ %P\n' \
+        | sort -n \
+        | while read -r atime key; do
+            if [ $(avail_gib) -ge $needed ] \
+                && [ $(used_gib) -le $REF_CACHE_MAX_SIZE_GIB ]; then
+                break
+            fi
+            rm -f "$cache/$key" "$etags/$key"
+            echo "$(date -u +%FT%TZ) ref_cache evicted $key"
+        done
+    flock -u 9
+}
+
+# download a key of the manifest unless the cached copy has the current ETag
+function fetch() {
+    local key=$1
+    local head
+    head=$(aws s3api head-object --bucket $bucket --key "$prefix$key" \
+        --query '[ETag,ContentLength]' --output text) || return 1
+    local etag=$(echo "$head" | cut -f 1 | tr -d '"')
+    local size=$(echo "$head" | cut -f 2)
+    if [ -f "$cache/$key" ] && [ "$(cat "$etags/$key" 2> /dev/null)" = "$etag" ]; then
+        echo cached
+        return 0
+    fi
+
+    evict $(((size >> 30) + 1)) >&2
+    mkdir -p "$(dirname "$cache/$key")" "$(dirname "$etags/$key")"
+    local tmp="$cache/$key.tmp"
+    aws s3 cp --no-progress --only-show-errors "$source/$key" "$tmp" || {
+        rm -f "$tmp"
+        return 1
+    }
+    # single part ETags are the MD5 of the object, multipart ones are only checked
+    # by size
+    if [ "$(stat -c %s "$tmp")" != "$size" ] || {
+        [[ $etag != *-* ]] && [ "$(md5sum < "$tmp" | cut -d " " -f 1)" != "$etag" ]
+    }; then
+        rm -f "$tmp"
+        echo mismatch
+        return 1
+    fi
+    chmod a-w "$tmp"
+    mv -f "$tmp" "$cache/$key"
+    echo "$etag" > "$etags/$key"
+    echo fetched
+}
+
+function sync() {
+    local manifest
+    manifest=$(aws s3 cp --only-show-errors "$source/$REF_CACHE_MANIFEST" -) || {
+        echo "$(date -u +%FT%TZ) ref_cache no manifest at $source/$REF_CACHE_MANIFEST"
+        return
+    }
+    echo "$manifest" | sed -e 's/#.*//' -e 's/[[:space:]]*$//' | grep -v '^$' \
+        | while read -r key; do
+            local start=$(date +%s)
+            local result=$(fetch "$key")
+            local uptime=$(cut -d " " -f 1 /proc/uptime)
+            echo "$(date -u +%FT%TZ) ref_cache key=$key result=${result:-failed} seconds=$(($(date +%s) - start)) uptime=$uptime"
+        done
+}
+
+case "$1" in
+    sync) sync ;;
+    evict) evict "$2" ;;
+    *) echo "usage: nf-ref-cache sync|evict [GIB]" >&2; exit 1 ;;
+esac
+SCRIPT
+    chmod 755 /usr/local/bin/nf-ref-cache
+
+    # evict every five minutes, as task outputs fill the scratch volume
+    cat > /etc/systemd/system/nf-ref-cache-evict.service << 'UNIT'
+[Unit]
+Description=Evict least recently used reference files
+
+[Service]
+Type=oneshot
+ExecStart=/bin/sh -c "/usr/local/bin/nf-ref-cache evict >> /var/log/nf-bootstrap.log 2>&1"
+UNIT
+    cat > /etc/systemd/system/nf-ref-cache-evict.timer << 'UNIT'
+[Timer]
+OnBootSec=5min
+OnUnitActiveSec=5min
+
+[Install]
+WantedBy=timers.target
+UNIT
+    systemctl daemon-reload
+    systemctl enable --now nf-ref-cache-evict.timer
+
+    # the references are downloaded while the host registers with ECS
+    nohup /usr/local/bin/nf-ref-cache sync < /dev/null >> $BOOTSTRAP_LOG 2>&1 &
+}
@@ -0,0 +1,15 @@
+# Put /var/lib/docker on btrfs over EBS volumes grown by the pinned
+# amazon-ebs-autoscale release shipped as an S3 asset
+function scratch_ebs() {
+    yum install -y btrfs-progs lvm2
+    systemctl stop ecs
+    systemctl stop docker
+    cp -au /var/lib/docker /var/lib/docker.bk
+    rm -rf /var/lib/docker/*
+    aws s3 cp --no-progress $EBS_AUTOSCALE_ASSET_URL /tmp/amazon-ebs-autoscale.zip
+    unzip -q -o /tmp/amazon-ebs-autoscale.zip -d /opt/amazon-ebs-autoscale
+    sh /opt/amazon-ebs-autoscale/install.sh -m $scratchPath -d /dev/sdc $EBS_AUTOSCALE_OPTIONS > /var/log/ebs-autoscale-install.log 2>&1
+    sed -i 's+OPTIONS=.*+OPTIONS="--storage-driver btrfs"+g' /etc/sysconfig/docker-storage
+    cp -au /var/lib/docker.bk/* /var/lib/docker
+    systemctl start docker
+}
@@ -0,0 +1,29 @@
+# Put /var/lib/docker on xfs over a RAID0 of the local NVMe instance-store disks
+function scratch_nvme() {
+    yum install -y mdadm xfsprogs
+    systemctl stop ecs
+    systemctl stop docker
+    cp -au /var/lib/docker /var/lib/docker.bk
+    rm -rf /var/lib/docker/*
+    local devices=$(lsblk -d -n -p -o NAME,MODEL | awk '/Instance Storage/ {print $1}')
+    local count=$(echo $devices | wc -w)
+    if [ $count -eq 0 ]; then
+        # not an instance store family, keep docker on the root volume. The phase
+        # fails in the bootstrap log, and the next phases still start ECS
+        cp -au /var/lib/docker.bk/* /var/lib/docker
+        systemctl start docker
+        echo "scratch_nvme: no NVMe instance store devices found" >&2
+        return 1
+    fi
+    local device=$devices
+    if [ $count -gt 1 ]; then
+        mdadm --create /dev/md0 --level=0 --raid-devices=$count --run --force $devices
+        device=/dev/md0
+    fi
+    mkfs.xfs -f $device
+    mount -o defaults,noatime $device $scratchPath
+    echo "$device $scratchPath xfs defaults,noatime,nofail 0 2" >> /etc/fstab
+    sed -i 's+OPTIONS=.*+OPTIONS="--storage-driver overlay2"+g' /etc/sysconfig/docker-storage
+    cp -au /var/lib/docker.bk/* /var/lib/docker
+    systemctl start docker
+}
@@ -0,0 +1,4 @@
+# ecs is ordered after cloud-init, so it must not be waited for here
+function start_ecs() {
+    systemctl enable --now --no-block ecs
+}
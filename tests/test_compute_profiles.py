@@ -0,0 +1,243 @@
+import pytest
+
+from aws_gatk_stack.compute_profiles import (
+    MAX_QUEUE_COMPUTE_ENVIRONMENTS,
+    load_compute_profiles,
+    load_head_fargate_config,
+    load_job_queues,
+    validate_compute_profile,
+)
+
+IMAGES = dict(x86_64=["gatk", "gotc", "gatk-joint"], arm64=["gatk"])
+
+
+def profiles(**compute_profiles):
+    return load_compute_profiles(dict(compute_profiles=compute_profiles), IMAGES)
+
+
+def test_profile_defaults():
+    profile = validate_compute_profile("m5", {}, IMAGES)
+    assert profile["families"] == ["m5"]
+    assert profile["architecture"] == "x86_64"
+    assert profile["scratch"] == "ebs"
+    assert profile["purchase"] == ["spot", "on_demand"]
+    assert profile["prewarm_images"] == ["gatk", "gotc", "gatk-joint"]
+    assert profile["instance_types"][0] == "m5.large"
+    assert profile["allocation_strategy"] == dict(
+        spot="SPOT_CAPACITY_OPTIMIZED", on_demand="BEST_FIT_PROGRESSIVE"
+    )
+    assert profile["volumes"]["docker"]["size"] == 75
+
+
+@pytest.mark.parametrize(
+    "name, profile, expected",
+    [
+        ("m5", dict(sizes=[]), dict(instance_types=["m5"])),
+        (
+            "memory",
+            dict(families=["r5", "r5d"], sizes=["4xlarge"]),
+            dict(instance_types=["r5.4xlarge", "r5d.4xlarge"]),
+        ),
+        (
+            "graviton",
+            dict(architecture="arm64", families=["m6g", "c6gd"], sizes=[]),
+            dict(instance_types=["m6g", "c6gd"], prewarm_images=["gatk"]),
+        ),
+        ("m5d", dict(scratch="nvme", sizes=[]), dict(scratch="nvme")),
+        ("i3", dict(scratch="nvme", sizes=[]), dict(scratch="nvme")),
+        ("m5", dict(prewarm_images=[]), dict(prewarm_images=[])),
+        ("m5", dict(purchase=["spot"]), dict(purchase=["spot"])),
+        ("m5", dict(minv_cpus=16, maxv_cpus=16), dict(minv_cpus=16)),
+        (
+            "m5",
+            dict(allocation_strategy=dict(spot="BEST_FIT")),
+            dict(
+                allocation_strategy=dict(
+                    spot="BEST_FIT", on_demand="BEST_FIT_PROGRESSIVE"
+                )
+            ),
+        ),
+        ("m5", dict(bid_percentage=60), dict(bid_percentage=60)),
+    ],
+)
+def test_valid_profile(name, profile, expected):
+    profile = validate_compute_profile(name, profile, IMAGES)
+    for key, value in expected.items():
+        assert profile[key] == value
+
+
+@pytest.mark.parametrize(
+    "name, profile, message",
+    [
+        ("M5", {}, "profile names must be lower case"),
+        ("m5", dict(instance_types=["m5.large"]), "unknown settings"),
+        ("m5", dict(architecture="riscv"), "architecture must be one of"),
+        ("m6g", {}, "families ['m6g'] are not x86_64"),
+        ("m5", dict(architecture="arm64"), "families ['m5'] are not arm64"),
+        ("m5", dict(families=[]), "at least one instance family"),
+        ("m5", dict(families="m5"), "families must be a list"),
+        ("m5", dict(sizes=["4XL"]), "invalid instance family or size"),
+        ("m5", dict(scratch="tmpfs"), "unknown scratch type"),
+        ("m5", dict(scratch="nvme"), "nvme scratch needs instance store"),
+        (
+            "mixed",
+            dict(families=["m5d", "r5"], scratch="nvme"),
+            "['r5'] have none",
+        ),
+        ("m5", dict(volumes=dict(swap={})), "unknown volumes"),
+        ("m5", dict(volumes=dict(root=dict(type="sc1"))), "volume root has type"),
+        ("m5", dict(volumes=dict(docker=dict(size=0))), "must be a positive int"),
+        ("m5", dict(prewarm_images=["nextflow"]), "prewarm_images must be a list"),
+        (
+            "graviton",
+            dict(architecture="arm64", families=["m6g"], prewarm_images=["gotc"]),
+            "prewarm_images must be a list",
+        ),
+        ("m5", dict(purchase=[]), "purchase must be a non empty list"),
+        ("m5", dict(purchase=["reserved"]), "purchase must be a non empty list"),
+        ("m5", dict(maxv_cpus=-1), "maxv_cpus must be a non negative int"),
+        ("m5", dict(minv_cpus=32, maxv_cpus=16), "minv_cpus is larger"),
+        (
+            "m5",
+            dict(allocation_strategy=dict(on_demand="SPOT_CAPACITY_OPTIMIZED")),
+            "invalid on_demand allocation strategy",
+        ),
+        ("m5", dict(bid_percentage=0), "bid_percentage must be an int"),
+        ("m5", dict(bid_percentage=101), "bid_percentage must be an int"),
+    ],
+)
+def test_invalid_profile(name, profile, message):
+    with pytest.raises(ValueError) as e:
+        validate_compute_profile(name, profile, IMAGES)
+    assert message in str(e.value)
+
+
+def test_load_compute_profiles():
+    loaded = profiles(m5={}, r5=dict(purchase=["on_demand"]))
+    assert list(loaded) == ["m5", "r5"]
+    assert loaded["r5"]["instance_types"][0] == "r5.large"
+
+
+def test_load_compute_profiles_requires_a_profile():
+    with pytest.raises(ValueError, match="at least one compute profile"):
+        profiles()
+
+
+def test_load_compute_profiles_names_the_invalid_profile():
+    with pytest.raises(ValueError, match="^c5: unknown scratch type"):
+        profiles(m5={}, c5=dict(scratch="tmpfs"))
+
+
+def test_default_queues():
+    queues = load_job_queues(
+        dict(job_queues={}), profiles(m5={}, r5=dict(purchase=["on_demand"]))
+    )
+    assert queues == {
+        "spot-m5": dict(priority=1, compute_environments=["m5-spot"]),
+        "on_demand-m5": dict(priority=100, compute_environments=["m5-on_demand"]),
+        "on_demand-r5": dict(priority=100, compute_environments=["r5-on_demand"]),
+    }
+
+
+def test_spill_over_queue():
+    job_queues = dict(
+        general=dict(
+            priority=10,
+            compute_environments=["m5-spot", "c5-spot", "m5-on_demand"],
+        )
+    )
+    queues = load_job_queues(dict(job_queues=job_queues), profiles(m5={}, c5={}))
+    assert queues == job_queues
+
+
+GRAVITON = dict(architecture="arm64", families=["m6g"])
+
+
+@pytest.mark.parametrize(
+    "name, queue, message",
+    [
+        ("General", dict(priority=1), "queue names must be lower case"),
+        ("on_demand-head", dict(priority=1), "on_demand-head is reserved"),
+        ("general", dict(priority=1, order=[]), "unknown settings"),
+        ("general", dict(compute_environments=["m5-spot"]), "priority must be"),
+        (
+            "general",
+            dict(priority=1001, compute_environments=["m5-spot"]),
+            "priority must be",
+        ),
+        ("general", dict(priority=1, compute_environments=[]), "distinct compute"),
+        (
+            "general",
+            dict(priority=1, compute_environments=["m5-spot", "m5-spot"]),
+            "distinct compute",
+        ),
+        (
+            "general",
+            dict(
+                priority=1,
+                compute_environments=[
+                    "m5-spot",
+                    "c5-spot",
+                    "m5-on_demand",
+                    "c5-on_demand",
+                ],
+            ),
+            f"1 to {MAX_QUEUE_COMPUTE_ENVIRONMENTS} distinct compute",
+        ),
+        (
+            "general",
+            dict(priority=1, compute_environments=["r5-spot"]),
+            "unknown compute environments ['r5-spot']",
+        ),
+        (
+            "general",
+            dict(priority=1, compute_environments=["m5-spot", "graviton-spot"]),
+            "different architectures ['arm64', 'x86_64']",
+        ),
+    ],
+)
+def test_invalid_queue(name, queue, message):
+    loaded = profiles(m5={}, c5={}, graviton=GRAVITON)
+    with pytest.raises(ValueError) as e:
+        load_job_queues(dict(job_queues={name: queue}), loaded)
+    assert message in str(e.value)
+
+
+def test_single_architecture_queue():
+    job_queues = dict(
+        arm=dict(
+            priority=5, compute_environments=["graviton-spot", "graviton-on_demand"]
+        )
+    )
+    loaded = profiles(m5={}, graviton=GRAVITON)
+    assert load_job_queues(dict(job_queues=job_queues), loaded) == job_queues
+
+
+HEAD_FARGATE = dict(
+    enabled=True,
+    vcpus=2,
+    memory_mib=4096,
+    maxv_cpus=32,
+    platform_version="LATEST",
+    architecture="x86_64",
+    default_queue="on_demand-m5",
+)
+
+
+def test_head_fargate_default_queue():
+    queues = load_job_queues(dict(job_queues={}), profiles(m5={}))
+    images = dict(x86_64=["nextflow"])
+    config = load_head_fargate_config(dict(head_fargate=HEAD_FARGATE), images, queues)
+    assert config["default_queue"] == "on_demand-m5"
+
+
+@pytest.mark.parametrize("default_queue", [None, "on_demand-head", "spot-r5"])
+def test_head_fargate_default_queue_must_be_a_job_queue(default_queue):
+    queues = load_job_queues(dict(job_queues={}), profiles(m5={}))
+    head_fargate = {**HEAD_FARGATE, "default_queue": default_queue}
+    if default_queue is None:
+        del head_fargate["default_queue"]
+    with pytest.raises(ValueError, match="default_queue must be one of the job"):
+        load_head_fargate_config(
+            dict(head_fargate=head_fargate), dict(x86_64=["nextflow"]), queues
+        )
@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+
+import pytest
+from aws_cdk import core
+
+from aws_gatk_stack.compute_profiles import HEAD_QUEUE_NAME
+from aws_gatk_stack.compute_substack import NfCompute
+from aws_gatk_stack.docker_substack import DockerStack
+from aws_gatk_stack.iam_substack import IamStack
+from aws_gatk_stack.storage_substack import StorageStack
+from aws_gatk_stack.vpc_substack import VpcStack
+
+ROOT = Path(__file__).parent.parent
+ACCOUNT = "123456789012"
+REGION = "us-east-1"
+
+
+def synth_compute_stack(outdir: Path, **overrides) -> dict:
+    """
+    Synthesize the compute stack offline, wired as in app.py
+    :param outdir: the cloud assembly directory
+    :param overrides: sections of props.json to replace
+    :return: the resources of the compute stack template
+    """
+    props = {**json.loads((ROOT / "props.json").read_text()), **overrides}
+    for bucket in ("work_bucket", "data_bucket", "ref_bucket"):
+        props[bucket] = {**props[bucket], "Name": f"nf-test-{bucket.replace('_', '-')}"}
+    app = core.App(
+        outdir=str(outdir),
+        context={
+            "offline": "true",
+            f"availability-zones:account={ACCOUNT}:region={REGION}": [
+                f"{REGION}{x}" for x in "abc"
+            ],
+        },
+    )
+    stack = core.Stack(
+        app, "nf-gatk", env=core.Environment(account=ACCOUNT, region=REGION)
+    )
+    vpc = VpcStack(stack, "vpc-stack", props=props)
+    docker = DockerStack(stack, "docker-stack", props=props)
+    storage = StorageStack(
+        stack,
+        "storage-stack",
+        vpc=vpc.vpc,
+        compute_subnets=vpc.compute_subnets,
+        props=props,
+    )
+    iam = IamStack(
+        stack,
+        "iam-stack",
+        work_bucket=storage.work_bucket,
+        data_bucket=storage.data_bucket,
+        express_bucket=storage.express_bucket,
+    )
+    NfCompute(
+        stack,
+        "compute-stack",
+        vpc=vpc.vpc,
+        compute_subnets=vpc.compute_subnets,
+        props=props,
+        security_group=storage.nf_batch_security_group,
+        nf_batch_role=iam.nf_batch_role,
+        nf_spotfleet_role=iam.nf_spotfleet_role,
+        nf_batch_instance_role=iam.nf_batch_instance_role,
+        nf_execution_role=iam.nf_execution_role,
+        nf_instance_profile=iam.nf_instance_profile,
+        container_images=docker.container_images,
+        image_uris=docker.image_uris,
+        work_bucket=storage.work_bucket,
+        ref_bucket=storage.ref_bucket,
+        work_dir=storage.work_dir,
+        work_dir_availability_zone=storage.work_dir_availability_zone,
+        fsx_file_system=storage.fsx_file_system,
+        efs_file_system=storage.efs_file_system,
+    )
+    assembly = app.synth()
+    (template,) = Path(assembly.directory).glob("*computestack*.template.json")
+    return json.loads(template.read_text())["Resources"]
+
+
+def head_environment(resources: dict) -> dict:
+    (jobdef,) = [
+        x
+        for x in resources.values()
+        if x["Type"] == "AWS::Batch::JobDefinition"
+        and x["Properties"]["JobDefinitionName"]
+        == f"Nf{HEAD_QUEUE_NAME.replace('-', '')}Job"
+    ]
+    environment = jobdef["Properties"]["ContainerProperties"]["Environment"]
+    return {x["Name"]: x["Value"] for x in environment}
+
+
+def queue_ref(resources: dict, name: str) -> dict:
+    (logical_id,) = [
+        k
+        for k, v in resources.items()
+        if v["Type"] == "AWS::Batch::JobQueue"
+        and v["Properties"]["JobQueueName"] == f"Nf{name.replace('-', '')}Queue"
+    ]
+    return {"Ref": logical_id}
+
+
+def test_ec2_head_sends_tasks_to_the_head_queue(tmp_path):
+    resources = synth_compute_stack(tmp_path)
+    environment = head_environment(resources)
+    assert environment["NF_JOB_QUEUE"] == queue_ref(resources, HEAD_QUEUE_NAME)
+
+
+@pytest.mark.parametrize("default_queue", ["on_demand-m5", "spot-r5"])
+def test_fargate_head_sends_tasks_to_an_ec2_queue(tmp_path, default_queue):
+    props = json.loads((ROOT / "props.json").read_text())
+    head_fargate = {**props["head_fargate"], "enabled": True}
+    head_fargate["default_queue"] = default_queue
+    resources = synth_compute_stack(tmp_path, head_fargate=head_fargate)
+
+    environment = head_environment(resources)
+    assert environment["NF_JOB_QUEUE"] == queue_ref(resources, default_queue)
+    # the head queue only has the Fargate compute environment
+    assert environment["NF_JOB_QUEUE"] != queue_ref(resources, HEAD_QUEUE_NAME)
+
+
+def test_retry_rules_end_with_a_catch_all_exit(tmp_path):
+    props = json.loads((ROOT / "props.json").read_text())
+    reasons = props["retry_strategy"]["retry_on_status_reasons"]
+    resources = synth_compute_stack(tmp_path)
+
+    jobdefs = [
+        x["Properties"]
+        for x in resources.values()
+        if x["Type"] == "AWS::Batch::JobDefinition"
+    ]
+    for jobdef in jobdefs:
+        rules = jobdef["RetryStrategy"]["EvaluateOnExit"]
+        assert rules == [dict(OnStatusReason=x, Action="RETRY") for x in reasons] + [
+            dict(OnReason="*", Action="EXIT")
+        ]
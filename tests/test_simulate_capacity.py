@@ -0,0 +1,234 @@
+import argparse
+import json
+from pathlib import Path
+
+import pytest
+
+from tools.simulate_capacity import (
+    Simulation,
+    build_jobs,
+    expand_instance_types,
+    queue_name,
+    strip_logical_id,
+)
+
+WORKLOAD = Path(__file__).parent.parent / "tools" / "workloads" / "gatk_germline.json"
+ARGS = argparse.Namespace(
+    boot_minutes=4,
+    idle_minutes=10,
+    spot_price_ratio=0.35,
+    spot_interruption_rate=0.0,
+    seed=0,
+)
+
+
+def topology(spot=True):
+    return dict(
+        compute_environments=dict(
+            m5nfenv=dict(
+                name="m5nfenv",
+                spot=spot,
+                maxv_cpus=256,
+                instance_types=expand_instance_types(["m5"]),
+            ),
+            r5nfenv=dict(
+                name="r5nfenv",
+                spot=spot,
+                maxv_cpus=256,
+                instance_types=expand_instance_types(["r5"]),
+            ),
+        ),
+        job_queues={
+            "Nfspotm5Queue": dict(priority=1, compute_environments=["m5nfenv"]),
+            "Nfspotr5Queue": dict(priority=1, compute_environments=["r5nfenv"]),
+            "Nfon_demandr5Queue": dict(priority=100, compute_environments=["r5nfenv"]),
+        },
+        job_definitions=dict(
+            NfBwaMemJob=dict(vcpus=16, memory_mib=32000),
+            NfMarkDuplicatesJob=dict(vcpus=2, memory_mib=14000),
+            NfBaseRecalibratorJob=dict(vcpus=1, memory_mib=6000),
+            NfHaplotypeCallerJob=dict(vcpus=2, memory_mib=7000),
+            NfGenotypeGvcfsJob=dict(vcpus=4, memory_mib=30000),
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "instance_types, expected",
+    [
+        (["m5.large"], [("m5.large", 2, 7782, 0.096)]),
+        (["c6g.xlarge"], [("c6g.xlarge", 4, 7782, 0.136)]),
+        (
+            ["r5.2xlarge", "r5.large"],
+            [("r5.large", 2, 15564, 0.126), ("r5.2xlarge", 8, 62259, 0.504)],
+        ),
+        (["m5.large", "m5.large"], [("m5.large", 2, 7782, 0.096)]),
+        # AMD and Graviton families cost less than their Intel counterparts
+        (["m5a.large"], [("m5a.large", 2, 7782, 0.0864)]),
+        (["m6a.xlarge"], [("m6a.xlarge", 4, 15564, 0.1728)]),
+        (["m7g.xlarge"], [("m7g.xlarge", 4, 15564, 0.1536)]),
+        (["r6i.2xlarge"], [("r6i.2xlarge", 8, 62259, 0.504)]),
+        (["i3.large"], [("i3.large", 2, 14835, 0.156)]),
+        (["m6i.32xlarge"], [("m6i.32xlarge", 128, 498073, 6.144)]),
+    ],
+)
+def test_expand_instance_types(instance_types, expected):
+    expanded = [
+        (x["name"], x["vcpus"], x["memory_mib"], round(x["price"], 4))
+        for x in expand_instance_types(instance_types)
+    ]
+    assert expanded == expected
+
+
+@pytest.mark.parametrize(
+    "instance_types, count, first, last",
+    [
+        (["m5"], 11, "m5.medium", "m5.24xlarge"),
+        (["optimal"], 33, "c5.medium", "r5.24xlarge"),
+        # the same size is ordered by price
+        (["r5", "c5"], 22, "c5.medium", "r5.24xlarge"),
+    ],
+)
+def test_expand_families(instance_types, count, first, last):
+    expanded = expand_instance_types(instance_types)
+    assert len(expanded) == count
+    assert (expanded[0]["name"], expanded[-1]["name"]) == (first, last)
+
+
+@pytest.mark.parametrize(
+    "instance_type, message",
+    [
+        ("p3.2xlarge", "unknown instance family p3"),
+        ("a1.large", "unknown instance family a1"),
+        ("m5.metal", "unknown instance size metal"),
+        ("t3.nano", "unknown instance size nano"),
+    ],
+)
+def test_expand_unknown_instance_type(instance_type, message):
+    with pytest.raises(ValueError, match=message):
+        expand_instance_types([instance_type])
+
+
+@pytest.mark.parametrize(
+    "logical_id, expected",
+    [
+        ("m5nfspotenv1A2B3C4D", "m5nfspotenv"),
+        ("Nfspotm5Queue", "Nfspotm5Queue"),
+    ],
+)
+def test_strip_logical_id(logical_id, expected):
+    assert strip_logical_id(logical_id) == expected
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("spot-m5", "Nfspotm5Queue"),
+        ("on_demand-r5", "Nfon_demandr5Queue"),
+        ("Nfspotr5Queue", "Nfspotr5Queue"),
+    ],
+)
+def test_queue_name(name, expected):
+    assert queue_name(name, topology()["job_queues"]) == expected
+
+
+def test_unknown_queue_name():
+    with pytest.raises(ValueError, match="unknown queue spot-c5"):
+        queue_name("spot-c5", topology()["job_queues"])
+
+
+def test_build_jobs_of_the_germline_workload():
+    workload = json.loads(WORKLOAD.read_text())
+    workload["samples"] = 2
+    jobs = build_jobs(workload, topology())
+
+    # 4 + 1 + 16 + 24 jobs per sample, and 50 for the cohort
+    assert len(jobs) == 2 * 45 + 50
+    by_task = {}
+    for index, job in enumerate(jobs):
+        by_task.setdefault(job["task"], []).append(index)
+
+    bwa_mem = jobs[by_task["bwa-mem"][0]]
+    assert (bwa_mem["queue"], bwa_mem["vcpus"], bwa_mem["after"]) == (
+        "Nfspotm5Queue",
+        16,
+        [],
+    )
+    # mark-duplicates waits for the bwa-mem shards of its own sample only
+    assert jobs[by_task["mark-duplicates"][0]]["after"] == by_task["bwa-mem"][:4]
+    assert jobs[by_task["mark-duplicates"][1]]["after"] == by_task["bwa-mem"][4:]
+    # the cohort task waits for every haplotype-caller shard of every sample
+    joint = jobs[by_task["genotype-gvcfs"][0]]
+    assert joint["queue"] == "Nfon_demandr5Queue"
+    assert joint["after"] == by_task["haplotype-caller"]
+
+
+def test_build_jobs_checks_the_task_order():
+    workload = dict(
+        samples=1,
+        tasks=[
+            dict(name="call", queue="spot-m5", vcpus=2, memory_mib=4000, minutes=1),
+            dict(name="align", queue="spot-m5", vcpus=2, memory_mib=4000, minutes=1),
+        ],
+    )
+    workload["tasks"][0]["after"] = ["align"]
+    with pytest.raises(ValueError, match="call: align must be listed before"):
+        build_jobs(workload, topology())
+
+
+def test_simulate_one_job():
+    workload = dict(
+        samples=1,
+        tasks=[
+            dict(name="call", queue="spot-m5", vcpus=2, memory_mib=7000, minutes=60)
+        ],
+    )
+    jobs = build_jobs(workload, topology(spot=False))
+    report = Simulation(topology(spot=False), jobs, ARGS).run()
+
+    # one m5.large, booted for 4 minutes, running for an hour and idle for 10
+    hours = 1 + 14 / 60
+    assert report["instances"] == 1
+    assert report["makespan_hours"] == pytest.approx(1 + 4 / 60)
+    assert report["queue_wait_minutes"]["max"] == pytest.approx(4)
+    assert report["instance_hours"] == dict(m5nfenv=pytest.approx(hours))
+    assert report["utilization"] == pytest.approx(1 / hours)
+    assert report["cost"] == pytest.approx(hours * 0.096)
+
+
+def test_simulate_the_germline_workload():
+    workload = json.loads(WORKLOAD.read_text())
+    workload["samples"] = 2
+    jobs = build_jobs(workload, topology())
+    report = Simulation(topology(), jobs, ARGS).run()
+
+    assert report["jobs"] == 140
+    assert report["spot_interruptions"] == 0
+    # at least the critical path of a sample followed by the cohort task
+    critical_path = (120 + 60 + 20 + 45 + 90) / 60
+    assert report["makespan_hours"] >= critical_path
+    assert 0 < report["utilization"] <= 1
+
+
+def test_simulate_a_job_that_fits_no_instance():
+    workload = dict(
+        samples=1,
+        tasks=[
+            dict(name="call", queue="spot-m5", vcpus=2, memory_mib=10 ** 6, minutes=1)
+        ],
+    )
+    jobs = build_jobs(workload, topology())
+    with pytest.raises(ValueError, match="call: no instance type of its queue fits"):
+        Simulation(topology(), jobs, ARGS)
+
+
+def test_simulate_spot_interruptions():
+    workload = json.loads(WORKLOAD.read_text())
+    workload["samples"] = 2
+    args = argparse.Namespace(**dict(vars(ARGS), spot_interruption_rate=0.5))
+    report = Simulation(topology(), build_jobs(workload, topology()), args).run()
+
+    # every job finishes, the interrupted ones after a retry
+    assert report["jobs"] == 140
+    assert report["spot_interruptions"] > 0
+    assert report["retried_jobs"] > 0
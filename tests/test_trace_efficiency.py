@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+from tools.trace_efficiency import (
+    ROOT,
+    job_definition_name,
+    parse_duration,
+    parse_memory,
+    parse_number,
+    read_traces,
+    summarize,
+)
+
+FIELDS = [
+    "process",
+    "status",
+    "container",
+    "cpus",
+    "memory",
+    "submit",
+    "start",
+    "realtime",
+    "%cpu",
+    "peak_rss",
+]
+# a raw trace: durations in ms, memory in bytes
+TRACE = [
+    ["BWA_MEM", "COMPLETED", "job-definition://NfBwaMemJob:3", "16"]
+    + ["31457280000", "1000", "61000", "3600000", "1200.0", "8589934592"],
+    ["BWA_MEM", "COMPLETED", "job-definition://NfBwaMemJob:3", "16"]
+    + ["31457280000", "2000", "32000", "1800000", "800.0", "4294967296"],
+    ["BWA_MEM", "FAILED", "job-definition://NfBwaMemJob:3", "16"]
+    + ["31457280000", "3000", "4000", "10", "1.0", "1024"],
+    ["CALL", "CACHED", "broadinstitute/gatk:4.1.9.0", "2"]
+    + ["-", "-", "-", "-", "-", "-"],
+]
+
+
+@pytest.fixture
+def trace(tmp_path):
+    path = tmp_path / "trace.txt"
+    lines = ["\t".join(FIELDS)] + ["\t".join(x) for x in TRACE]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("42", 42.0),
+        (" 42 ", 42.0),
+        ("98.5%", 98.5),
+        ("1200.0", 1200.0),
+        ("-", None),
+        ("", None),
+        ("n/a", None),
+    ],
+)
+def test_parse_number(value, expected):
+    assert parse_number(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("8589934592", 8 * 1024 ** 3),
+        ("100 B", 100),
+        ("512 KB", 512 * 1024),
+        ("1.5 GB", 1.5 * 1024 ** 3),
+        ("30000MB", 30000 * 1024 ** 2),
+        ("2 TB", 2 * 1024 ** 4),
+        ("-", None),
+        ("1.5 GiB", None),
+    ],
+)
+def test_parse_memory(value, expected):
+    assert parse_memory(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("3600000", 3600000),
+        ("250ms", 250),
+        ("1.5s", 1500),
+        ("1h 2m 3s", 3723000),
+        ("2m 30s", 150000),
+        ("1d 1h", 25 * 3600 * 1000),
+        ("-", None),
+    ],
+)
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("bwa-mem", "NfBwaMemJob"),
+        ("haplotype_caller", "NfHaplotypeCallerJob"),
+        ("gatk", "NfGatkJob"),
+    ],
+)
+def test_job_definition_name(name, expected):
+    assert job_definition_name(name) == expected
+
+
+def test_read_traces(trace):
+    tasks = list(read_traces([str(trace)]))
+    assert [x["status"] for x in tasks] == [
+        "COMPLETED",
+        "COMPLETED",
+        "FAILED",
+        "CACHED",
+    ]
+    assert tasks[0]["%cpu"] == "1200.0"
+
+
+def test_summarize(trace):
+    summary = summarize(list(read_traces([str(trace)])), headroom=1.2)
+    assert list(summary) == ["BWA_MEM", "CALL"]
+
+    # the failed task is left out
+    bwa_mem = summary["BWA_MEM"]
+    assert bwa_mem["tasks"] == 2
+    assert bwa_mem["job_definition"] == "NfBwaMemJob"
+    assert bwa_mem["realtime_seconds"] == dict(mean=2700, p95=3600)
+    assert bwa_mem["queue_wait_seconds"] == dict(mean=45, p95=60)
+    assert bwa_mem["wait_share"] == pytest.approx(45 / 2745)
+    # 12 and 8 of 16 cpus, 8 and 4 GiB of 30000 MiB
+    assert bwa_mem["cpu_efficiency"] == pytest.approx(0.625)
+    assert bwa_mem["memory_efficiency"] == pytest.approx(6144 / 30000)
+    # 1.2 times the p95 of 12 cpus and 8192 MiB, in steps of 256 MiB
+    assert bwa_mem["recommended"] == dict(vcpus=15, memory_mib=9984)
+
+    # the current resources come from the job profile in props.json
+    props = json.loads((ROOT / "props.json").read_text())
+    profile = props["job_profiles"]["bwa-mem"]
+    assert bwa_mem["current"] == dict(
+        vcpus=profile["vcpus"], memory_mib=profile["memory_mib"]
+    )
+
+
+def test_summarize_missing_values(trace):
+    call = summarize(list(read_traces([str(trace)])), headroom=1.2)["CALL"]
+    assert call["job_definition"] is None
+    assert call["queue_wait_seconds"] == dict(mean=0, p95=0)
+    assert call["wait_share"] == 0
+    assert call["memory_efficiency"] is None
+    assert call["current"] == dict(vcpus=2, memory_mib=None)
+    assert call["recommended"] == dict(vcpus=1, memory_mib=256)
@@ -0,0 +1,212 @@
+import importlib.util
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from aws_gatk_stack.compute_profiles import (
+    load_compute_profiles,
+    load_warm_capacity_config,
+)
+
+# lambda is a keyword, so the handler is loaded from its path
+INDEX = Path(__file__).parent.parent / "lambda" / "warm_capacity" / "index.py"
+spec = importlib.util.spec_from_file_location("warm_capacity_index", INDEX)
+index = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(index)
+
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI"]
+ENVIRONMENT = dict(
+    arn="arn:aws:batch:us-east-1:123456789012:compute-environment/m5-spot",
+    queues=["arn:aws:batch:us-east-1:123456789012:job-queue/spot-m5"],
+    baseline=0,
+    minv_cpus=64,
+    windows=[dict(days=WEEKDAYS, start_hour=8, end_hour=18)],
+    runnable_jobs=10,
+    hold_minutes=30,
+)
+
+
+def utc(value: str) -> datetime:
+    # 2026-10-19 is a Monday
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def decide(now: datetime, runnable=0, warm_until=0, minv_cpus=0, **settings):
+    environments = dict(ce={**ENVIRONMENT, **settings})
+    state = dict(
+        ce=dict(minv_cpus=minv_cpus, runnable_jobs=runnable, warm_until=warm_until)
+    )
+    return index.plan(environments, state, now)["ce"]
+
+
+@pytest.mark.parametrize(
+    "now, reason, minv_cpus",
+    [
+        ("2026-10-19T09:00", "window", 64),
+        ("2026-10-19T08:00", "window", 64),
+        ("2026-10-23T17:59", "window", 64),
+        ("2026-10-19T07:59", "baseline", 0),
+        # the end hour is not part of the window
+        ("2026-10-19T18:00", "baseline", 0),
+        ("2026-10-25T10:00", "baseline", 0),
+    ],
+)
+def test_window(now, reason, minv_cpus):
+    decision = decide(utc(now))
+    assert (decision["reason"], decision["minv_cpus"]) == (reason, minv_cpus)
+    assert decision["warm_until"] == 0
+
+
+@pytest.mark.parametrize(
+    "now, expected",
+    [("2026-10-19T08:15", False), ("2026-10-19T08:30", True)],
+)
+def test_window_fraction_of_an_hour(now, expected):
+    windows = [dict(days=["MON"], start_hour=8.5, end_hour=9)]
+    assert index.in_window(windows, utc(now)) == expected
+
+
+@pytest.mark.parametrize(
+    "runnable, reason, minv_cpus, hold",
+    [
+        (10, "queue depth", 64, True),
+        (250, "queue depth", 64, True),
+        (9, "baseline", 0, False),
+    ],
+)
+def test_queue_depth(runnable, reason, minv_cpus, hold):
+    now = utc("2026-10-19T20:00")
+    decision = decide(now, runnable=runnable)
+    assert (decision["reason"], decision["minv_cpus"]) == (reason, minv_cpus)
+    assert decision["warm_until"] == (now.timestamp() + 30 * 60 if hold else 0)
+
+
+def test_queue_depth_in_a_window_extends_the_hold():
+    now = utc("2026-10-19T17:50")
+    decision = decide(now, runnable=10)
+    assert decision["reason"] == "window"
+    assert decision["warm_until"] == now.timestamp() + 30 * 60
+
+
+def test_queue_depth_without_a_threshold():
+    # runnable_jobs 0 only warms the environment in its windows
+    decision = decide(utc("2026-10-19T20:00"), runnable=1000, runnable_jobs=0)
+    assert (decision["reason"], decision["minv_cpus"]) == ("baseline", 0)
+    assert decision["warm_until"] == 0
+
+
+@pytest.mark.parametrize(
+    "remaining, reason, minv_cpus",
+    [(60, "hold", 64), (1, "hold", 64), (0, "baseline", 0), (-60, "baseline", 0)],
+)
+def test_hold(remaining, reason, minv_cpus):
+    now = utc("2026-10-19T20:00")
+    warm_until = now.timestamp() + remaining
+    decision = decide(now, warm_until=warm_until, minv_cpus=64)
+    assert (decision["reason"], decision["minv_cpus"]) == (reason, minv_cpus)
+    # the hold is kept, not extended, once the queues are drained
+    assert decision["warm_until"] == warm_until
+    assert decision["current"] == 64
+
+
+def test_baseline_of_the_compute_profile():
+    decision = decide(utc("2026-10-19T20:00"), minv_cpus=64, baseline=8)
+    assert (decision["reason"], decision["minv_cpus"]) == ("baseline", 8)
+    assert decision["current"] == 64
+
+
+def test_plan_every_compute_environment():
+    now = utc("2026-10-19T20:00")
+    environments = dict(
+        warm=ENVIRONMENT, cold={**ENVIRONMENT, "windows": [], "baseline": 4}
+    )
+    state = dict(
+        warm=dict(minv_cpus=0, runnable_jobs=10, warm_until=0),
+        cold=dict(minv_cpus=4, runnable_jobs=0, warm_until=0),
+    )
+    decisions = index.plan(environments, state, now)
+    assert {k: v["minv_cpus"] for k, v in decisions.items()} == dict(warm=64, cold=4)
+
+
+PROFILES = load_compute_profiles(
+    dict(compute_profiles=dict(m5=dict(minv_cpus=0, maxv_cpus=256))),
+    dict(x86_64=["gatk"]),
+)
+WARM = {k: v for k, v in ENVIRONMENT.items() if k not in ("arn", "queues", "baseline")}
+
+
+def warm_capacity(**config):
+    config = dict(
+        dict(enabled=True, interval_minutes=5, compute_environments={"m5-spot": WARM}),
+        **config,
+    )
+    return load_warm_capacity_config(dict(warm_capacity=config), PROFILES)
+
+
+@pytest.mark.parametrize(
+    "warm",
+    [
+        WARM,
+        # windows, runnable_jobs and hold_minutes are optional
+        dict(minv_cpus=64),
+        dict(minv_cpus=64, windows=[]),
+    ],
+)
+def test_load_warm_capacity_config(warm):
+    config = warm_capacity(compute_environments={"m5-spot": warm})
+    assert config["compute_environments"]["m5-spot"] == warm
+
+
+@pytest.mark.parametrize(
+    "config, message",
+    [
+        (dict(interval_minutes=None), "interval_minutes must be a positive integer"),
+        (dict(compute_environments={"c5-spot": WARM}), "unknown compute environment"),
+    ],
+)
+def test_invalid_warm_capacity_config(config, message):
+    with pytest.raises(ValueError, match=message):
+        warm_capacity(**config)
+
+
+@pytest.mark.parametrize("key", ["interval_minutes", "compute_environments"])
+def test_warm_capacity_config_missing_keys(key):
+    config = dict(enabled=True, interval_minutes=5, compute_environments={})
+    del config[key]
+    with pytest.raises(ValueError) as e:
+        load_warm_capacity_config(dict(warm_capacity=config), PROFILES)
+    assert str(e.value) == f"warm_capacity: missing keys ['{key}']"
+
+
+@pytest.mark.parametrize(
+    "drop, settings, message",
+    [
+        ("minv_cpus", {}, "missing keys ['minv_cpus']"),
+        (None, dict(minv_cpus="64"), "minv_cpus must be an integer"),
+        (None, dict(minv_cpus=512), "minv_cpus must be above the profile's"),
+        (None, dict(windows=dict(days=WEEKDAYS)), "windows must be a list"),
+        (
+            None,
+            dict(windows=[dict(days=WEEKDAYS, start_hour=8)]),
+            "window 0 has unknown keys [], missing keys ['end_hour']",
+        ),
+        (
+            None,
+            dict(windows=[dict(start_hour=8, end_hour=18, hours=10)]),
+            "window 0 has unknown keys ['hours'], missing keys ['days']",
+        ),
+        (
+            None,
+            dict(windows=[dict(days=["MON"], start_hour=18, end_hour=8)]),
+            "0 <= start_hour < end_hour <= 24",
+        ),
+        (None, dict(hold_minutes=-1), "must not be negative"),
+    ],
+)
+def test_invalid_warm_compute_environment(drop, settings, message):
+    warm = {k: v for k, v in {**WARM, **settings}.items() if k != drop}
+    with pytest.raises(ValueError) as e:
+        warm_capacity(compute_environments={"m5-spot": warm})
+    assert str(e.value).startswith("warm_capacity m5-spot: ")
+    assert message in str(e.value)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Download the pinned AWS CLI bundles, for x86_64 and Graviton (aarch64) hosts, and
+the amazon-ebs-autoscale release that are shipped to the batch hosts as S3
+assets. The versions are read from the bootstrap section of props.json, and
+existing downloads are kept.
+
+usage: python tools/fetch_bootstrap_assets.py
+"""
+import io
+import json
+import shutil
+import tarfile
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+ASSET_DIR = ROOT / "launch_template" / "assets"
+
+AWSCLI_URL = "https://awscli.amazonaws.com/awscli-exe-linux-{machine}-{version}.zip"
+# the uname -m of the batch hosts
+AWSCLI_MACHINES = ("x86_64", "aarch64")
+EBS_AUTOSCALE_URL = (
+    "https://github.com/awslabs/amazon-ebs-autoscale/archive/refs/tags/{version}.tar.gz"
+)
+
+
+def fetch_awscli(version: str, machine: str) -> Path:
+    """
+    Download the AWS CLI v2 installer bundle
+    :param version: the AWS CLI version, e.g. 2.13.25
+    :param machine: the machine hardware name, x86_64 or aarch64
+    :return: the path of the zip file
+    """
+    path = ASSET_DIR / f"awscli-exe-linux-{machine}-{version}.zip"
+    if not path.exists():
+        print(f"downloading AWS CLI {version} for {machine}")
+        url = AWSCLI_URL.format(machine=machine, version=version)
+        with urllib.request.urlopen(url) as r:
+            path.write_bytes(r.read())
+    return path
+
+
+def fetch_ebs_autoscale(version: str) -> Path:
+    """
+    Download and unpack an amazon-ebs-autoscale release, dropping the top level
+    directory of the archive so install.sh sits at the root of the asset
+    :param version: the release tag, e.g. v2.4.7
+    :return: the path of the unpacked release
+    """
+    path = ASSET_DIR / f"amazon-ebs-autoscale-{version}"
+    if not path.exists():
+        print(f"downloading amazon-ebs-autoscale {version}")
+        with urllib.request.urlopen(EBS_AUTOSCALE_URL.format(version=version)) as r:
+            archive = tarfile.open(fileobj=io.BytesIO(r.read()), mode="r:gz")
+        tmp = ASSET_DIR / f".{path.name}"
+        archive.extractall(tmp)
+        shutil.move(str(next(tmp.iterdir())), str(path))
+        tmp.rmdir()
+    return path
+
+
+def main():
+    with open(ROOT / "props.json") as f:
+        props = json.load(f)["bootstrap"]
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)
+    for machine in AWSCLI_MACHINES:
+        print(fetch_awscli(props["awscli_version"], machine))
+    print(fetch_ebs_autoscale(props["ebs_autoscale_version"]))
+
+
+if __name__ == "__main__":
+    main()
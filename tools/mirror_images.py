@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Copy the upstream images that props.json marks as "mirror" into the ECR
+repositories created by the docker stack, instead of building them locally.
+Sources are pinned by digest, and images whose digest tag is already in ECR are
+skipped. Each architecture of an image is pulled with docker
+pull --platform, and tagged with the architecture unless it is x86_64, so the
+upstream image must be published for it. Run it after the first deploy, and
+whenever a source in the docker_images section changes.
+
+usage: AWS_DEFAULT_REGION=<region> python tools/mirror_images.py
+"""
+import base64
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import boto3
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aws_gatk_stack.compute_profiles import (  # noqa: E402
+    DOCKER_PLATFORMS,
+    MIRROR_REPOSITORY_PREFIX,
+    digest_tag,
+    load_docker_images,
+    mirror_tag,
+    parse_image_reference,
+)
+
+
+def image_exists(client, repository: str, tag: str) -> bool:
+    """
+    Check whether an ECR repository has an image with the given tag
+    :param client: the ECR client
+    :param repository: the name of the repository
+    :param tag: the image tag
+    :return: True when the tag exists
+    """
+    try:
+        client.describe_images(repositoryName=repository, imageIds=[{"imageTag": tag}])
+    except client.exceptions.ImageNotFoundException:
+        return False
+    return True
+
+
+def mirror_image(
+    client, registry: str, name: str, source: str, architecture: str
+) -> None:
+    """
+    Pull an upstream image for an architecture and push it to its mirror
+    repository, tagged with the upstream tag and with the digest
+    :param client: the ECR client
+    :param registry: the ECR registry host
+    :param name: the name of the image in props.json
+    :param source: the upstream image reference
+    :param architecture: the architecture to pull
+    :return:
+    """
+    repository = f"{MIRROR_REPOSITORY_PREFIX}/{name}"
+    reference = parse_image_reference(source)
+    tags = [reference["tag"], digest_tag(reference["digest"])]
+    tags = [mirror_tag(x, architecture) for x in tags]
+    if image_exists(client, repository, tags[-1]):
+        print(f"{name}: {source} is already mirrored for {architecture}")
+        return
+
+    print(f"{name}: mirroring {source} for {architecture}")
+    platform = DOCKER_PLATFORMS[architecture]
+    subprocess.run(["docker", "pull", "--platform", platform, source], check=True)
+    for tag in tags:
+        target = f"{registry}/{repository}:{tag}"
+        subprocess.run(["docker", "tag", source, target], check=True)
+        subprocess.run(["docker", "push", target], check=True)
+
+
+def main():
+    with open(ROOT / "props.json") as f:
+        images = load_docker_images(json.load(f))
+
+    client = boto3.client("ecr")
+    token = client.get_authorization_token()["authorizationData"][0]
+    registry = token["proxyEndpoint"].replace("https://", "")
+    password = base64.b64decode(token["authorizationToken"]).decode().split(":")[1]
+    subprocess.run(
+        ["docker", "login", "--username", "AWS", "--password-stdin", registry],
+        input=password.encode(),
+        check=True,
+    )
+
+    for name, image in images.items():
+        if image["mode"] == "mirror":
+            for architecture in image["architectures"]:
+                mirror_image(client, registry, name, image["source"], architecture)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Simulate how a workload is scheduled on the synthesized Batch topology, and
+report the makespan, queue wait, instance hours and cost of each topology.
+
+The compute environments, job queues and job definitions are read from one or
+more cloud assemblies, e.g. the cdk.out directories of synths with different
+props.json files. The workload is a per-sample task graph, see
+tools/workloads/gatk_germline.json:
+
+    {
+        "samples": 1000,
+        "tasks": [
+            {"name": "align", "queue": "spot-m5", "job_definition": "NfBwaMemJob",
+             "minutes": 90},
+            {"name": "call", "queue": "spot-m5", "vcpus": 2, "memory_mib": 7000,
+             "minutes": 30, "count": 24, "after": ["align"]},
+            {"name": "joint", "queue": "on_demand-r5", "minutes": 240,
+             "job_definition": "NfGenotypeGvcfsJob", "scope": "cohort",
+             "after": ["call"]}
+        ]
+    }
+
+Tasks run once per sample, `count` times in parallel (e.g. a scatter over
+intervals), after all shards of the tasks in `after`. Cohort tasks run once,
+after those tasks finished for every sample. The model is deliberately simple:
+jobs are dispatched by queue priority, then in submission order, to the first
+compute environment of their queue with room. An environment launches the
+cheapest instance type per vCPU that covers its backlog, instances take
+--boot-minutes to join and are terminated after --idle-minutes without jobs.
+Spot instances are reclaimed at --spot-interruption-rate per instance hour, and
+their jobs are retried from the start. The vCPUs, memory and price of an instance
+type are derived from its name, e.g. m6a.4xlarge has 16 vCPUs and the memory per
+vCPU of the m class, at the price of m6i less the AMD discount. Prices approximate
+on-demand Linux prices of us-east-1; spot costs --spot-price-ratio of on-demand.
+
+usage: python tools/simulate_capacity.py WORKLOAD ASSEMBLY [ASSEMBLY ...]
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import re
+import statistics
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# memory (GiB) per vCPU and on-demand price ($) per vCPU hour of each instance class,
+# as of its Intel families (c5, m6i, r7i) or of im4gn and is4gen. Other families are
+# priced relative to them, by the attributes after the generation
+INSTANCE_CLASSES = dict(
+    c=(2, 0.0425),
+    m=(4, 0.048),
+    r=(8, 0.063),
+    t=(4, 0.0416),
+    z=(8, 0.081),
+    i=(7.625, 0.078),
+    im=(4, 0.091),
+    x=(15.25, 0.104),
+    **{"is": (6, 0.144)},
+)
+# AMD (a) and Graviton (g) processors, instance store (d) and enhanced networking (n)
+ATTRIBUTE_PRICES = dict(a=0.9, g=0.8, d=1.15, n=1.25)
+# class, generation and attributes of a family, e.g. m5, m6a, r6i, i3en, im4gn, m7g
+FAMILY_PATTERN = re.compile(r"^(?P<cls>[a-z]+?)[0-9]+(?P<attributes>[a-z-]*)$")
+# medium, large, xlarge and <n>xlarge sizes, with 1, 2, 4 and 4n vCPUs
+SIZE_PATTERN = re.compile(r"^(medium|large|(?P<multiple>[0-9]*)xlarge)$")
+# sizes of a family given without one
+FAMILY_SIZES = (
+    ["medium", "large", "xlarge"]
+    + ["2xlarge", "4xlarge", "8xlarge", "9xlarge", "12xlarge"]
+    + ["16xlarge", "18xlarge", "24xlarge"]
+)
+# batch "optimal" picks from the current c, m and r families
+OPTIMAL_FAMILIES = ("c5", "m5", "r5")
+# share of the instance memory left for jobs after the OS and the ECS agent
+MEMORY_AVAILABLE = 0.95
+
+
+def family_shape(family: str) -> Tuple[float, float]:
+    """
+    Derive the memory and price per vCPU of an instance family from its name
+    :param family: the instance family, e.g. m6a
+    :return: the memory (GiB) and on-demand price ($) per vCPU hour
+    """
+    match = FAMILY_PATTERN.match(family)
+    if not match or match.group("cls") not in INSTANCE_CLASSES:
+        raise ValueError(f"unknown instance family {family}")
+    memory_per_vcpu, price_per_vcpu = INSTANCE_CLASSES[match.group("cls")]
+    for attribute in set(match.group("attributes")):
+        price_per_vcpu *= ATTRIBUTE_PRICES.get(attribute, 1)
+    return memory_per_vcpu, price_per_vcpu
+
+
+def size_vcpus(size: str) -> int:
+    """
+    Derive the vCPUs of an instance size from its name
+    :param size: the instance size, e.g. 4xlarge
+    :return: the number of vCPUs
+    """
+    match = SIZE_PATTERN.match(size)
+    if not match:
+        raise ValueError(f"unknown instance size {size}")
+    if size == "medium":
+        return 1
+    if size == "large":
+        return 2
+    return 4 * int(match.group("multiple") or 1)
+
+
+def expand_instance_types(instance_types: List[str]) -> List[Dict]:
+    """
+    Expand the instance types of a compute environment into their size and price.
+    Families without a size, and "optimal", stand for every size of the families
+    :param instance_types: the instance types, e.g. ["m5.large", "r5"]
+    :return: the instance types with their vcpus, memory_mib and price per hour
+    """
+    expanded = {}
+    for instance_type in instance_types:
+        family, _, size = instance_type.partition(".")
+        families = OPTIMAL_FAMILIES if family == "optimal" else [family]
+        sizes = {x: size_vcpus(x) for x in ([size] if size else FAMILY_SIZES)}
+        for family in families:
+            memory_per_vcpu, price_per_vcpu = family_shape(family)
+            for size, vcpus in sizes.items():
+                expanded[f"{family}.{size}"] = dict(
+                    name=f"{family}.{size}",
+                    vcpus=vcpus,
+                    memory_mib=int(vcpus * memory_per_vcpu * MEMORY_AVAILABLE * 1024),
+                    price=vcpus * price_per_vcpu,
+                )
+    return sorted(expanded.values(), key=lambda x: (x["vcpus"], x["price"]))
+
+
+def strip_logical_id(logical_id: str) -> str:
+    """
+    Drop the hash that CDK appends to logical ids, e.g. m5nfspotenv1A2B3C4D
+    :param logical_id: the logical id
+    :return: the readable part of the logical id
+    """
+    return re.sub(r"[0-9A-F]{8}$", "", logical_id)
+
+
+def load_topology(assembly: Path) -> Dict[str, Dict]:
+    """
+    Read the Batch resources of every template in a cloud assembly
+    :param assembly: the cloud assembly directory, e.g. cdk.out
+    :return: the compute_environments, job_queues and job_definitions by name
+    """
+    resources = {}
+    for template in sorted(assembly.glob("*.template.json")):
+        resources.update(json.loads(template.read_text()).get("Resources", {}))
+
+    topology = dict(compute_environments={}, job_queues={}, job_definitions={})
+    for logical_id, resource in resources.items():
+        properties = resource.get("Properties", {})
+        if resource["Type"] == "AWS::Batch::ComputeEnvironment":
+            compute = properties["ComputeResources"]
+            if compute["Type"] not in ("EC2", "SPOT"):
+                continue
+            topology["compute_environments"][logical_id] = dict(
+                name=strip_logical_id(logical_id),
+                spot=compute["Type"] == "SPOT",
+                maxv_cpus=compute["MaxvCpus"],
+                instance_types=expand_instance_types(compute["InstanceTypes"]),
+            )
+        elif resource["Type"] == "AWS::Batch::JobQueue":
+            order = sorted(
+                properties["ComputeEnvironmentOrder"], key=lambda x: x["Order"]
+            )
+            topology["job_queues"][properties["JobQueueName"]] = dict(
+                priority=properties["Priority"],
+                compute_environments=[x["ComputeEnvironment"]["Ref"] for x in order],
+            )
+        elif resource["Type"] == "AWS::Batch::JobDefinition":
+            container = properties.get("ContainerProperties", {})
+            topology["job_definitions"][properties["JobDefinitionName"]] = dict(
+                vcpus=container.get("Vcpus", 1),
+                memory_mib=container.get("Memory", 2048),
+            )
+    return topology
+
+
+def queue_name(name: str, queues: Dict[str, Dict]) -> str:
+    """
+    Find a queue by its name in props.json (e.g. spot-m5) or its Batch name
+    :param name: the queue name
+    :param queues: the job queues of the topology
+    :return: the Batch name of the queue
+    """
+    for candidate in (name, f"Nf{name.replace('-', '')}Queue"):
+        if candidate in queues:
+            return candidate
+    raise ValueError(f"unknown queue {name}, expected one of {sorted(queues)}")
+
+
+def build_jobs(workload: Dict, topology: Dict) -> List[Dict]:
+    """
+    Expand the task graph of the workload into jobs
+    :param workload: the workload description
+    :param topology: the topology the jobs are submitted to
+    :return: the jobs, each with the indexes of the jobs it depends on
+    """
+    tasks = {t["name"]: t for t in workload["tasks"]}
+    jobs = []
+    # indexes of the jobs of each task, per sample for sample tasks
+    task_jobs = {name: {} for name in tasks}
+
+    for task in workload["tasks"]:
+        for dependency in task.get("after", []):
+            if dependency not in task_jobs or not task_jobs[dependency]:
+                raise ValueError(f"{task['name']}: {dependency} must be listed before")
+        resources = dict(task)
+        if "job_definition" in task:
+            resources = {**topology["job_definitions"][task["job_definition"]], **task}
+        queue = queue_name(task["queue"], topology["job_queues"])
+
+        cohort = task.get("scope", "sample") == "cohort"
+        for sample in [None] if cohort else range(workload["samples"]):
+            after = []
+            for dependency in task.get("after", []):
+                for dependency_sample, indexes in task_jobs[dependency].items():
+                    if cohort or dependency_sample in (sample, None):
+                        after += indexes
+            indexes = []
+            for _ in range(task.get("count", 1)):
+                indexes.append(len(jobs))
+                jobs.append(
+                    dict(
+                        task=task["name"],
+                        queue=queue,
+                        vcpus=resources["vcpus"],
+                        memory_mib=resources["memory_mib"],
+                        minutes=task["minutes"],
+                        after=after,
+                    )
+                )
+            task_jobs[task["name"]][sample] = indexes
+    return jobs
+
+
+class Simulation:
+    """
+    Discrete event simulation of the Batch scheduler for one topology
+    """
+
+    def __init__(self, topology: Dict, jobs: List[Dict], args: argparse.Namespace):
+        self.topology = topology
+        self.jobs = [dict(job, attempts=0, ready=None, done=False) for job in jobs]
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.events = []
+        self.sequence = itertools.count()
+        self.now = 0.0
+        self.instances = []
+        self.live = {ce: [] for ce in topology["compute_environments"]}
+        # waiting jobs of each queue, grouped by their vcpus and memory
+        self.waiting = {name: {} for name in topology["job_queues"]}
+        self.backlog = {name: 0 for name in topology["job_queues"]}
+        self.dependents = {}
+        self.pending = [len(set(job["after"])) for job in self.jobs]
+        self.interruptions = 0
+        self.retries = 0
+
+        for index, job in enumerate(self.jobs):
+            for dependency in set(job["after"]):
+                self.dependents.setdefault(dependency, []).append(index)
+            for ce in topology["job_queues"][job["queue"]]["compute_environments"]:
+                types = topology["compute_environments"][ce]["instance_types"]
+                if any(self.fits(t, job) for t in types):
+                    break
+            else:
+                raise ValueError(f"{job['task']}: no instance type of its queue fits")
+
+    @staticmethod
+    def fits(capacity: Dict, job: Dict) -> bool:
+        return (
+            capacity["vcpus"] >= job["vcpus"]
+            and capacity["memory_mib"] >= job["memory_mib"]
+        )
+
+    def push(self, time: float, kind: str, payload) -> None:
+        heapq.heappush(self.events, (time, next(self.sequence), kind, payload))
+
+    def submit(self, index: int) -> None:
+        job = self.jobs[index]
+        if job["ready"] is None:
+            job["ready"] = self.now
+        shape = (job["vcpus"], job["memory_mib"])
+        self.waiting[job["queue"]].setdefault(shape, deque()).append(index)
+        self.backlog[job["queue"]] += job["vcpus"]
+
+    def launch(self, ce: str, instance_type: Dict) -> Dict:
+        instance = dict(
+            ce=ce,
+            type=instance_type,
+            spot=self.topology["compute_environments"][ce]["spot"],
+            launched=self.now,
+            joined=self.now + self.args.boot_minutes / 60,
+            terminated=None,
+            idle_since=None,
+            free=dict(instance_type),
+            jobs=set(),
+        )
+        self.instances.append(instance)
+        self.live[ce].append(instance)
+        self.push(instance["joined"], "join", instance)
+        if instance["spot"] and self.args.spot_interruption_rate > 0:
+            lifetime = self.random.expovariate(self.args.spot_interruption_rate)
+            self.push(self.now + lifetime, "interrupt", instance)
+        return instance
+
+    def terminate(self, instance: Dict) -> None:
+        instance["terminated"] = self.now
+        self.live[instance["ce"]].remove(instance)
+
+    def choose_instance_type(self, ce: str, job: Dict, backlog: int) -> Optional[Dict]:
+        environment = self.topology["compute_environments"][ce]
+        used = sum(i["type"]["vcpus"] for i in self.live[ce])
+        candidates = [
+            t
+            for t in environment["instance_types"]
+            if self.fits(t, job) and t["vcpus"] <= environment["maxv_cpus"] - used
+        ]
+        if not candidates:
+            return None
+        # the largest type that the backlog of the queue fills, at the lowest price
+        # per vCPU, or else the smallest type that fits the job
+        filled = [t for t in candidates if t["vcpus"] <= max(backlog, job["vcpus"])]
+        if not filled:
+            return candidates[0]
+        largest = max(t["vcpus"] for t in filled)
+        largest_types = [t for t in filled if t["vcpus"] == largest]
+        return min(largest_types, key=lambda t: t["price"])
+
+    def place(self, index: int) -> bool:
+        job = self.jobs[index]
+        for ce in self.topology["job_queues"][job["queue"]]["compute_environments"]:
+            running = [i for i in self.live[ce] if self.fits(i["free"], job)]
+            if running:
+                instance = min(running, key=lambda i: i["free"]["vcpus"])
+            else:
+                instance_type = self.choose_instance_type(
+                    ce, job, self.backlog[job["queue"]]
+                )
+                if instance_type is None:
+                    continue
+                instance = self.launch(ce, instance_type)
+
+            instance["free"]["vcpus"] -= job["vcpus"]
+            instance["free"]["memory_mib"] -= job["memory_mib"]
+            instance["jobs"].add(index)
+            instance["idle_since"] = None
+            job["instance"] = instance
+            job["start"] = max(self.now, instance["joined"])
+            job["finish"] = job["start"] + job["minutes"] / 60
+            self.backlog[job["queue"]] -= job["vcpus"]
+            self.push(job["finish"], "finish", (index, job["attempts"]))
+            return True
+        return False
+
+    def schedule(self) -> None:
+        queues = self.topology["job_queues"]
+        for name in sorted(queues, key=lambda x: -queues[x]["priority"]):
+            # jobs of the same shape are placed in submission order, and the first
+            # one that does not fit blocks the rest of its shape
+            shapes = self.waiting[name]
+            for shape in sorted(shapes, key=lambda x: shapes[x][0]):
+                while shapes[shape] and self.place(shapes[shape][0]):
+                    shapes[shape].popleft()
+                if not shapes[shape]:
+                    del shapes[shape]
+
+    def run(self) -> Dict:
+        for index, count in enumerate(self.pending):
+            if count == 0:
+                self.submit(index)
+        self.schedule()
+
+        while self.events:
+            self.now, _, kind, payload = heapq.heappop(self.events)
+            if kind == "finish":
+                index, attempt = payload
+                job = self.jobs[index]
+                if attempt != job["attempts"]:
+                    continue
+                job["done"] = True
+                self.release(job["instance"], index)
+                for dependent in self.dependents.get(index, []):
+                    self.pending[dependent] -= 1
+                    if self.pending[dependent] == 0:
+                        self.submit(dependent)
+            elif kind == "idle":
+                instance, since = payload
+                if instance["terminated"] is None and instance["idle_since"] == since:
+                    self.terminate(instance)
+            elif kind == "interrupt":
+                instance = payload
+                if instance["terminated"] is not None:
+                    continue
+                self.interruptions += 1
+                self.terminate(instance)
+                for index in instance["jobs"]:
+                    self.jobs[index]["attempts"] += 1
+                    self.retries += 1
+                    self.submit(index)
+                instance["jobs"] = set()
+            self.schedule()
+
+        unfinished = sum(1 for job in self.jobs if not job["done"])
+        if unfinished:
+            raise RuntimeError(f"{unfinished} jobs never finished")
+        return self.report()
+
+    def release(self, instance: Dict, index: int) -> None:
+        job = self.jobs[index]
+        instance["jobs"].discard(index)
+        instance["free"]["vcpus"] += job["vcpus"]
+        instance["free"]["memory_mib"] += job["memory_mib"]
+        if not instance["jobs"]:
+            instance["idle_since"] = self.now
+            idle_check = self.now + self.args.idle_minutes / 60
+            self.push(idle_check, "idle", (instance, self.now))
+
+    def report(self) -> Dict:
+        waits = sorted((job["start"] - job["ready"]) * 60 for job in self.jobs)
+        instance_hours = {}
+        cost = 0.0
+        vcpu_hours = 0.0
+        for instance in self.instances:
+            hours = instance["terminated"] - instance["launched"]
+            name = self.topology["compute_environments"][instance["ce"]]["name"]
+            instance_hours[name] = instance_hours.get(name, 0) + hours
+            ratio = self.args.spot_price_ratio if instance["spot"] else 1
+            cost += hours * instance["type"]["price"] * ratio
+            vcpu_hours += hours * instance["type"]["vcpus"]
+        job_vcpu_hours = sum(j["vcpus"] * j["minutes"] / 60 for j in self.jobs)
+        return dict(
+            jobs=len(self.jobs),
+            makespan_hours=max(job["finish"] for job in self.jobs),
+            queue_wait_minutes=dict(
+                mean=statistics.mean(waits),
+                p95=waits[math.ceil(0.95 * len(waits)) - 1],
+                max=waits[-1],
+            ),
+            instances=len(self.instances),
+            instance_hours=dict(sorted(instance_hours.items())),
+            utilization=job_vcpu_hours / vcpu_hours if vcpu_hours else 0,
+            spot_interruptions=self.interruptions,
+            retried_jobs=self.retries,
+            cost=cost,
+        )
+
+
+def print_report(name: str, report: Dict, verbose: bool) -> None:
+    wait = report["queue_wait_minutes"]
+    print(
+        f"{name}: makespan {report['makespan_hours']:.1f}h, "
+        f"queue wait mean {wait['mean']:.0f}m p95 {wait['p95']:.0f}m, "
+        f"{report['instances']} instances, "
+        f"{sum(report['instance_hours'].values()):,.0f} instance hours, "
+        f"utilization {report['utilization']:.0%}, "
+        f"{report['spot_interruptions']} interruptions "
+        f"({report['retried_jobs']} jobs retried), cost ${report['cost']:,.0f}"
+    )
+    if verbose:
+        for ce, hours in report["instance_hours"].items():
+            print(f"    {hours:>10,.1f}h  {ce}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("workload", type=Path, help="workload description (JSON)")
+    parser.add_argument("assemblies", type=Path, nargs="+", help="cdk.out directories")
+    parser.add_argument("--boot-minutes", type=float, default=4)
+    parser.add_argument("--idle-minutes", type=float, default=10)
+    parser.add_argument("--spot-price-ratio", type=float, default=0.35)
+    parser.add_argument("--spot-interruption-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    workload = json.loads(args.workload.read_text())
+    reports = {}
+    for assembly in args.assemblies:
+        topology = load_topology(assembly)
+        jobs = build_jobs(workload, topology)
+        reports[str(assembly)] = Simulation(topology, jobs, args).run()
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for name, report in reports.items():
+        print_report(name, report, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Time an offline synth of app.py and report the size of the template of every
+stack, including the nested stacks. Each run synthesizes into a fresh directory
+without credentials or network access, using placeholder account and region
+values unless they are given. Bootstrap assets that were not downloaded are
+replaced by placeholders, see NfCompute.create_bootstrap_assets.
+
+usage: python tools/synth_benchmark.py [--runs 3] [--account ID] [--region REGION]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).parent.parent
+
+
+def synth(outdir: str, context: Dict[str, str]) -> float:
+    """
+    Synthesize app.py into a directory, the same way the cdk cli runs the app
+    :param outdir: the cloud assembly directory
+    :param context: the CDK context values
+    :return: the wall time in seconds
+    """
+    env = dict(os.environ, CDK_OUTDIR=outdir, CDK_CONTEXT_JSON=json.dumps(context))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "app.py"], cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def template_sizes(outdir: str) -> Dict[str, int]:
+    """
+    Collect the size of the synthesized templates
+    :param outdir: the cloud assembly directory
+    :return: the size in bytes by template file name
+    """
+    return {
+        p.name: p.stat().st_size for p in sorted(Path(outdir).glob("*.template.json"))
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--account", default="123456789012")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    # committed context lookups, as the cdk cli would pass them to the app
+    context = {}
+    context_file = ROOT / "cdk.context.json"
+    if context_file.exists():
+        context.update(json.loads(context_file.read_text()))
+    context.update(offline="true", account=args.account, region=args.region)
+
+    times = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as outdir:
+            times.append(synth(outdir, context))
+            sizes = template_sizes(outdir)
+
+    report = dict(
+        runs=args.runs,
+        seconds=dict(min=min(times), median=statistics.median(times), max=max(times)),
+        templates=sizes,
+        total_bytes=sum(sizes.values()),
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        f"synth x{args.runs}: min {report['seconds']['min']:.2f}s "
+        f"median {report['seconds']['median']:.2f}s "
+        f"max {report['seconds']['max']:.2f}s"
+    )
+    for name, size in sizes.items():
+        print(f"{size:>10,}  {name}")
+    print(f"{report['total_bytes']:>10,}  total")
+
+
+if __name__ == "__main__":
+    main()
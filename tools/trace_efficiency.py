@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Aggregate the Nextflow traces of one or more runs into per-process CPU and memory
+efficiency, queue wait, and recommended vcpus/memory_mib for the job profiles in
+props.json.
+
+Traces are the trace.txt files uploaded by docker/nextflow.aws.sh to
+<NF_LOGSDIR>/runs/<guid>/. Arguments can be local trace files, or S3 prefixes
+that are searched for them, e.g. s3://<work bucket>/logs/runs/
+
+usage: python tools/trace_efficiency.py TRACE|s3://PREFIX [...] [--json]
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import re
+import statistics
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import boto3
+
+ROOT = Path(__file__).parent.parent
+
+MEMORY_UNITS = dict(B=1, KB=1024, MB=1024 ** 2, GB=1024 ** 3, TB=1024 ** 4)
+DURATION_UNITS = dict(ms=1, s=1000, m=60 * 1000, h=3600 * 1000, d=24 * 3600 * 1000)
+JOB_DEFINITION_PREFIX = "job-definition://"
+
+
+def parse_number(value: str) -> Optional[float]:
+    """
+    Parse a raw trace value, or a percentage such as 98.5%
+    :param value: the trace value, "-" when it is missing
+    :return: the number, or None
+    """
+    value = value.strip().rstrip("%")
+    if value in ("", "-"):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_memory(value: str) -> Optional[float]:
+    """
+    Parse a memory value of a raw trace (bytes) or a formatted one (e.g. 1.5 GB)
+    :param value: the trace value
+    :return: the number of bytes, or None
+    """
+    match = re.match(r"^([\d.]+)\s*([KMGT]?B)$", value.strip())
+    if match:
+        return float(match.group(1)) * MEMORY_UNITS[match.group(2)]
+    return parse_number(value)
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """
+    Parse a duration of a raw trace (ms) or a formatted one (e.g. 1h 2m 3s)
+    :param value: the trace value
+    :return: the number of milliseconds, or None
+    """
+    parts = re.findall(r"([\d.]+)(ms|s|m|h|d)", value.replace(" ", ""))
+    if parts:
+        return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+    return parse_number(value)
+
+
+def read_traces(sources: List[str]) -> Iterator[Dict[str, str]]:
+    """
+    Read the tasks of the trace files
+    :param sources: local trace files, or S3 prefixes containing trace.txt files
+    :return: the task records
+    """
+    for source in sources:
+        if source.startswith("s3://"):
+            s3 = boto3.client("s3")
+            bucket, _, prefix = source[len("s3://") :].partition("/")
+            paginator = s3.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for item in page.get("Contents", []):
+                    if item["Key"].endswith("/trace.txt"):
+                        body = s3.get_object(Bucket=bucket, Key=item["Key"])["Body"]
+                        text = body.read().decode()
+                        yield from csv.DictReader(io.StringIO(text), delimiter="\t")
+        else:
+            with open(source) as f:
+                yield from csv.DictReader(f, delimiter="\t")
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def job_definition_name(name: str) -> str:
+    """
+    The job definition name NfCompute gives a job profile, e.g. NfBwaMemJob
+    :param name: the name of the job profile
+    :return: the job definition name
+    """
+    camel_name = "".join(x.capitalize() for x in name.replace("_", "-").split("-"))
+    return f"Nf{camel_name}Job"
+
+
+def summarize(tasks: List[Dict[str, str]], headroom: float) -> Dict[str, Dict]:
+    """
+    Aggregate completed tasks by process
+    :param tasks: the task records of the traces
+    :param headroom: the factor applied to the p95 usage for the recommendations
+    :return: the summary of each process
+    """
+    processes = {}
+    for task in tasks:
+        if task.get("status") not in ("COMPLETED", "CACHED"):
+            continue
+        processes.setdefault(task["process"], []).append(task)
+
+    job_profiles = {}
+    props_file = ROOT / "props.json"
+    if props_file.exists():
+        props = json.loads(props_file.read_text())
+        job_profiles = {
+            job_definition_name(k): v for k, v in props.get("job_profiles", {}).items()
+        }
+
+    summary = {}
+    for process, records in sorted(processes.items()):
+        cpus = [parse_number(r.get("cpus", "-")) or 1 for r in records]
+        cpu_used = [(parse_number(r.get("%cpu", "-")) or 0) / 100 for r in records]
+        requested = [parse_memory(r.get("memory", "-")) for r in records]
+        peak_rss = [parse_memory(r.get("peak_rss", "-")) or 0 for r in records]
+        realtime = [parse_duration(r.get("realtime", "-")) or 0 for r in records]
+        waits = [
+            (parse_number(r["start"]) - parse_number(r["submit"])) / 1000
+            for r in records
+            if parse_number(r.get("start", "-")) and parse_number(r.get("submit", "-"))
+        ]
+
+        container = records[-1].get("container", "")
+        job_definition = None
+        if container.startswith(JOB_DEFINITION_PREFIX):
+            job_definition = container[len(JOB_DEFINITION_PREFIX) :].split(":")[0]
+        current = job_profiles.get(job_definition, {})
+        current_vcpus = current.get("vcpus", max(cpus))
+        current_memory = current.get("memory_mib")
+        if current_memory is None and all(requested):
+            current_memory = max(requested) / MEMORY_UNITS["MB"]
+
+        p95_cpu = percentile(cpu_used, 0.95)
+        p95_rss_mib = percentile(peak_rss, 0.95) / MEMORY_UNITS["MB"]
+        mean_realtime = statistics.mean(realtime) / 1000
+        mean_wait = statistics.mean(waits) if waits else 0
+        # share of the time from submission to completion spent waiting
+        total = mean_wait + mean_realtime
+        wait_share = mean_wait / total if total else 0
+        summary[process] = dict(
+            tasks=len(records),
+            job_definition=job_definition,
+            realtime_seconds=dict(
+                mean=mean_realtime, p95=percentile(realtime, 0.95) / 1000
+            ),
+            queue_wait_seconds=dict(
+                mean=mean_wait, p95=percentile(waits, 0.95) if waits else 0
+            ),
+            wait_share=wait_share,
+            cpu_efficiency=statistics.mean(u / c for u, c in zip(cpu_used, cpus)),
+            memory_efficiency=(
+                statistics.mean(p / m for p, m in zip(peak_rss, requested) if m)
+                if all(requested)
+                else None
+            ),
+            current=dict(vcpus=current_vcpus, memory_mib=current_memory),
+            recommended=dict(
+                vcpus=max(1, math.ceil(p95_cpu * headroom)),
+                # memory in steps of 256 MiB
+                memory_mib=max(256, math.ceil(p95_rss_mib * headroom / 256) * 256),
+            ),
+        )
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict]) -> None:
+    header = (
+        f"{'process':<32} {'tasks':>6} {'realtime':>9} {'wait':>9} {'wait%':>6} "
+        f"{'cpu eff':>8} {'mem eff':>8} {'vcpus':>9} {'memory_mib':>15}"
+    )
+    print(header)
+    for process, s in summary.items():
+        memory_efficiency = s["memory_efficiency"]
+        current, recommended = s["current"], s["recommended"]
+        current_memory = current["memory_mib"]
+        print(
+            f"{process[-32:]:<32} {s['tasks']:>6} "
+            f"{s['realtime_seconds']['mean']:>8.0f}s "
+            f"{s['queue_wait_seconds']['mean']:>8.0f}s "
+            f"{s['wait_share']:>6.0%} "
+            f"{s['cpu_efficiency']:>8.0%} "
+            f"{'-' if memory_efficiency is None else f'{memory_efficiency:.0%}':>8} "
+            f"{current['vcpus']:>4g}->{recommended['vcpus']:<3} "
+            f"{'-' if current_memory is None else f'{current_memory:.0f}':>7}"
+            f"->{recommended['memory_mib']:<6}"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="trace files or s3:// prefixes")
+    parser.add_argument(
+        "--headroom",
+        type=float,
+        default=1.2,
+        help="factor applied to the p95 cpu and memory usage (default 1.2)",
+    )
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args(argv)
+
+    summary = summarize(list(read_traces(args.sources)), args.headroom)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()